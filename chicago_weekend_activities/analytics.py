@@ -0,0 +1,379 @@
+# analytics.py — driver frequencies, trends, rankings and co-occurrence over extracted episodes
+import argparse
+import os
+from itertools import chain
+
+import numpy as np
+import pandas as pd
+
+from .storage import read_table, apply_types, enum_categorical, LIST_COLUMNS, CATEGORY_COLUMNS
+
+# List columns exploded into one (episode, value) row per item
+EXPLODED_COLUMNS = ['decision_factors', 'constraints', 'options_considered', 'drivers']
+
+# List columns of fixed labels (from normalize.py), kept as written
+LABEL_COLUMNS = ['drivers']
+
+# Free-text columns treated as categories after trimming and lowercasing
+TEXT_CATEGORY_COLUMNS = ['activity_type']
+
+# Time buckets derived from created_utc
+TIME_COLUMNS = ['week', 'month', 'season']
+
+SEASONS = ['winter', 'spring', 'summer', 'fall']
+_MONTH_SEASON = np.array([0, 0, 1, 1, 1, 2, 2, 2, 3, 3, 3, 0])  # Jan..Dec
+
+
+def _normalize_text(values):
+    """Trimmed, lowercased strings; empty ones become missing."""
+    normalized = pd.Series(values, dtype='string').str.strip().str.lower()
+    return normalized.mask(normalized == '')
+
+
+def _as_categorical(values):
+    codes, uniques = pd.factorize(values, sort=False)
+    return pd.Categorical.from_codes(codes, categories=pd.Index(uniques).astype(object))
+
+
+def explode_list_column(lists, normalize=True):
+    """
+    (episode position, categorical value) arrays for a column of lists
+    (Parquet gives arrays), dropping empty items; with normalize, values
+    are trimmed and lowercased so "Weather" and "weather " count together.
+    """
+    lists = [value if isinstance(value, (list, np.ndarray)) else [] for value in lists]
+    lengths = np.fromiter((len(value) for value in lists), dtype=np.int64, count=len(lists))
+    episode = np.repeat(np.arange(len(lists), dtype=np.int64), lengths)
+    values = pd.Series(list(chain.from_iterable(lists)), dtype='string')
+    values = _normalize_text(values) if normalize else values.mask(values == '')
+    keep = values.notna().to_numpy()
+    return pd.DataFrame({"episode": episode[keep],
+                         "value": _as_categorical(values[keep].astype(object).to_numpy())})
+
+
+class Episodes:
+    """
+    Extracted episodes loaded once into a typed, columnar form for fast
+    aggregation:
+
+    - `frame`: one row per episode, with categoricals for the enum columns
+      (`switch_type`, `emotional_tone`, `user_type`; values outside the
+      schema's enum are kept as extra categories), `activity_type` and
+      `subreddit`, plus `week`/`month`/`season` buckets of created_utc;
+    - `exploded[column]`: one (episode, value) row per item of the list
+      columns (`decision_factors`, `constraints`, `options_considered`,
+      and `drivers` once normalize.py has run).
+
+    Every query is a handful of numpy operations over integer category codes
+    (bincount, fancy indexing, one small matrix product), so they stay well
+    under a second on 100k+ episodes.
+    """
+
+    def __init__(self, df):
+        df = df.reset_index(drop=True)
+        if any(column in df.columns and df[column].map(lambda v: isinstance(v, str)).any()
+               for column in LIST_COLUMNS):
+            df = apply_types(df.copy())
+        self.exploded = {column: explode_list_column(df[column].tolist(),
+                                                     normalize=column not in LABEL_COLUMNS)
+                         for column in EXPLODED_COLUMNS if column in df.columns}
+
+        frame = df.drop(columns=[c for c in EXPLODED_COLUMNS if c in df.columns])
+        for column, categories in CATEGORY_COLUMNS.items():
+            if column in frame.columns and not isinstance(frame[column].dtype, pd.CategoricalDtype):
+                frame[column] = enum_categorical(frame[column], categories)
+        for column in TEXT_CATEGORY_COLUMNS:
+            if column in frame.columns:
+                frame[column] = _as_categorical(_normalize_text(frame[column]).astype(object).to_numpy())
+        if 'subreddit' in frame.columns:
+            frame['subreddit'] = frame['subreddit'].astype('category')
+        if 'created_utc' in frame.columns:
+            created = pd.to_datetime(frame['created_utc'], errors='coerce')
+            frame['created_utc'] = created
+            frame['week'] = created.dt.to_period('W').dt.start_time
+            frame['month'] = created.dt.to_period('M').dt.start_time
+            months = created.dt.month.fillna(1).astype(int).to_numpy() - 1
+            frame['season'] = pd.Categorical.from_codes(
+                np.where(created.isna(), -1, _MONTH_SEASON[months]), categories=SEASONS, ordered=True)
+        if 'score' in frame.columns:
+            frame['score'] = pd.to_numeric(frame['score'], errors='coerce').fillna(0)
+        self.frame = frame
+        self._codes = {}
+
+    @classmethod
+    def load(cls, path='weekend_activity_analysis.csv'):
+        """
+        Loads an analysis table (CSV or Parquet) by path or by name in data/.
+        """
+        if not os.path.isabs(path) and not os.path.exists(path):
+            script_dir = os.path.dirname(os.path.abspath(__file__))
+            path = os.path.join(script_dir, 'data', path)
+        return cls(read_table(path, typed=True))
+
+    def __len__(self):
+        return len(self.frame)
+
+    def _frame_codes(self, column):
+        """(integer codes with -1 for missing, level labels) of a frame column."""
+        if column not in self._codes:
+            values = self.frame[column]
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                codes, levels = values.cat.codes.to_numpy(), values.cat.categories
+            else:
+                codes, levels = pd.factorize(values, sort=True)
+            self._codes[column] = (np.asarray(codes, dtype=np.int64), pd.Index(levels))
+        return self._codes[column]
+
+    def _value_codes(self, column):
+        """(episode positions, value codes, levels) of an exploded or frame column."""
+        if column in self.exploded:
+            exploded = self.exploded[column]
+            return (exploded['episode'].to_numpy(), exploded['value'].cat.codes.to_numpy().astype(np.int64),
+                    exploded['value'].cat.categories)
+        codes, levels = self._frame_codes(column)
+        return np.arange(len(codes)), codes, levels
+
+    def score_weights(self):
+        """
+        Per-episode weight 1 + log1p(score): every episode counts, upvoted ones
+        more, without a single viral thread dominating.
+        """
+        return 1 + np.log1p(self.frame['score'].clip(lower=0).to_numpy(dtype=np.float64))
+
+    def counts(self, column='decision_factors', by=None, weights=None, top=None):
+        """
+        Episode counts (or summed per-episode `weights`) of each value of
+        `column`, as a Series, or a values x `by` table when grouped by a
+        frame column (subreddit, week, season, switch_type...). Rows are
+        ordered by total, and cut to the `top` most frequent if given.
+        """
+        episode, codes, levels = self._value_codes(column)
+        keep = codes >= 0
+        w = None if weights is None else np.asarray(weights, dtype=np.float64)[episode]
+        if by is None:
+            totals = np.bincount(codes[keep], weights=None if w is None else w[keep], minlength=len(levels))
+            result = pd.Series(totals, index=levels, name=column)
+            result = result[result > 0].sort_values(ascending=False, kind='stable')
+            return result.head(top) if top else result
+
+        if top:
+            # Only the top values get a row, so a long tail of rare free-text
+            # values never makes the values x groups table large
+            totals = np.bincount(codes[keep], weights=None if w is None else w[keep], minlength=len(levels))
+            chosen = np.argsort(-totals, kind='stable')[:top]
+            chosen = chosen[totals[chosen] > 0]
+            lookup = np.full(len(levels), -1, dtype=np.int64)
+            lookup[chosen] = np.arange(len(chosen))
+            codes = np.where(keep, lookup[codes.clip(min=0)], -1)
+            keep = codes >= 0
+            levels = levels[chosen]
+
+        by_codes, by_levels = self._frame_codes(by)
+        by_codes = by_codes[episode]
+        keep &= by_codes >= 0
+        flat = codes[keep] * len(by_levels) + by_codes[keep]
+        table = np.bincount(flat, weights=None if w is None else w[keep],
+                            minlength=len(levels) * len(by_levels)).reshape(len(levels), len(by_levels))
+        order = np.argsort(-table.sum(axis=1), kind='stable')
+        order = order[table.sum(axis=1)[order] > 0]
+        result = pd.DataFrame(table[order], index=levels[order], columns=by_levels)
+        result.index.name, result.columns.name = column, by
+        return result
+
+    def driver_counts(self, by='subreddit', column='decision_factors', top=20, share=False):
+        """
+        Most frequent decision factors per subreddit (or other frame column);
+        with share=True as a fraction of that column's episodes.
+        """
+        table = self.counts(column, by=by, top=top)
+        if share:
+            codes, levels = self._frame_codes(by)
+            totals = np.bincount(codes[codes >= 0], minlength=len(levels))
+            table = table / np.maximum(totals, 1)
+        return table
+
+    def trend(self, column='decision_factors', freq='week', top=10, share=False):
+        """
+        Counts of the `top` values per week, month or season (rows), with
+        share=True as a fraction of the period's episodes.
+        """
+        if freq not in TIME_COLUMNS:
+            raise ValueError(f"freq must be one of {TIME_COLUMNS}")
+        table = self.counts(column, by=freq, top=top).T
+        if share:
+            codes, levels = self._frame_codes(freq)
+            totals = np.bincount(codes[codes >= 0], minlength=len(levels))
+            table = table.div(np.maximum(totals, 1), axis=0)
+        return table
+
+    def ranking(self, column='decision_factors', top=20):
+        """
+        Values ranked by score-weighted frequency (see score_weights), with
+        plain counts, mean score and share of episodes alongside.
+        """
+        episode, codes, levels = self._value_codes(column)
+        keep = codes >= 0
+        episode, codes = episode[keep], codes[keep]
+        weighted = np.bincount(codes, weights=self.score_weights()[episode], minlength=len(levels))
+        plain = np.bincount(codes, minlength=len(levels))
+        scores = np.bincount(codes, weights=self.frame['score'].to_numpy(dtype=np.float64)[episode],
+                             minlength=len(levels))
+        order = np.argsort(-weighted, kind='stable')
+        order = order[plain[order] > 0][:top]
+        result = pd.DataFrame({
+            "weighted": weighted[order],
+            "episodes": plain[order],
+            "mean_score": scores[order] / np.maximum(plain[order], 1),
+            "share": plain[order] / max(len(self), 1),
+        }, index=levels[order])
+        result.index.name = column
+        return result
+
+    def cooccurrence(self, column='decision_factors', top=25, other=None, normalize=None):
+        """
+        How often values appear in the same episode, over the `top` most
+        frequent values: a symmetric matrix for one column (diagonal = counts),
+        or `column` x `other` for two (e.g. decision_factors x switch_type).
+        normalize='jaccard' divides by the episodes containing either value,
+        'lift' by what independence would predict.
+        """
+        def incidence(name):
+            episode, codes, levels = self._value_codes(name)
+            keep_levels = self.counts(name, top=top).index
+            positions = levels.get_indexer(keep_levels)
+            lookup = np.full(len(levels), -1, dtype=np.int64)
+            lookup[positions] = np.arange(len(positions))
+            columns = np.where(codes >= 0, lookup[codes.clip(min=0)], -1)
+            keep = columns >= 0
+            matrix = np.zeros((len(self), len(positions)), dtype=np.float32)
+            matrix[episode[keep], columns[keep]] = 1
+            return matrix, keep_levels
+
+        left, left_levels = incidence(column)
+        right, right_levels = (left, left_levels) if other is None else incidence(other)
+        together = left.T @ right
+        if normalize == 'jaccard':
+            either = left.sum(axis=0)[:, None] + right.sum(axis=0)[None, :] - together
+            together = together / np.maximum(either, 1)
+        elif normalize == 'lift':
+            expected = left.sum(axis=0)[:, None] * right.sum(axis=0)[None, :] / max(len(self), 1)
+            together = together / np.maximum(expected, 1e-9)
+        elif normalize is not None:
+            raise ValueError("normalize must be None, 'jaccard' or 'lift'")
+        result = pd.DataFrame(together if normalize else together.astype(np.int64),
+                              index=left_levels, columns=right_levels)
+        result.index.name, result.columns.name = column, other or column
+        return result
+
+    def top_pairs(self, column='decision_factors', top=25, n=10):
+        """
+        The `n` most frequent pairs of distinct values within episodes.
+        """
+        matrix = self.cooccurrence(column, top=top)
+        values = matrix.to_numpy()
+        i, j = np.triu_indices_from(values, k=1)
+        order = np.argsort(-values[i, j], kind='stable')[:n]
+        return pd.DataFrame({"first": matrix.index[i[order]], "second": matrix.columns[j[order]],
+                             "episodes": values[i[order], j[order]]})
+
+
+def _require_matplotlib():
+    try:
+        import matplotlib
+    except ImportError:
+        raise ImportError("Plots need matplotlib: pip install matplotlib seaborn")
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    return plt
+
+
+def plot_trend(table, path, title=None):
+    """
+    Line chart of a trend() table, saved to path. Needs matplotlib.
+    """
+    plt = _require_matplotlib()
+
+    fig, ax = plt.subplots(figsize=(12, 6))
+    table.plot(ax=ax)
+    ax.set_title(title or f"{table.columns.name} by {table.index.name}")
+    ax.legend(loc='center left', bbox_to_anchor=(1, 0.5), fontsize='small')
+    fig.tight_layout()
+    fig.savefig(path, dpi=120)
+    plt.close(fig)
+    return path
+
+
+def plot_heatmap(table, path, title=None):
+    """
+    Heatmap of a counts/cooccurrence table, saved to path. Uses seaborn when
+    installed, plain matplotlib otherwise.
+    """
+    plt = _require_matplotlib()
+
+    fig, ax = plt.subplots(figsize=(max(6, 0.5 * table.shape[1] + 4), max(5, 0.35 * table.shape[0] + 2)))
+    try:
+        import seaborn as sns
+        sns.heatmap(table, ax=ax, cmap='viridis')
+    except ImportError:
+        image = ax.imshow(table.to_numpy(), aspect='auto', cmap='viridis')
+        ax.set_xticks(range(table.shape[1]), table.columns, rotation=90)
+        ax.set_yticks(range(table.shape[0]), table.index)
+        fig.colorbar(image, ax=ax)
+    ax.set_title(title or f"{table.index.name} x {table.columns.name}")
+    fig.tight_layout()
+    fig.savefig(path, dpi=120)
+    plt.close(fig)
+    return path
+
+
+def write_plots(episodes, plot_dir, top=15):
+    """
+    Saves the standard charts (weekly and seasonal driver trends, drivers by
+    subreddit, driver co-occurrence, switch types by season) to plot_dir.
+    """
+    os.makedirs(plot_dir, exist_ok=True)
+    return [
+        plot_trend(episodes.trend(freq='month', top=top // 2), os.path.join(plot_dir, 'drivers_by_month.png')),
+        plot_heatmap(episodes.trend(freq='season', top=top, share=True).T,
+                     os.path.join(plot_dir, 'drivers_by_season.png')),
+        plot_heatmap(episodes.driver_counts(top=top, share=True), os.path.join(plot_dir, 'drivers_by_subreddit.png')),
+        plot_heatmap(episodes.cooccurrence(top=top, normalize='jaccard'),
+                     os.path.join(plot_dir, 'driver_cooccurrence.png')),
+        plot_heatmap(episodes.counts('switch_type', by='season'), os.path.join(plot_dir, 'switch_types_by_season.png')),
+    ]
+
+
+def print_report(episodes, top=10):
+    with pd.option_context('display.width', 160, 'display.max_columns', 20, 'display.precision', 2):
+        print(f"📊 {len(episodes):,} episodes, "
+              f"{len(episodes.exploded.get('decision_factors', [])):,} decision factor mentions\n")
+        print("Top decision factors (score-weighted):")
+        print(episodes.ranking(top=top), '\n')
+        print("Decision factors by subreddit:")
+        print(episodes.driver_counts(top=top), '\n')
+        if 'drivers' in episodes.exploded:
+            print("Situational drivers (see normalize.py) by season:")
+            print(episodes.trend('drivers', freq='season', share=True), '\n')
+        for column in ('switch_type', 'emotional_tone', 'user_type'):
+            if column in episodes.frame.columns:
+                print(f"{column} by season:")
+                print(episodes.counts(column, by='season'), '\n')
+        print("Decision factors by month:")
+        print(episodes.trend(freq='month', top=5).tail(12), '\n')
+        print("Most frequent decision factor pairs:")
+        print(episodes.top_pairs(n=top).to_string(index=False))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarize extracted decision episodes")
+    parser.add_argument('path', nargs='?', default='weekend_activity_analysis.csv',
+                        help="Analysis table (CSV or Parquet), by path or name in data/")
+    parser.add_argument('--top', type=int, default=10, help="Values shown per table")
+    parser.add_argument('--plots', default=None, metavar='DIR', help="Also save charts to this directory")
+    args = parser.parse_args()
+
+    episodes = Episodes.load(args.path)
+    print_report(episodes, args.top)
+    if args.plots:
+        for path in write_plots(episodes, args.plots):
+            print(f"Saved {path}")
@@ -1,137 +1,637 @@
 # analyze.py (multi-decision compatible with wrapped schema and input truncation)
-import pandas as pd
 import json
-from openai import OpenAI
+import argparse
 from datetime import datetime
-from .prompts import system_message, drivers_schema
+from functools import lru_cache
+from .prompts import (system_message, drivers_schema, packed_system_message, packed_drivers_schema,
+                      repair_system_message)
+from .engine import RateLimiter, call_with_retry, run_ordered
+from .cache import ResponseCache, cache_key, cached_prompts_version, default_cache_path
+from .journal import AnalysisJournal
+from .storage import read_table, count_table_rows
+from .packing import pack_rows, build_packed_request, split_packed_response
+from .threads import ThreadStore, ContextBuilder
+from .tokens import trim_to_tokens, prompt_tokens, UsageMeter
+from .metrics import RunMetrics, Progress
+from .clients import openai_client
+from .validate import ResponseValidator, ResponseLog, InvalidResponse, parse_arguments, responses_path
 import os
 import sys
 from pathlib import Path
-from dotenv import load_dotenv
 
-# Load environment variables
-load_dotenv()
+MODEL = "gpt-4o-2024-08-06"
+# Budget for one row's user message; longer rows are trimmed at sentence boundaries
+MAX_INPUT_TOKENS = 2500
 
-# Initialize OpenAI client
-client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+# Rows read, analyzed and committed to the journal per batch
+BATCH_SIZE = 100
 
-MAX_INPUT_CHARS = 10000
+# Rough size of a function-call response, used to budget tokens per minute
+ESTIMATED_COMPLETION_TOKENS = 500
 
-def analyze_data(max_rows=None, data_file='reddit_data.csv'):
+# Function name of repair requests (see build_repair_request)
+REPAIR_FUNCTION = "repair_response"
+
+# Validation errors listed in one repair request
+MAX_REPAIR_ERRORS = 10
+
+
+def build_content(row, context=None):
+    """
+    Builds the user message for a row, trimmed to MAX_INPUT_TOKENS.
+    With a threads.ContextBuilder, posts are sent with their title and
+    comments under their parent post's title and text; without one, rows
+    are only prefixed with the URL they came from.
+    Returns None for rows without usable text.
+    """
+    if context is not None:
+        return context.build(row)
+
+    content = row['text']
+    if not isinstance(content, str) or not content.strip():
+        return None
+
+    # For comments, include context about it being a comment
+    if row['is_comment']:
+        content = f"[Comment in response to post: {row['parent_url']}]\n\n{content}"
+    else:
+        content = f"[Original post: {row['url']}]\n\n{content}"
+
+    return trim_to_tokens(content, MAX_INPUT_TOKENS)
+
+
+def load_thread_context(path):
+    """
+    Indexes the posts in the table at `path` and returns a ContextBuilder
+    over them for build_content. The index is kept for the process while
+    the file is unchanged, so a shard worker (see shards.py) building
+    content for many row ranges of one table indexes it once.
+    """
+    return _thread_context(path, os.path.getmtime(path))
+
+
+@lru_cache(maxsize=2)
+def _thread_context(path, mtime):
+    store = ThreadStore.from_table(path)
+    print(f"Thread context: indexed {len(store):,} posts from {os.path.basename(path)}")
+    return ContextBuilder(store, max_tokens=MAX_INPUT_TOKENS)
+
+
+def estimate_tokens(content, system=system_message, schema=drivers_schema):
+    """
+    Estimate of the tokens one request consumes (prompt, counted locally,
+    plus a typical completion), used for tokens-per-minute rate limiting.
+    """
+    return prompt_tokens(system, schema, content) + ESTIMATED_COMPLETION_TOKENS
+
+
+def build_request(content):
+    """
+    Keyword arguments for one chat.completions request analyzing `content`.
+    Shared by the interactive and Batch API paths so both send the same prompt.
+    """
+    return {
+        "model": MODEL,
+        "messages": [
+            {"role": "system", "content": system_message},
+            {"role": "user", "content": content}
+        ],
+        "response_format": {"type": "json_object"},
+        "functions": [{
+            "name": "analyze_weekend_activities",
+            "description": "Analyze weekend activity decisions and their influencing factors",
+            "parameters": drivers_schema
+        }],
+        "function_call": {"name": "analyze_weekend_activities"}
+    }
+
+
+def build_repair_request(fragment, errors, schema, source=None):
+    """
+    Keyword arguments for a short follow-up request that asks the model to
+    fix one invalid fragment (an episode, or a whole unusable response)
+    against `schema`, given its validation errors. The source text is only
+    sent when needed to fill in missing fields.
+    """
+    lines = ["Validation errors:"] + [f"- {error}" for error in errors[:MAX_REPAIR_ERRORS]]
+    lines += ["", "JSON:", trim_to_tokens(fragment, MAX_INPUT_TOKENS)]
+    if source is not None:
+        lines += ["", "Source text:", source]
+    return {
+        "model": MODEL,
+        "messages": [
+            {"role": "system", "content": repair_system_message},
+            {"role": "user", "content": '\n'.join(lines)}
+        ],
+        "functions": [{
+            "name": REPAIR_FUNCTION,
+            "description": "Return the corrected JSON",
+            "parameters": schema
+        }],
+        "function_call": {"name": REPAIR_FUNCTION}
+    }
+
+
+def request_analysis(content, api_client=None, request=None, usage=None, on_raw=None):
+    """
+    Sends one piece of content to the model and returns the parsed
+    function-call arguments ({"episodes": [...]}).
+    Uses the shared clients.openai_client() unless `api_client` is given, and
+    build_request(content) unless a prepared `request` is given.
+    The response's token usage is added to `usage` (a tokens.UsageMeter),
+    and the raw arguments are passed to on_raw before parsing. Arguments
+    that aren't JSON raise validate.InvalidResponse.
+    """
+    api_client = api_client or openai_client()
+    response = api_client.chat.completions.create(**(request or build_request(content)))
+    if usage is not None:
+        usage.record(response.usage)
+
+    arguments = response.choices[0].message.function_call.arguments
+    if on_raw is not None:
+        on_raw(arguments)
+    return parse_arguments(arguments)
+
+
+def attach_metadata(episodes, row):
+    """
+    Adds the source row's metadata to each extracted episode in place.
+    """
+    for ep in episodes:
+        # Add metadata about the source
+        ep["source_id"] = row['post_id']
+        ep["source_type"] = "comment" if row['is_comment'] else "post"
+        ep["subreddit"] = row['subreddit']
+        ep["source_url"] = row['url']
+        ep["score"] = row['score']
+        ep["created_utc"] = row['created_utc']
+
+        # Add parent post information for comments
+        if row['is_comment']:
+            ep["parent_post_url"] = row['parent_url']
+
+        # Add the original content for reference
+        ep["original_content"] = row['text']
+    return episodes
+
+
+def print_qualified(episodes, row, index, qualified_count, log=print):
+    """
+    Prints a qualified row and its extracted episodes (as one message to `log`).
+    """
+    lines = [f"\n✅ Found qualified entry #{qualified_count} in row {index+1}:",
+             f"Source: {'Comment' if row['is_comment'] else 'Post'} in r/{row['subreddit']}",
+             f"URL: {row['url']}"]
+    if row['is_comment']:
+        lines.append(f"Parent Post: {row['parent_url']}")
+    lines.append("\nExtracted Episodes:")
+
+    for i, ep in enumerate(episodes, 1):
+        lines.append(f"\nEpisode {i}:")
+        lines.append(f"Context: {ep['decision_context']}")
+        lines.append(f"Activity Type: {ep['activity_type']}")
+        lines.append(f"Final Choice: {ep['final_choice']}")
+        lines.append(f"Decision Factors: {', '.join(ep['decision_factors'])}")
+        if 'reasoning' in ep:
+            lines.append(f"Reasoning: {ep['reasoning']}")
+        lines.append("-" * 50)
+    log('\n'.join(lines))
+
+
+def iter_rows(data_path, max_rows=None, skip=None, chunksize=BATCH_SIZE, start=0):
+    """
+    Yields (index, row) pairs from the input table, reading it in chunks so
+    memory does not grow with the file. Rows before `start` and rows whose
+    post_id is accepted by `skip` are left out; max_rows counts from start.
+    """
+    seen = 0
+    offset = 0
+    for chunk in read_table(data_path, chunksize=chunksize):
+        # Number rows across chunks (Parquet batches each restart at 0)
+        chunk.index = range(offset, offset + len(chunk))
+        offset += len(chunk)
+        if offset <= start:
+            continue
+        if chunk.index[0] < start:
+            chunk = chunk.iloc[start - chunk.index[0]:]
+        for index, row in chunk.iterrows():
+            if max_rows is not None and seen >= max_rows:
+                return
+            seen += 1
+            if skip is not None and skip(row['post_id']):
+                continue
+            yield index, row
+
+
+def count_rows(data_path, max_rows=None, start=0):
+    """
+    Counts input rows (from `start`) without loading the table.
+    """
+    total = max(0, count_table_rows(data_path) - start)
+    return total if max_rows is None else min(total, max_rows)
+
+
+def record_run_metrics(metrics, usage, rows):
+    """
+    End-of-run gauges: throughput, cache hit rate and token usage.
+    """
+    elapsed = max(metrics.elapsed(), 1e-9)
+    metrics.set('rows_per_second', rows / elapsed)
+    metrics.set('episodes_per_second', metrics.total('episodes_total') / elapsed)
+    lookups = metrics.total('llm_cache_lookups_total')
+    if lookups:
+        metrics.set('llm_cache_hit_ratio', metrics.value('llm_cache_lookups_total', result='hit') / lookups)
+    summary = usage.summary()
+    for kind in ('prompt', 'cached_prompt', 'completion'):
+        metrics.set('llm_tokens', summary[f'{kind}_tokens'], kind=kind)
+    if summary['estimated_cost_usd'] is not None:
+        metrics.set('llm_estimated_cost_usd', summary['estimated_cost_usd'])
+
+
+def analyze_data(max_rows=None, data_file='reddit_data.csv', concurrency=1,
+                 requests_per_minute=None, tokens_per_minute=None, max_retries=5,
+                 client=None, use_cache=True, cache_path=None, resume=False, pack=False,
+                 output_file='weekend_activity_analysis.csv', prefilter=None,
+                 thread_context=True, threads_file=None, progress=False, metrics=None,
+                 start_row=0, limiter=None, skip_repeats=False):
     """
     Analyzes Reddit posts and comments about weekend activities in Chicago.
     Identifies decision-making patterns and factors influencing activity choices.
     Handles both posts and comments, maintaining their relationships.
+
+    Up to `concurrency` requests are kept in flight at once, optionally capped
+    by requests/tokens per minute. Rate-limit (429) and server (5xx) errors are
+    retried with jittered backoff. Results keep the original row order.
+
+    Responses are cached on disk by model + prompt + schema + content, so
+    re-running over rows that were already analyzed costs no API calls.
+
+    Input is read and committed in batches of BATCH_SIZE rows: episodes go to
+    an append-only journal and finished post_ids to a ledger after every batch,
+    and the CSV is rebuilt from the journal at the end. With resume=True rows
+    already in the ledger are skipped, so an interrupted run picks up where it
+    stopped.
+
+    With pack=True consecutive short rows share one request (see packing.py)
+    and the returned episodes are fanned back out to their rows.
+
+    A prefilter.Prefilter drops (or, in defer mode, postpones) rows that score
+    too low locally to be worth an API call.
+
+    Token usage and estimated cost of the run are written next to the
+    results as `<output>.usage.json`.
+
+    Every response is checked against the schema episode by episode (see
+    validate.py): valid episodes are kept, invalid ones are re-asked with a
+    short repair request, and only what still fails is dropped. Raw
+    responses are logged to `<output>.responses.jsonl` for re-parsing
+    offline.
+
+    With thread_context (the default) comments are sent under their parent
+    post's title and text, looked up in `threads_file` (the data file unless
+    given, e.g. the full scrape when analyzing a sample of it).
+
+    start_row skips the rows before it (max_rows then counts from there), so
+    a caller can analyze one range of the table; a RateLimiter passed as
+    `limiter` keeps its window across such calls. With skip_repeats=True a
+    row whose post_id already came up in the run (raw scrapes list a post
+    once per search term) is skipped rather than analyzed again. shards.py
+    runs workers this way.
+
+    Request latencies, retries and errors by type, cache hits, throughput
+    and time per stage go to `metrics` (a metrics.RunMetrics, created if not
+    given), written as `<output>.metrics.json` and `<output>.prom`. With
+    progress=True a live progress bar replaces the per-batch progress lines.
     """
     script_dir = os.path.dirname(os.path.abspath(__file__))
     data_path = os.path.join(script_dir, 'data', data_file)
+    output_path = os.path.join(script_dir, 'data', output_file)
 
-    df = pd.read_csv(data_path)
-    if max_rows is not None:
-        df = df.head(max_rows)
+    metrics = metrics or RunMetrics('analyze')
+    # Created here rather than on the first request, so a missing API key stops the run before any work
+    client = client or openai_client()
+    total_rows = count_rows(data_path, max_rows, start_row)
+    context = None
+    if thread_context:
+        with metrics.stage('load_context'):
+            context = load_thread_context(os.path.join(script_dir, 'data', threads_file) if threads_file else data_path)
 
-    all_results = []
-    qualified_count = 0
+    def content_for(row):
+        return build_content(row, context)
+
+    journal = AnalysisJournal(output_path, resume=resume)
+    if resume and journal.completed:
+        print(f"Resuming: {len(journal.completed):,} rows already analyzed will be skipped")
+
+    limiter = limiter or RateLimiter(requests_per_minute, tokens_per_minute)
+    usage = UsageMeter(MODEL)
+    cache = None
+    if use_cache:
+        cache = ResponseCache(cache_path or default_cache_path(),
+                              cached_prompts_version())
+        if cache.invalidated:
+            print(f"Prompts changed: dropped {cache.invalidated:,} stale cached responses")
+
+    bar = Progress(total_rows, label='Analyzing', enabled=progress)
+
+    validators = {'single': ResponseValidator(drivers_schema), 'packed': ResponseValidator(packed_drivers_schema)}
+    response_log = ResponseLog(responses_path(output_path))
+
+    def on_retry(error, attempt, delay):
+        metrics.inc('llm_retries_total', error=type(error).__name__)
+        bar.write(f"⚠️  {type(error).__name__} (attempt {attempt+1}/{max_retries}), retrying in {delay:.1f}s")
+
+    def api_call(request, kind, post_ids, log_kind=None):
+        """A rate-limited, retried API call; the raw response goes to the response log."""
+        def log(arguments):
+            response_log.write(log_kind or kind, post_ids, arguments)
+
+        def call():
+            with metrics.timer('rate_limit_wait_seconds'):
+                limiter.acquire(estimate_tokens(request['messages'][-1]['content'], request['messages'][0]['content'],
+                                                request['functions'][0]['parameters']))
+            metrics.inc('llm_requests_total', kind=kind)
+            with metrics.timer('llm_request_seconds', kind=kind):
+                return request_analysis(None, client, request, usage, on_raw=log)
 
-    print("Processing entries for weekend activity analysis...")
-    for index, row in df.iterrows():
-        print(f"Processing {index+1}/{len(df)}...")
         try:
-            # Prepare the content for analysis
-            content = row['text']
-            if pd.isna(content) or not content.strip():
-                continue
+            return call_with_retry(call, max_retries=max_retries, on_retry=on_retry)
+        except Exception as e:
+            metrics.inc('llm_errors_total', error=type(e).__name__)
+            raise
+
+    def repair_response(error, content, kind, post_ids):
+        """
+        Re-asks for a whole response that has no usable episode list (e.g.
+        arguments cut off mid-JSON). Raises if the repair fails too.
+        """
+        validator = validators[kind]
+        metrics.inc('llm_repairs_total', target='response')
+        request = build_repair_request(error.text, error.errors, validator.schema, source=content)
+        valid, invalid, _ = validator.check(api_call(request, 'repair', post_ids, log_kind=kind))
+        metrics.inc('episodes_dropped_total', len(invalid))
+        return {"episodes": valid}
 
-            # For comments, include context about it being a comment
-            if row['is_comment']:
-                content = f"[Comment in response to post: {row['parent_url']}]\n\n{content}"
+    def repair_episode(episode, errors, content, kind, post_ids):
+        """
+        Re-asks for one invalid episode, sending the source text only when
+        fields are missing. Returns the fixed episode, or None.
+        """
+        validator = validators[kind]
+        metrics.inc('llm_repairs_total', target='episode')
+        missing = any('missing required field' in error for error in errors)
+        request = build_repair_request(json.dumps(episode), errors, validator.episode_schema,
+                                       source=content if missing else None)
+        row_index = episode.get('row_index') if isinstance(episode, dict) else None
+        if kind == 'packed':
+            ids = [post_ids[row_index]] if isinstance(row_index, int) and 0 <= row_index < len(post_ids) else []
+        else:
+            ids = post_ids
+        try:
+            episodes = validator.episodes_of(api_call(request, 'repair', ids, log_kind='repair'))
+        except Exception:
+            return None
+        if not episodes or len(episodes) != 1 or not isinstance(episodes[0], dict):
+            return None
+        repaired = episodes[0]
+        if row_index is not None:
+            repaired.setdefault('row_index', row_index)
+        return None if validator.check_episode(repaired) else repaired
+
+    def validated(parsed, content, kind, post_ids):
+        """
+        Keeps the valid episodes of a response, repairs the invalid ones
+        with short follow-up requests and drops what can't be repaired.
+        """
+        validator = validators[kind]
+        try:
+            valid, invalid, fixed = validator.check(parsed)
+        except InvalidResponse as e:
+            return repair_response(e, content, kind, post_ids)
+        metrics.inc('episode_fields_fixed_total', fixed)
+        for episode, errors in invalid:
+            repaired = repair_episode(episode, errors, content, kind, post_ids)
+            if repaired is None:
+                metrics.inc('episodes_dropped_total')
+                bar.write(f"⚠️  Dropped an invalid episode: {'; '.join(errors[:3])}")
             else:
-                content = f"[Original post: {row['url']}]\n\n{content}"
-
-            truncated_content = content[:MAX_INPUT_CHARS]
-
-            input_messages = [
-                {"role": "system", "content": system_message},
-                {"role": "user", "content": truncated_content}
-            ]
-
-            response = client.chat.completions.create(
-                model="gpt-4o-2024-08-06",
-                messages=input_messages,
-                response_format={"type": "json_object"},
-                functions=[{
-                    "name": "analyze_weekend_activities",
-                    "description": "Analyze weekend activity decisions and their influencing factors",
-                    "parameters": drivers_schema
-                }],
-                function_call={"name": "analyze_weekend_activities"}
-            )
-
-            parsed = json.loads(response.choices[0].message.function_call.arguments)
-            episodes = parsed.get("episodes", [])
-            
-            if episodes:
-                qualified_count += 1
-                print(f"\n✅ Found qualified entry #{qualified_count} in row {index+1}:")
-                print(f"Source: {'Comment' if row['is_comment'] else 'Post'} in r/{row['subreddit']}")
-                print(f"URL: {row['url']}")
-                if row['is_comment']:
-                    print(f"Parent Post: {row['parent_url']}")
-                print("\nExtracted Episodes:")
-                
-                for i, ep in enumerate(episodes, 1):
-                    print(f"\nEpisode {i}:")
-                    print(f"Context: {ep['decision_context']}")
-                    print(f"Activity Type: {ep['activity_type']}")
-                    print(f"Final Choice: {ep['final_choice']}")
-                    print(f"Decision Factors: {', '.join(ep['decision_factors'])}")
-                    if 'reasoning' in ep:
-                        print(f"Reasoning: {ep['reasoning']}")
-                    print("-" * 50)
-            
-            for ep in episodes:
-                # Add metadata about the source
-                ep["source_id"] = row['post_id']
-                ep["source_type"] = "comment" if row['is_comment'] else "post"
-                ep["subreddit"] = row['subreddit']
-                ep["source_url"] = row['url']
-                ep["score"] = row['score']
-                ep["created_utc"] = row['created_utc']
-                
-                # Add parent post information for comments
-                if row['is_comment']:
-                    ep["parent_post_url"] = row['parent_url']
-                
-                # Add the original content for reference
-                ep["original_content"] = row['text']
-                
-            all_results.extend(episodes)
+                metrics.inc('episodes_repaired_total')
+                valid.append(repaired)
+        return {"episodes": valid}
 
-        except Exception as e:
-            print(f"❌ Error on row {index+1}: {str(e)}")
-            continue
+    def cached_call(key_parts, content, request, kind, post_ids):
+        """
+        Cache lookup, then a rate-limited, retried API call on a miss; either
+        way the response is validated (and repaired) before it is used and cached.
+        """
+        parsed = None
+        if cache is not None:
+            key = cache_key(MODEL, *key_parts)
+            parsed = cache.get(key)
+            if parsed is not None:
+                metrics.inc('llm_cache_lookups_total', result='hit')
+                usage.record_cache_hit(prompt_tokens(key_parts[0], key_parts[1], content))
+                checked = validated(parsed, content, kind, post_ids)
+                if checked != parsed:
+                    cache.put(key, checked, replace=True)
+                return checked
+            metrics.inc('llm_cache_lookups_total', result='miss')
+
+        try:
+            parsed = api_call(request, kind, post_ids)
+        except InvalidResponse as e:
+            parsed = repair_response(e, content, kind, post_ids)
+        else:
+            parsed = validated(parsed, content, kind, post_ids)
+        if cache is not None:
+            cache.put(key, parsed)
+        return parsed
+
+    def analyze_unit(unit):
+        """Returns one parsed response (or None for empty rows) per (index, row, content) of the unit."""
+        contents = [content for _, _, content in unit]
+        post_ids = [row['post_id'] for _, row, _ in unit]
+        if len(unit) == 1:
+            if contents[0] is None:
+                return [None]
+            return [cached_call((system_message, drivers_schema, contents[0]),
+                                contents[0], build_request(contents[0]), 'single', post_ids)]
+
+        request = build_packed_request(contents, MODEL)
+        packed_content = request['messages'][-1]['content']
+        parsed = cached_call((packed_system_message, packed_drivers_schema, packed_content),
+                             packed_content, request, 'packed', post_ids)
+        return split_packed_response(parsed, len(unit))
+
+    qualified_count = 0
+    processed = 0
+    errors = 0
+    batch_rows = 0
+    batch_episodes = []
+    batch_ids = []
+
+    def commit_batch():
+        journal.commit(batch_episodes, batch_ids)
+        batch_episodes.clear()
+        batch_ids.clear()
+
+    print(f"Processing {total_rows:,} entries for weekend activity analysis...")
+    with metrics.stage('analyze'):
+        def make_rows():
+            seen = set()
+
+            def skip(post_id):
+                if resume and journal.is_done(post_id):
+                    return True
+                if skip_repeats:
+                    if post_id in seen:
+                        return True
+                    seen.add(post_id)
+                return False
+
+            return iter_rows(data_path, max_rows, skip=skip if resume or skip_repeats else None, start=start_row)
+
+        rows = prefilter.apply(make_rows) if prefilter is not None else make_rows()
+        if pack:
+            units = pack_rows(rows, content_for)
+        else:
+            units = ([(index, row, content_for(row))] for index, row in rows)
+        for unit, results in run_ordered(analyze_unit, units, concurrency):
+            if isinstance(results, Exception):
+                results = [results] * len(unit)
+
+            for (index, row, _), parsed in zip(unit, results):
+                try:
+                    if isinstance(parsed, Exception):
+                        raise parsed
 
-    if all_results:
-        output_df = pd.DataFrame(all_results)
-        output_path = os.path.join(script_dir, 'data', 'weekend_activity_analysis.csv')
-        output_df.to_csv(output_path, index=False)
-        print(f"\nAnalysis complete. Found {qualified_count} qualified entries with {len(output_df)} total episodes.")
+                    episodes = parsed.get("episodes", []) if parsed is not None else []
+
+                    if episodes:
+                        qualified_count += 1
+                        metrics.inc('rows_qualified_total')
+                        metrics.inc('episodes_total', len(episodes))
+                        print_qualified(episodes, row, index, qualified_count, log=bar.write)
+
+                    batch_episodes.extend(attach_metadata(episodes, row))
+                    batch_ids.append(row['post_id'])
+
+                except Exception as e:
+                    # Left out of the ledger so a resumed run retries it
+                    errors += 1
+                    metrics.inc('row_errors_total', error=type(e).__name__)
+                    bar.write(f"❌ Error on row {index+1}: {str(e)}")
+
+                processed += 1
+                batch_rows += 1
+                metrics.inc('rows_total')
+                bar.update(qualified=qualified_count, errors=errors)
+
+            if batch_rows >= BATCH_SIZE:
+                with metrics.stage('commit'):
+                    commit_batch()
+                batch_rows = 0
+                if not progress:
+                    print(f"Processed {processed:,}/{total_rows:,} rows "
+                          f"({processed / max(metrics.elapsed(), 1e-9):.1f} rows/s, {errors:,} errors)")
+
+        with metrics.stage('commit'):
+            commit_batch()
+    bar.close()
+
+    if cache is not None:
+        stats = cache.stats()
+        print(f"\nResponse cache: {stats['hits']:,} hits, {stats['misses']:,} misses "
+              f"({stats['hit_rate']:.0%} hit rate), {stats['entries']:,} entries")
+        cache.close()
+
+    response_log.close()
+    repairs = metrics.total('llm_repairs_total')
+    if repairs or metrics.total('episode_fields_fixed_total'):
+        print(f"\nValidation: {metrics.total('episode_fields_fixed_total'):,} fields fixed locally, "
+              f"{repairs:,} repair requests, {metrics.total('episodes_repaired_total'):,} episodes repaired, "
+              f"{metrics.total('episodes_dropped_total'):,} dropped")
+
+    if prefilter is not None:
+        seen = prefilter.kept + prefilter.rejected
+        if prefilter.mode == 'drop':
+            print(f"\nPrefilter skipped {prefilter.rejected:,} of {seen:,} rows (~{prefilter.rejected:,} API calls saved)")
+        else:
+            print(f"\nPrefilter deferred {prefilter.rejected:,} of {seen:,} rows to the end of the run")
+
+    print(f"\n{usage.report()}")
+    print(f"Usage written to {usage.write(output_path)}")
+
+    with metrics.stage('export'):
+        episode_count = journal.export()
+
+    record_run_metrics(metrics, usage, processed)
+    latency = metrics.report('llm_request_seconds')
+    if latency:
+        print(f"\n{latency}")
+    print(f"Metrics written to {metrics.write(output_path)}")
+    if episode_count:
+        print(f"\nAnalysis complete. Found {qualified_count} qualified entries in this run, "
+              f"{episode_count} total episodes.")
         print(f"Results exported to {output_path}")
-        return output_df
+        return read_table(output_path)
     else:
         print("\nNo qualifying entries extracted.")
         return None
 
 if __name__ == "__main__":
-    if len(sys.argv) > 1:
-        try:
-            max_rows = int(sys.argv[1])
-        except ValueError:
-            print("Invalid max_rows value. Using all rows.")
-            max_rows = None
-    else:
-        max_rows = None
+    parser = argparse.ArgumentParser(description="Analyze Reddit data for weekend activity decisions")
+    parser.add_argument('max_rows', nargs='?', type=int, default=None,
+                        help="Only analyze the first N rows")
+    parser.add_argument('--data-file', default='reddit_data.csv',
+                        help="Input CSV in the data directory")
+    parser.add_argument('--concurrency', type=int, default=1,
+                        help="Maximum number of API requests in flight")
+    parser.add_argument('--rpm', type=int, default=None,
+                        help="Requests-per-minute limit")
+    parser.add_argument('--tpm', type=int, default=None,
+                        help="Tokens-per-minute limit")
+    parser.add_argument('--max-retries', type=int, default=5,
+                        help="Retries for rate-limit and server errors")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="Always call the API, bypassing the response cache")
+    parser.add_argument('--resume', action='store_true',
+                        help="Skip rows completed by a previous, interrupted run")
+    parser.add_argument('--pack', action='store_true',
+                        help="Analyze several short rows per request")
+    parser.add_argument('--prefilter', choices=['drop', 'defer'], default=None,
+                        help="Skip (drop) or postpone (defer) rows the local prefilter scores too low")
+    parser.add_argument('--prefilter-threshold', type=float, default=None,
+                        help="Minimum prefilter score to send a row to the API")
+    parser.add_argument('--no-thread-context', action='store_true',
+                        help="Send comments with only their parent URL instead of the parent post")
+    parser.add_argument('--threads-file', default=None,
+                        help="Table to look parent posts up in (defaults to --data-file)")
+    parser.add_argument('--batch', action='store_true',
+                        help="Submit rows through the OpenAI Batch API instead of interactive requests")
+    parser.add_argument('--progress', action='store_true',
+                        help="Show a live progress bar instead of per-batch progress lines")
+    parser.add_argument('--poll-interval', type=float, default=60,
+                        help="Seconds between Batch API status checks (with --batch)")
+    args = parser.parse_args()
 
-    analyze_data(max_rows=max_rows)
+    if args.batch:
+        from .batch import run_batch_analysis
+        run_batch_analysis(max_rows=args.max_rows, data_file=args.data_file,
+                           poll_interval=args.poll_interval, use_cache=not args.no_cache,
+                           resume=args.resume, thread_context=not args.no_thread_context,
+                           threads_file=args.threads_file)
+        sys.exit(0)
 
+    prefilter = None
+    if args.prefilter:
+        from .prefilter import Prefilter, DEFAULT_THRESHOLD
+        threshold = args.prefilter_threshold if args.prefilter_threshold is not None else DEFAULT_THRESHOLD
+        prefilter = Prefilter(threshold=threshold, mode=args.prefilter)
 
+    analyze_data(max_rows=args.max_rows, data_file=args.data_file,
+                 concurrency=args.concurrency, requests_per_minute=args.rpm,
+                 tokens_per_minute=args.tpm, max_retries=args.max_retries,
+                 use_cache=not args.no_cache, resume=args.resume, pack=args.pack,
+                 prefilter=prefilter, thread_context=not args.no_thread_context,
+                 threads_file=args.threads_file, progress=args.progress)
@@ -0,0 +1,397 @@
+# batch.py — bulk analysis through the OpenAI Batch API
+import argparse
+import json
+import os
+import shutil
+import time
+import uuid
+
+from .analyze import (MODEL, build_content, build_request, attach_metadata, iter_rows,
+                      estimate_tokens, load_thread_context)
+from .clients import openai_client
+from .cache import ResponseCache, cache_key, cached_prompts_version, default_cache_path
+from .fakes import chat_completion_payload, fake_analysis
+from .journal import AnalysisJournal
+from .prompts import system_message, drivers_schema
+from .tokens import UsageMeter, prompt_tokens
+from .validate import ResponseValidator, InvalidResponse, parse_arguments
+
+# Batch API limits per input file
+MAX_REQUESTS_PER_FILE = 50000
+MAX_BYTES_PER_FILE = 190 * 1024 * 1024
+
+TERMINAL_STATUSES = {'completed', 'failed', 'expired', 'cancelled'}
+
+
+class OpenAIBatchBackend:
+    """
+    Submits request files to the OpenAI Batch API and downloads their results.
+    """
+
+    def __init__(self, api_client=None, completion_window='24h'):
+        self.client = api_client or openai_client()
+        self.completion_window = completion_window
+
+    def submit(self, request_path):
+        with open(request_path, 'rb') as f:
+            uploaded = self.client.files.create(file=f, purpose='batch')
+        batch = self.client.batches.create(
+            input_file_id=uploaded.id,
+            endpoint='/v1/chat/completions',
+            completion_window=self.completion_window
+        )
+        return batch.id
+
+    def status(self, batch_id):
+        return self.client.batches.retrieve(batch_id).status
+
+    def download(self, batch_id, output_path):
+        """
+        Writes the batch's result lines (successes, then errors) to output_path.
+        Returns False if the batch produced no result files.
+        """
+        batch = self.client.batches.retrieve(batch_id)
+        file_ids = [fid for fid in (batch.output_file_id, batch.error_file_id) if fid]
+        if not file_ids:
+            return False
+        with open(output_path, 'w', encoding='utf-8') as f:
+            for file_id in file_ids:
+                text = self.client.files.content(file_id).text
+                f.write(text if text.endswith('\n') or not text else text + '\n')
+        return True
+
+
+class LocalBatchBackend:
+    """
+    Directory-based stand-in for the Batch API, for fully offline runs.
+
+    Each submitted file is copied into `<directory>/<batch_id>/`. The batch
+    reports 'in_progress' for `polls_until_complete` status checks and then
+    writes Batch-API-format results produced by `responder`, which maps the
+    user message to function-call arguments (fakes.fake_analysis by default).
+    """
+
+    def __init__(self, directory, responder=fake_analysis, polls_until_complete=1):
+        self.directory = directory
+        self.responder = responder
+        self.polls_until_complete = polls_until_complete
+        self._polls = {}
+        os.makedirs(directory, exist_ok=True)
+
+    def submit(self, request_path):
+        batch_id = f"batch_{uuid.uuid4().hex[:12]}"
+        os.makedirs(os.path.join(self.directory, batch_id))
+        shutil.copy(request_path, os.path.join(self.directory, batch_id, 'input.jsonl'))
+        return batch_id
+
+    def status(self, batch_id):
+        polls = self._polls.get(batch_id, 0)
+        self._polls[batch_id] = polls + 1
+        if polls < self.polls_until_complete:
+            return 'in_progress'
+        result_path = os.path.join(self.directory, batch_id, 'output.jsonl')
+        if not os.path.exists(result_path):
+            self._process(batch_id, result_path)
+        return 'completed'
+
+    def _process(self, batch_id, result_path):
+        input_path = os.path.join(self.directory, batch_id, 'input.jsonl')
+        with open(input_path, encoding='utf-8') as src, open(result_path, 'w', encoding='utf-8') as dst:
+            for line in src:
+                request = json.loads(line)
+                body = request['body']
+                user_content = body['messages'][-1]['content']
+                prompt_chars = sum(len(m['content']) for m in body['messages'])
+                result = {
+                    "id": f"batch_req_{uuid.uuid4().hex[:12]}",
+                    "custom_id": request['custom_id'],
+                    "response": {
+                        "status_code": 200,
+                        "request_id": uuid.uuid4().hex,
+                        "body": chat_completion_payload(self.responder(user_content), body['model'], prompt_chars)
+                    },
+                    "error": None
+                }
+                dst.write(json.dumps(result) + '\n')
+
+    def download(self, batch_id, output_path):
+        result_path = os.path.join(self.directory, batch_id, 'output.jsonl')
+        if not os.path.exists(result_path):
+            return False
+        shutil.copy(result_path, output_path)
+        return True
+
+
+def custom_id_for(index):
+    return f"row-{index}"
+
+
+def prepare_batch_files(rows, work_dir, cache=None, context=None,
+                        max_requests=MAX_REQUESTS_PER_FILE, max_bytes=MAX_BYTES_PER_FILE,
+                        max_tokens=None):
+    """
+    Writes Batch-API request lines for every row that needs a model call,
+    splitting into files that respect the per-file request and size limits
+    and, if given, `max_tokens` estimated tokens (the organization's
+    enqueued-token quota for the model).
+    Rows without text or with a cached response are left out. `context` is
+    passed on to build_content.
+    Returns the list of request file paths.
+    """
+    paths = []
+    f = None
+    requests_in_file = bytes_in_file = tokens_in_file = 0
+
+    for index, row in rows:
+        content = build_content(row, context)
+        if content is None:
+            continue
+        if cache is not None and cache.get(cache_key(MODEL, system_message, drivers_schema, content)) is not None:
+            continue
+
+        line = json.dumps({
+            "custom_id": custom_id_for(index),
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": build_request(content)
+        }) + '\n'
+        size = len(line.encode('utf-8'))
+        tokens = estimate_tokens(content)
+
+        if (f is None or requests_in_file >= max_requests or bytes_in_file + size > max_bytes
+                or (max_tokens is not None and tokens_in_file + tokens > max_tokens)):
+            if f is not None:
+                f.close()
+            paths.append(os.path.join(work_dir, f"requests-{len(paths):03d}.jsonl"))
+            f = open(paths[-1], 'w', encoding='utf-8')
+            requests_in_file = bytes_in_file = tokens_in_file = 0
+
+        f.write(line)
+        requests_in_file += 1
+        bytes_in_file += size
+        tokens_in_file += tokens
+
+    if f is not None:
+        f.close()
+    return paths
+
+
+def load_manifest(work_dir):
+    path = os.path.join(work_dir, 'manifest.json')
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_manifest(work_dir, manifest):
+    path = os.path.join(work_dir, 'manifest.json')
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(path + '.tmp', path)
+
+
+def wait_for_batches(backend, manifest, work_dir, poll_interval=60):
+    """
+    Polls every unfinished batch until it reaches a terminal status, then
+    downloads its results next to the request file.
+    """
+    while True:
+        pending = [job for job in manifest['jobs'] if job['status'] not in TERMINAL_STATUSES]
+        for job in pending:
+            job['status'] = backend.status(job['batch_id'])
+            if job['status'] in TERMINAL_STATUSES:
+                result_path = job['request_file'].replace('requests-', 'results-')
+                if backend.download(job['batch_id'], result_path):
+                    job['result_file'] = result_path
+                print(f"Batch {job['batch_id']} {job['status']}")
+        save_manifest(work_dir, manifest)
+
+        remaining = sum(job['status'] not in TERMINAL_STATUSES for job in manifest['jobs'])
+        if not remaining:
+            return manifest
+        print(f"{remaining} batch(es) still running, checking again in {poll_interval:.0f}s...")
+        time.sleep(poll_interval)
+
+
+def parse_result_line(result):
+    """
+    Returns the parsed function-call arguments from one Batch API result line,
+    or raises ValueError with the reason the request failed.
+    """
+    if result.get('error'):
+        raise ValueError(result['error'].get('message', str(result['error'])))
+    response = result['response']
+    if response['status_code'] != 200:
+        raise ValueError(f"HTTP {response['status_code']}: {response['body']}")
+    message = response['body']['choices'][0]['message']
+    return parse_arguments(message['function_call']['arguments'])
+
+
+def load_results(manifest, usage=None):
+    """
+    Maps custom_id to parsed arguments (or the exception for failed requests)
+    for every downloaded result file. Token usage of successful requests is
+    added to `usage` (a tokens.UsageMeter).
+    """
+    results = {}
+    for job in manifest['jobs']:
+        if not job.get('result_file'):
+            continue
+        with open(job['result_file'], encoding='utf-8') as f:
+            for line in f:
+                result = json.loads(line)
+                if usage is not None and (result.get('response') or {}).get('status_code') == 200:
+                    usage.record(result['response']['body'].get('usage'))
+                try:
+                    results[result['custom_id']] = parse_result_line(result)
+                except (ValueError, KeyError, TypeError) as e:
+                    results[result['custom_id']] = e
+    return results
+
+
+def run_batch_analysis(max_rows=None, data_file='reddit_data.csv', backend=None, work_dir=None,
+                       poll_interval=60, use_cache=True, cache_path=None, resume=False,
+                       max_requests_per_file=MAX_REQUESTS_PER_FILE, max_tokens_per_file=None,
+                       thread_context=True, threads_file=None):
+    """
+    Analyzes the input through the Batch API: packs rows into request files,
+    submits and polls them, then ingests the results into the same journal and
+    weekend_activity_analysis.csv that analyze_data produces.
+
+    With resume=True an existing manifest in work_dir is picked up, so polling
+    continues for already-submitted batches instead of paying for them again.
+    Results are matched to rows by position, so a resumed run reads the
+    data file the batches were submitted for, and refuses to continue if
+    that file changed since.
+    thread_context and threads_file work as in analyze_data. Token usage
+    and the estimated (discounted) cost go to `<output>.usage.json`.
+    """
+    from .pipeline import fingerprint
+
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    output_path = os.path.join(script_dir, 'data', 'weekend_activity_analysis.csv')
+    work_dir = work_dir or os.path.join(script_dir, 'data', 'batches')
+    backend = backend or OpenAIBatchBackend()
+
+    manifest = load_manifest(work_dir) if resume else None
+    if manifest is not None and manifest['data_file'] != data_file:
+        print(f"Resuming batches submitted for {manifest['data_file']} (not {data_file})")
+        data_file = manifest['data_file']
+    data_path = os.path.join(script_dir, 'data', data_file)
+    if manifest is not None and manifest.get('data_fingerprint') not in (None, fingerprint(data_path)):
+        raise ValueError(f"{data_file} changed since its batches were submitted, so their results "
+                         f"can't be matched to rows; run again without --resume")
+
+    cache = None
+    if use_cache:
+        cache = ResponseCache(cache_path or default_cache_path(),
+                              cached_prompts_version())
+
+    context = None
+    if thread_context:
+        context = load_thread_context(os.path.join(script_dir, 'data', threads_file) if threads_file else data_path)
+
+    if manifest is None:
+        if os.path.isdir(work_dir):
+            shutil.rmtree(work_dir)
+        os.makedirs(work_dir)
+        request_files = prepare_batch_files(iter_rows(data_path, max_rows), work_dir, cache, context,
+                                            max_requests=max_requests_per_file,
+                                            max_tokens=max_tokens_per_file)
+        manifest = {"data_file": data_file, "data_fingerprint": fingerprint(data_path), "max_rows": max_rows,
+                     "jobs": []}
+        for path in request_files:
+            batch_id = backend.submit(path)
+            manifest['jobs'].append({"request_file": path, "batch_id": batch_id, "status": "submitted"})
+            save_manifest(work_dir, manifest)
+            print(f"Submitted {os.path.basename(path)} as {batch_id}")
+        save_manifest(work_dir, manifest)
+    else:
+        print(f"Resuming {len(manifest['jobs'])} submitted batch(es) from {work_dir}")
+
+    wait_for_batches(backend, manifest, work_dir, poll_interval)
+    usage = UsageMeter(MODEL, batch=True)
+    results = load_results(manifest, usage)
+
+    journal = AnalysisJournal(output_path)
+    validator = ResponseValidator(drivers_schema)
+    qualified_count = 0
+    failed = 0
+    dropped = 0
+    batch_episodes = []
+    batch_ids = []
+    for index, row in iter_rows(data_path, manifest['max_rows']):
+        content = build_content(row, context)
+        if content is None:
+            batch_ids.append(row['post_id'])
+            continue
+
+        key = cache_key(MODEL, system_message, drivers_schema, content)
+        parsed = results.get(custom_id_for(index))
+        if parsed is None and cache is not None:
+            parsed = cache.get(key)
+            if parsed is not None:
+                usage.record_cache_hit(prompt_tokens(system_message, drivers_schema, content))
+        if parsed is None or isinstance(parsed, Exception):
+            failed += 1
+            print(f"❌ No result for row {index+1}: {parsed if parsed is not None else 'missing from batch output'}")
+            continue
+        # Invalid episodes are dropped rather than repaired; the raw results stay in work_dir
+        try:
+            episodes, invalid, _ = validator.check(parsed)
+        except InvalidResponse as e:
+            failed += 1
+            print(f"❌ Unusable result for row {index+1}: {e}")
+            continue
+        dropped += len(invalid)
+        parsed = {"episodes": episodes}
+        if cache is not None:
+            cache.put(key, parsed)
+
+        if episodes:
+            qualified_count += 1
+        batch_episodes.extend(attach_metadata(episodes, row))
+        batch_ids.append(row['post_id'])
+
+        if len(batch_ids) >= 1000:
+            journal.commit(batch_episodes, batch_ids)
+            batch_episodes, batch_ids = [], []
+    journal.commit(batch_episodes, batch_ids)
+
+    if cache is not None:
+        cache.close()
+
+    print(f"\n{usage.report()}")
+    usage.write(output_path)
+
+    episode_count = journal.export()
+    print(f"\nBatch analysis complete. {qualified_count} qualified entries, "
+          f"{episode_count} total episodes, {failed} rows without a result, {dropped} invalid episodes dropped.")
+    if episode_count:
+        print(f"Results exported to {output_path}")
+    return episode_count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Analyze Reddit data through the Batch API")
+    parser.add_argument('max_rows', nargs='?', type=int, default=None)
+    parser.add_argument('--data-file', default='reddit_data.csv')
+    parser.add_argument('--local', metavar='DIR',
+                        help="Use the offline directory-based fake backend in DIR")
+    parser.add_argument('--poll-interval', type=float, default=60)
+    parser.add_argument('--resume', action='store_true',
+                        help="Keep polling batches submitted by a previous run")
+    parser.add_argument('--no-cache', action='store_true')
+    parser.add_argument('--max-tokens-per-file', type=int, default=None,
+                        help="Split request files to stay under this enqueued-token quota")
+    parser.add_argument('--no-thread-context', action='store_true')
+    parser.add_argument('--threads-file', default=None)
+    args = parser.parse_args()
+
+    backend = LocalBatchBackend(args.local) if args.local else OpenAIBatchBackend()
+    run_batch_analysis(max_rows=args.max_rows, data_file=args.data_file, backend=backend,
+                       poll_interval=args.poll_interval, use_cache=not args.no_cache,
+                       resume=args.resume, max_tokens_per_file=args.max_tokens_per_file,
+                       thread_context=not args.no_thread_context,
+                       threads_file=args.threads_file)
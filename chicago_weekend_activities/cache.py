@@ -0,0 +1,178 @@
+# cache.py — persistent, content-addressed cache of LLM responses
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_CACHE_FILE = 'llm_cache.sqlite'
+DEFAULT_MAX_ENTRIES = 200000
+
+
+def prompt_version(*prompts):
+    """
+    Fingerprint of prompts and schemas. Changes whenever any of them does.
+    """
+    payload = json.dumps(prompts, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+
+def cached_prompts_version():
+    """
+    Version of the cache entries: covers every prompt and schema that can
+    produce a cached response (single and packed requests, and repairs,
+    whose results are stored under the original request's key).
+    """
+    from .prompts import (system_message, drivers_schema, packed_system_message, packed_drivers_schema,
+                          repair_system_message)
+
+    return prompt_version(system_message, drivers_schema, packed_system_message, packed_drivers_schema,
+                          repair_system_message)
+
+
+def cache_key(model, system_message, schema, content):
+    """
+    Content address of one request: hash of model + prompt + schema + input.
+    """
+    payload = json.dumps({
+        "model": model,
+        "system": system_message,
+        "schema": schema,
+        "content": content
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """
+    SQLite-backed cache of parsed model responses, safe to share between threads.
+
+    Entries are stored with the prompt version that produced them; opening the
+    cache with a different version (prompts.py was edited) purges the stale
+    entries. Once more than `max_entries` are stored the least recently used
+    tenth is evicted.
+    """
+
+    def __init__(self, path, version, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.version = version
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                prompt_version TEXT NOT NULL,
+                response TEXT NOT NULL,
+                created REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+        self._conn.commit()
+        self.invalidated = self.invalidate_stale()
+        self._size = self._count()
+
+    def _count(self):
+        return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def invalidate_stale(self):
+        """
+        Deletes entries produced by any other prompt version. Returns the number removed.
+        """
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM responses WHERE prompt_version != ?", (self.version,))
+            self._conn.commit()
+        return cursor.rowcount
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+            self._size = 0
+
+    def get(self, key):
+        """
+        Returns the cached response for key, or None on a miss.
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+        return json.loads(row[0])
+
+    def put(self, key, response, replace=False):
+        """
+        Stores a response. An existing entry for key is kept unless
+        replace=True, which overwrites it (e.g. with a repaired response).
+        """
+        now = time.time()
+        with self._lock:
+            if replace:
+                cursor = self._conn.execute(
+                    "UPDATE responses SET prompt_version = ?, response = ?, last_used = ? WHERE key = ?",
+                    (self.version, json.dumps(response), now, key)
+                )
+                if cursor.rowcount:
+                    self._conn.commit()
+                    return
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO responses (key, prompt_version, response, created, last_used) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, self.version, json.dumps(response), now, now)
+            )
+            self._size += cursor.rowcount
+            if self.max_entries and self._size > self.max_entries:
+                self._evict(max(1, self.max_entries // 10) + self._size - self.max_entries)
+            self._conn.commit()
+
+    def _evict(self, n):
+        self._conn.execute(
+            "DELETE FROM responses WHERE key IN "
+            "(SELECT key FROM responses ORDER BY last_used LIMIT ?)", (n,)
+        )
+        self._size = self._count()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": self._size
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def default_cache_path():
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    return os.path.join(script_dir, 'data', DEFAULT_CACHE_FILE)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect or clear the LLM response cache")
+    parser.add_argument('--path', default=default_cache_path())
+    parser.add_argument('--clear', action='store_true', help="Delete every cached response")
+    args = parser.parse_args()
+
+    cache = ResponseCache(args.path, cached_prompts_version())
+    if cache.invalidated:
+        print(f"Removed {cache.invalidated:,} entries from older prompt versions")
+    if args.clear:
+        cache.clear()
+        print("Cache cleared")
+    print(f"{cache.stats()['entries']:,} cached responses in {args.path}")
+    cache.close()
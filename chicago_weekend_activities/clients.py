@@ -0,0 +1,66 @@
+# clients.py — API clients created on first use instead of at import
+import os
+import threading
+
+# Seconds allowed to open a connection, and for a whole OpenAI response
+# (function-call responses on long rows can take a minute)
+CONNECT_TIMEOUT = 10.0
+OPENAI_TIMEOUT = 120.0
+
+# Seconds per Reddit API request
+REDDIT_TIMEOUT = 30
+
+_lock = threading.Lock()
+_env_loaded = False
+_openai_clients = {}
+
+
+def load_env():
+    """
+    Loads .env into the environment, once per process. Variables already
+    set in the real environment win.
+    """
+    global _env_loaded
+    if _env_loaded:
+        return
+    with _lock:
+        if not _env_loaded:
+            from dotenv import load_dotenv
+            load_dotenv()
+            _env_loaded = True
+
+
+def openai_client(api_key=None, base_url=None, timeout=OPENAI_TIMEOUT):
+    """
+    Shared OpenAI client for an API key and base URL (by default
+    OPENAI_API_KEY and OPENAI_BASE_URL from the environment or .env),
+    created on first use. The client is thread safe, so every request of a
+    process goes through one pool of kept-alive HTTP connections. It never
+    retries itself; engine.call_with_retry does.
+    """
+    load_env()
+    api_key = api_key or os.getenv('OPENAI_API_KEY')
+    base_url = base_url or os.getenv('OPENAI_BASE_URL')
+    key = (api_key, base_url, timeout)
+    with _lock:
+        if key not in _openai_clients:
+            import openai
+            _openai_clients[key] = openai.OpenAI(api_key=api_key, base_url=base_url, max_retries=0,
+                                                 timeout=openai.Timeout(timeout, connect=CONNECT_TIMEOUT))
+        return _openai_clients[key]
+
+
+def new_reddit_client(timeout=REDDIT_TIMEOUT):
+    """
+    A new Reddit API client from REDDIT_* credentials. praw is not thread
+    safe, so each scraper worker thread creates its own and keeps it (and
+    its HTTP session) for all of its requests.
+    """
+    load_env()
+    import praw
+    return praw.Reddit(
+        client_id=os.getenv('REDDIT_CLIENT_ID'),
+        client_secret=os.getenv('REDDIT_CLIENT_SECRET'),
+        user_agent=os.getenv('REDDIT_USER_AGENT'),
+        timeout=timeout
+    )
@@ -1,66 +1,319 @@
 import pandas as pd
+import numpy as np
 import os
+import re
+import shutil
+import argparse
 from pathlib import Path
+from .storage import read_table, open_writer, write_table, table_columns
 
-def deduplicate_reddit_data(input_file='reddit_data.csv', output_file='reddit_data_unique.csv'):
+# Rows read per chunk; memory is bounded by one chunk plus 8 bytes per unique row
+CHUNK_ROWS = 100000
+
+# Must match scrape.SEARCH_TERM_SEPARATOR
+SEARCH_TERM_SEPARATOR = '|'
+
+# MinHash / LSH settings for near-duplicate text detection. 8 bands of 4
+# rows catch pairs down to ~0.6 Jaccard; candidates are then verified
+# against NEAR_DUPLICATE_SIMILARITY.
+MINHASH_PERMUTATIONS = 32
+LSH_BANDS = 8
+SHINGLE_WORDS = 3
+MIN_WORDS_FOR_NEAR_DUPLICATE = 8
+NEAR_DUPLICATE_SIMILARITY = 0.8
+
+# Shingle hashes and permutations live below this prime, so a * x + b
+# fits in uint64 and signatures fit in uint32
+_PRIME = (1 << 31) - 1
+
+
+def row_keys(chunk):
+    """
+    64-bit hash of (is_comment, post_id) for every row, computed vectorized.
+    Posts and comments are keyed separately since their ids are different
+    namespaces on Reddit.
+    """
+    return pd.util.hash_pandas_object(chunk[['is_comment', 'post_id']].astype(str), index=False).to_numpy()
+
+
+def in_sorted(values, sorted_array):
+    """
+    Vectorized membership test of values in an already sorted array.
+    """
+    if not len(sorted_array):
+        return np.zeros(len(values), dtype=bool)
+    pos = np.searchsorted(sorted_array, values).clip(max=len(sorted_array) - 1)
+    return sorted_array[pos] == values
+
+
+def merge_terms(joined):
+    """
+    'a|b|a|c' -> 'a|b|c', keeping first-seen order.
+    """
+    return SEARCH_TERM_SEPARATOR.join(dict.fromkeys(t for t in joined.split(SEARCH_TERM_SEPARATOR) if t))
+
+
+class NearDuplicateIndex:
+    """
+    MinHash signatures over word shingles with banded LSH, computed a chunk
+    at a time with numpy. Band keys are kept in sorted arrays rather than
+    dicts, so the index costs about 200 bytes per indexed text.
+    """
+
+    def __init__(self, permutations=MINHASH_PERMUTATIONS, bands=LSH_BANDS,
+                 threshold=NEAR_DUPLICATE_SIMILARITY, seed=1):
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, _PRIME, size=permutations, dtype=np.uint64)
+        self.b = rng.integers(0, _PRIME, size=permutations, dtype=np.uint64)
+        self.band_multipliers = rng.integers(1, 1 << 63, size=permutations // bands, dtype=np.uint64)
+        self.bands = bands
+        self.rows_per_band = permutations // bands
+        self.threshold = threshold
+        self._band_keys = [np.empty(0, dtype=np.uint64) for _ in range(bands)]
+        self._band_owners = [np.empty(0, dtype=np.int64) for _ in range(bands)]
+        self._signatures = np.empty((0, permutations), dtype=np.uint32)
+        self._ids = []
+
+    def signatures(self, texts, block_docs=2000):
+        """
+        MinHash signature per text, and a mask of texts long enough to have one.
+        """
+        shingles = []
+        starts = []
+        valid = np.zeros(len(texts), dtype=bool)
+        for i, text in enumerate(texts):
+            words = re.findall(r"\w+", text.lower()) if isinstance(text, str) else []
+            if len(words) < MIN_WORDS_FOR_NEAR_DUPLICATE:
+                continue
+            valid[i] = True
+            starts.append(len(shingles))
+            shingles.extend(' '.join(words[j:j + SHINGLE_WORDS]) for j in range(len(words) - SHINGLE_WORDS + 1))
+
+        signatures = np.zeros((len(texts), len(self.a)), dtype=np.uint32)
+        if not shingles:
+            return signatures, valid
+        hashes = pd.util.hash_array(np.array(shingles, dtype=object)) % np.uint64(_PRIME)
+        starts.append(len(shingles))
+        rows = np.flatnonzero(valid)
+        for first in range(0, len(rows), block_docs):
+            block_starts = np.array(starts[first:first + block_docs + 1])
+            block = hashes[block_starts[0]:block_starts[-1]]
+            permuted = (np.outer(self.a, block) + self.b[:, None]) % np.uint64(_PRIME)
+            mins = np.minimum.reduceat(permuted, block_starts[:-1] - block_starts[0], axis=1)
+            signatures[rows[first:first + block_docs]] = mins.T
+        return signatures, valid
+
+    def add_many(self, ids, texts):
+        """
+        Indexes a chunk of texts and returns, per text, the id of the earliest
+        indexed text sharing an LSH band whose estimated Jaccard similarity
+        reaches the threshold, or None.
+        """
+        signatures, valid = self.signatures(texts)
+        n = len(texts)
+        base = len(self._ids)
+        candidates = np.full((n, self.bands), -1, dtype=np.int64)
+
+        valid_rows = np.flatnonzero(valid)
+        for band in range(self.bands):
+            columns = signatures[:, band * self.rows_per_band:(band + 1) * self.rows_per_band]
+            keys = (columns.astype(np.uint64) * self.band_multipliers).sum(axis=1)
+            index_keys, owners = self._band_keys[band], self._band_owners[band]
+
+            # Earlier chunks
+            found = in_sorted(keys, index_keys) & valid
+            if found.any():
+                candidates[found, band] = owners[np.searchsorted(index_keys, keys[found])]
+
+            # Earlier rows of this chunk; factorize numbers keys by first appearance
+            codes, _ = pd.factorize(keys[valid_rows])
+            _, first_positions = np.unique(codes, return_index=True)
+            first_rows = valid_rows[first_positions[codes]]
+            within = (first_rows != valid_rows) & ~found[valid_rows]
+            candidates[valid_rows[within], band] = base + first_rows[within]
+
+            # Keys seen for the first time become owned by their first text
+            new_rows = valid_rows[(first_rows == valid_rows) & ~found[valid_rows]]
+            merged_keys = np.concatenate([index_keys, keys[new_rows]])
+            order = np.argsort(merged_keys, kind='stable')
+            self._band_keys[band] = merged_keys[order]
+            self._band_owners[band] = np.concatenate([owners, base + new_rows])[order]
+
+        self._signatures = np.concatenate([self._signatures, signatures])
+        self._ids.extend(ids)
+
+        # Verify candidates by the fraction of agreeing signature rows
+        matches = [None] * n
+        rows = np.flatnonzero((candidates >= 0).any(axis=1))
+        if len(rows):
+            row_candidates = candidates[rows]
+            similarity = (self._signatures[row_candidates.clip(min=0)] == signatures[rows, None, :]).mean(axis=2)
+            confirmed = (row_candidates >= 0) & (similarity >= self.threshold)
+            best = np.where(confirmed, row_candidates, np.iinfo(np.int64).max).min(axis=1)
+            for row, ordinal in zip(rows.tolist(), best.tolist()):
+                if ordinal != np.iinfo(np.int64).max:
+                    matches[row] = self._ids[ordinal]
+        return matches
+
+
+def find_first_occurrences(input_file, chunksize=CHUNK_ROWS):
+    """
+    Pass 1: streams only the key and search-term columns. Returns a
+    per-chunk list of first-occurrence masks, the merged search terms of
+    every duplicated key (a Series indexed by row key), the row count and
+    the name of the terms column read. The seen-set is a sorted uint64 array of row hashes.
     """
-    Deduplicates Reddit data based on post IDs and sorts by creation date.
-    Preserves all comments while ensuring each post appears only once.
+    terms_column = 'search_terms' if 'search_terms' in table_columns(input_file) else 'search_term'
+    seen = np.empty(0, dtype=np.uint64)
+    masks = []
+    duplicate_keys = []
+    duplicate_terms = []
+    total_rows = 0
+    for chunk in read_table(input_file, columns=['post_id', 'is_comment', terms_column], chunksize=chunksize):
+        total_rows += len(chunk)
+        keys = row_keys(chunk)
+        first = ~pd.Series(keys).duplicated().to_numpy() & ~in_sorted(keys, seen)
+        seen = np.union1d(seen, keys[first])
+        masks.append(first)
+        duplicate_keys.append(keys[~first])
+        duplicate_terms.append(chunk[terms_column].fillna('').astype(str).to_numpy()[~first])
+
+    # Each copy contributes '|<terms>'; string sum runs in the groupby's C loop
+    extra_terms = pd.Series(np.concatenate(duplicate_terms), dtype=object).radd(SEARCH_TERM_SEPARATOR)
+    extra_terms = extra_terms.groupby(np.concatenate(duplicate_keys)).sum()
+    return masks, extra_terms, total_rows, terms_column
+
+
+def deduplicate_reddit_data(input_file='reddit_data.csv', output_file='reddit_data_unique.csv',
+                            chunksize=CHUNK_ROWS, near_duplicates=False, sort=True):
+    """
+    Deduplicates Reddit data and sorts by creation date.
+    Posts and comments are deduplicated alike, by (is_comment, post_id): the
+    first occurrence is kept and the search terms of every copy are merged
+    into its search_terms column.
+    Input and output may each be CSV or Parquet, chosen by file extension.
+
+    The input is streamed in two passes of `chunksize` rows, so memory
+    grows only by an 8-byte hash per unique row and a mask byte per input row. Sorting by date
+    loads the deduplicated table; pass sort=False for results that don't
+    fit in memory (output is then in input order).
+
+    With near_duplicates=True, rows whose text is a near copy of an earlier
+    row (reposts, copy-pasted comments) get that row's post_id in a
+    near_duplicate_of column; they are flagged, not removed.
+
+    Returns the number of unique rows written: 0 for an input with no
+    rows, whose output is then an empty table with the same columns.
+    Returns None only if deduplication failed (e.g. unreadable input).
     """
     try:
-        # Read the input file
+        # Pass 1: find first occurrences and collect the terms of their copies
         print(f"Reading data from {input_file}...")
-        df = pd.read_csv(input_file)
-        
-        # Convert created_utc to datetime if it's not already
-        if not pd.api.types.is_datetime64_any_dtype(df['created_utc']):
-            df['created_utc'] = pd.to_datetime(df['created_utc'])
-        
-        # Get unique posts (where is_comment is False)
-        posts_df = df[~df['is_comment']].drop_duplicates(subset=['post_id'])
-        
-        # Get all comments
-        comments_df = df[df['is_comment']]
-        
-        # Combine unique posts with all comments
-        unique_df = pd.concat([posts_df, comments_df])
-        
-        # Sort by creation date
-        unique_df = unique_df.sort_values('created_utc', ascending=False)
-        
-        # Save to new file
-        unique_df.to_csv(output_file, index=False)
-        
+        masks, extra_terms, total_rows, terms_column = find_first_occurrences(input_file, chunksize)
+
+        # Pass 2: write first occurrences with merged terms
+        near_index = NearDuplicateIndex() if near_duplicates else None
+        writer = None
+        stats = {'posts': 0, 'comments': 0, 'near_duplicates': 0}
+        per_subreddit = {True: pd.Series(dtype='int64'), False: pd.Series(dtype='int64')}
+        per_term = pd.Series(dtype='int64')
+
+        for chunk, first in zip(read_table(input_file, chunksize=chunksize), masks):
+            unique_chunk = chunk[first].copy()
+            terms = unique_chunk[terms_column].fillna('').astype(str)
+            extras = pd.Series(row_keys(unique_chunk)).map(extra_terms)
+            duplicated = extras.notna().to_numpy()
+            if duplicated.any():
+                terms = terms.to_numpy(copy=True)
+                terms[duplicated] = [merge_terms(t + e)
+                                     for t, e in zip(terms[duplicated], extras[duplicated])]
+            unique_chunk['search_terms'] = terms
+
+            if near_index is not None:
+                unique_chunk['near_duplicate_of'] = near_index.add_many(
+                    unique_chunk['post_id'].tolist(), unique_chunk['text'].tolist())
+                stats['near_duplicates'] += int(unique_chunk['near_duplicate_of'].notna().sum())
+
+            is_comment = unique_chunk['is_comment'].astype(bool)
+            stats['comments'] += int(is_comment.sum())
+            stats['posts'] += int((~is_comment).sum())
+            for flag in (True, False):
+                counts = unique_chunk.loc[is_comment == flag, 'subreddit'].value_counts()
+                per_subreddit[flag] = per_subreddit[flag].add(counts, fill_value=0)
+            per_term = per_term.add(unique_chunk.loc[~is_comment, 'search_term'].value_counts(), fill_value=0)
+
+            if writer is None:
+                target = output_file + '.unsorted' + os.path.splitext(output_file)[1] if sort else output_file
+                writer = open_writer(target, list(unique_chunk.columns), chunk_rows=chunksize)
+            writer.write_frame(unique_chunk)
+        if writer is None:
+            columns = table_columns(input_file)
+            columns += [c for c in ['search_terms'] + (['near_duplicate_of'] if near_duplicates else [])
+                        if c not in columns]
+            write_table(pd.DataFrame(columns=columns), output_file)
+            print(f"No rows to deduplicate; wrote an empty {output_file}")
+            return 0
+        writer.close()
+
+        unique_df = None
+        if sort:
+            # Sort by creation date
+            unique_df = read_table(writer.path)
+            unique_df['created_utc'] = pd.to_datetime(unique_df['created_utc'])
+            unique_df = unique_df.sort_values('created_utc', ascending=False)
+            write_table(unique_df, output_file)
+            if os.path.isdir(writer.path):
+                shutil.rmtree(writer.path)
+            else:
+                os.remove(writer.path)
+
         # Print statistics
+        unique_rows = stats['posts'] + stats['comments']
         print("\nDeduplication complete!")
-        print(f"Original file: {len(df):,} total records")
-        print(f"Unique posts: {len(posts_df):,}")
-        print(f"Total comments: {len(comments_df):,}")
-        print(f"New file: {len(unique_df):,} total records")
+        print(f"Original file: {total_rows:,} total records")
+        print(f"Unique posts: {stats['posts']:,}")
+        print(f"Unique comments: {stats['comments']:,}")
+        print(f"Duplicates removed: {total_rows - unique_rows:,}")
+        print(f"New file: {unique_rows:,} total records")
+        if near_duplicates:
+            print(f"Near-duplicate texts flagged: {stats['near_duplicates']:,}")
         print(f"Saved to {output_file}")
-        
+
         # Print some additional statistics
         print("\nAdditional Statistics:")
         print(f"Posts per subreddit:")
-        print(posts_df['subreddit'].value_counts())
+        print(per_subreddit[False].astype('int64').sort_values(ascending=False))
         print(f"\nComments per subreddit:")
-        print(comments_df['subreddit'].value_counts())
+        print(per_subreddit[True].astype('int64').sort_values(ascending=False))
         print(f"\nPosts per search term:")
-        print(posts_df['search_term'].value_counts())
-        
-        return unique_df
-        
+        print(per_term.astype('int64').sort_values(ascending=False))
+
+        return unique_rows
+
     except Exception as e:
         print(f"Error during deduplication: {str(e)}")
         return None
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Deduplicate scraped Reddit posts and comments")
+    parser.add_argument('input', nargs='?', default='reddit_data.csv',
+                        help="Input file in the data directory (CSV or Parquet)")
+    parser.add_argument('output', nargs='?', default='reddit_data_unique.csv',
+                        help="Output file in the data directory (CSV or Parquet)")
+    parser.add_argument('--chunksize', type=int, default=CHUNK_ROWS)
+    parser.add_argument('--near-duplicates', action='store_true',
+                        help="Flag near-duplicate texts (MinHash/LSH) in a near_duplicate_of column")
+    parser.add_argument('--no-sort', action='store_true',
+                        help="Keep input order instead of loading the result to sort it by date")
+    args = parser.parse_args()
+
     # Get the directory of the current script
     script_dir = os.path.dirname(os.path.abspath(__file__))
-    
+
     # Set input and output paths
-    input_path = os.path.join(script_dir, 'data', 'reddit_data.csv')
-    output_path = os.path.join(script_dir, 'data', 'reddit_data_unique.csv')
-    
+    input_path = os.path.join(script_dir, 'data', args.input)
+    output_path = os.path.join(script_dir, 'data', args.output)
+
     # Run deduplication
-    deduplicate_reddit_data(input_path, output_path) 
\ No newline at end of file
+    deduplicate_reddit_data(input_path, output_path, chunksize=args.chunksize,
+                            near_duplicates=args.near_duplicates, sort=not args.no_sort)
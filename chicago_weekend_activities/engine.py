@@ -0,0 +1,156 @@
+# engine.py — bounded concurrency, rate limiting and retries for API calls
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+# HTTP status codes worth retrying: rate limits and transient server errors
+RETRYABLE_STATUS_CODES = {408, 409, 429}
+
+
+class RateLimiter:
+    """
+    Thread-safe sliding-window limiter for requests and tokens per minute.
+    Either limit may be None to leave that dimension unbounded.
+    """
+
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None, window=60.0):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.window = window
+        self._events = deque()  # (timestamp, tokens)
+        self._tokens_in_window = 0
+        self._lock = threading.Lock()
+
+    def _expire(self, now):
+        while self._events and now - self._events[0][0] >= self.window:
+            _, tokens = self._events.popleft()
+            self._tokens_in_window -= tokens
+
+    def _wait_time(self, now, tokens):
+        """Seconds until a request of `tokens` fits in the window, 0 if it fits now."""
+        waits = [0.0]
+        if self.requests_per_minute and len(self._events) >= self.requests_per_minute:
+            oldest = self._events[len(self._events) - self.requests_per_minute][0]
+            waits.append(oldest + self.window - now)
+        if self.tokens_per_minute and self._events:
+            excess = self._tokens_in_window + tokens - self.tokens_per_minute
+            for timestamp, event_tokens in self._events:
+                if excess <= 0:
+                    break
+                excess -= event_tokens
+                waits.append(timestamp + self.window - now)
+        return max(waits)
+
+    def acquire(self, tokens=0):
+        """
+        Blocks until one request carrying `tokens` tokens may be sent.
+        A single request larger than the whole token budget is let through
+        once the window is otherwise empty.
+        """
+        if not self.requests_per_minute and not self.tokens_per_minute:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._expire(now)
+                wait = self._wait_time(now, tokens)
+                if wait <= 0:
+                    self._events.append((now, tokens))
+                    self._tokens_in_window += tokens
+                    return
+            time.sleep(wait)
+
+
+def is_retryable(error):
+    """
+    True for errors that are worth retrying: timeouts, dropped connections,
+    429 rate limits and 5xx server errors.
+    """
+    import openai
+
+    if isinstance(error, (openai.APIConnectionError, openai.APITimeoutError)):
+        return True
+    status = getattr(error, 'status_code', None)
+    if status is None:
+        return False
+    return status in RETRYABLE_STATUS_CODES or status >= 500
+
+
+def _retry_after(error):
+    """Seconds requested by a Retry-After header on the error's response, if any."""
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get('retry-after'))
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt, base_delay=1.0, max_delay=60.0):
+    """Full-jitter exponential backoff: uniform in [0, min(max_delay, base * 2**attempt)]."""
+    return random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+
+
+def call_with_retry(fn, max_retries=5, base_delay=1.0, max_delay=60.0, on_retry=None):
+    """
+    Calls fn() and retries retryable errors with jittered exponential backoff,
+    honouring Retry-After when the server sends one. Non-retryable errors and
+    the last retryable error are re-raised.
+    """
+    attempt = 0
+    while True:
+        try:
+            return fn()
+        except Exception as e:
+            if attempt >= max_retries or not is_retryable(e):
+                raise
+            delay = _retry_after(e)
+            if delay is None:
+                delay = backoff_delay(attempt, base_delay, max_delay)
+            if on_retry is not None:
+                on_retry(e, attempt, delay)
+            time.sleep(delay)
+            attempt += 1
+
+
+def run_ordered(fn, items, concurrency=1):
+    """
+    Applies fn to every item with at most `concurrency` calls in flight and
+    yields (item, result) pairs in the original order of `items`.
+    Exceptions raised by fn are yielded as the result instead of propagating,
+    so one bad item never stops the run.
+    """
+    def safe_call(item):
+        try:
+            return fn(item)
+        except Exception as e:
+            return e
+
+    if concurrency <= 1:
+        for item in items:
+            yield item, safe_call(item)
+        return
+
+    items = iter(items)
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        # Pull items lazily and keep a bounded window of futures, so huge or
+        # streamed inputs never queue more than a few batches at once
+        window = concurrency * 4
+        pending = deque()
+        exhausted = False
+        while not exhausted or pending:
+            while not exhausted and len(pending) < window:
+                try:
+                    item = next(items)
+                except StopIteration:
+                    exhausted = True
+                    break
+                pending.append((item, executor.submit(safe_call, item)))
+            if pending:
+                item, future = pending.popleft()
+                yield item, future.result()
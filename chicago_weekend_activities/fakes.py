@@ -0,0 +1,436 @@
+# fakes.py — local stand-ins for the OpenAI and Reddit APIs, for offline runs and benchmarks
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+# Episode returned by the fake model for rows it decides are "qualified"
+CANNED_EPISODE = {
+    "decision_context": "Looking for something new to do on a free Saturday",
+    "user_type": "local",
+    "activity_type": "entertainment",
+    "decision_factors": ["novelty", "social bonding"],
+    "constraints": ["budget"],
+    "options_considered": ["staying in", "comedy show"],
+    "switch_trigger": "A friend suggested a comedy show",
+    "switch_type": "routine_break",
+    "emotional_tone": "excited",
+    "final_choice": "Went to a comedy show",
+    "reasoning": "A friend's suggestion turned a quiet weekend into a night out."
+}
+
+
+def fake_analysis(user_content, qualify_rate=0.3):
+    """
+    Deterministic fake model output for a user message: a fixed share of
+    inputs (chosen by content hash) get one canned episode, the rest none.
+    """
+    digest = hashlib.sha256(user_content.encode('utf-8')).digest()
+    qualified = digest[0] / 256 < qualify_rate
+    return {"episodes": [dict(CANNED_EPISODE)] if qualified else []}
+
+
+def fake_packed_analysis(user_content, qualify_rate=0.3):
+    """
+    fake_analysis for packed requests: each "### Entry N" block is judged on
+    its own and its episodes are tagged with row_index N.
+    """
+    from .packing import split_packed_content
+
+    episodes = []
+    for row_index, content in enumerate(split_packed_content(user_content)):
+        for ep in fake_analysis(content, qualify_rate)["episodes"]:
+            ep["row_index"] = row_index
+            episodes.append(ep)
+    return {"episodes": episodes}
+
+
+def is_packed_request(request):
+    """True if the request uses the packed schema (episodes carry row_index)."""
+    try:
+        parameters = request['functions'][0]['parameters']
+        return 'row_index' in parameters['properties']['episodes']['items']['properties']
+    except (KeyError, IndexError, TypeError):
+        return False
+
+
+def is_repair_request(request):
+    """True for analyze.build_repair_request follow-ups."""
+    from .analyze import REPAIR_FUNCTION
+
+    try:
+        return request['functions'][0]['name'] == REPAIR_FUNCTION
+    except (KeyError, IndexError, TypeError):
+        return False
+
+
+def fake_arguments(request, qualify_rate=0.3):
+    """
+    Function-call arguments the fake model answers a chat request with.
+    Repairs always succeed: an invalid episode comes back as the canned one,
+    a whole response as an empty one.
+    """
+    messages = request.get('messages', [])
+    user_content = next((m['content'] for m in reversed(messages) if m['role'] == 'user'), '')
+    if is_repair_request(request):
+        parameters = request['functions'][0]['parameters']
+        return {"episodes": []} if 'episodes' in parameters.get('properties', {}) else dict(CANNED_EPISODE)
+    if is_packed_request(request):
+        return fake_packed_analysis(user_content, qualify_rate)
+    return fake_analysis(user_content, qualify_rate)
+
+
+def corrupt_arguments(arguments, roll):
+    """
+    Breaks a response the ways real ones break, picked by `roll` in [0, 1):
+    JSON cut off mid-way (returned as text), an enum value outside the
+    schema, or a missing required field.
+    """
+    episodes = arguments.get('episodes')
+    if roll < 1 / 3 or not episodes:
+        return json.dumps(arguments)[:-5]
+    if roll < 2 / 3:
+        episodes[0]['emotional_tone'] = 'happy'
+    else:
+        episodes[0].pop('final_choice', None)
+    return arguments
+
+
+def chat_completion_payload(arguments, model, prompt_chars=0):
+    """
+    Wraps function-call arguments (a dict, or already serialized text) in an
+    OpenAI chat.completion response body.
+    """
+    arguments_json = arguments if isinstance(arguments, str) else json.dumps(arguments)
+    prompt_tokens = prompt_chars // 4
+    completion_tokens = len(arguments_json) // 4
+    return {
+        "id": "chatcmpl-fake",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "message": {
+                "role": "assistant",
+                "content": None,
+                "function_call": {
+                    "name": "analyze_weekend_activities",
+                    "arguments": arguments_json
+                }
+            },
+            "finish_reason": "function_call"
+        }],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens
+        }
+    }
+
+
+class FakeOpenAIServer:
+    """
+    OpenAI-compatible HTTP server answering /v1/chat/completions with canned
+    analyses after an artificial delay. A share of requests can be failed
+    with 429 or 500 to exercise retry handling, and a share of answers
+    broken (see corrupt_arguments) to exercise validation and repair.
+
+    Usage:
+        with FakeOpenAIServer(latency=0.5) as server:
+            client = openai_client(api_key="fake", base_url=server.base_url)
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.2, jitter=0.0,
+                 error_rate=0.0, qualify_rate=0.3, invalid_rate=0.0, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.qualify_rate = qualify_rate
+        self.invalid_rate = invalid_rate
+        self.request_count = 0
+        self.error_count = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._thread = None
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, status, body, headers=None):
+                data = json.dumps(body).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                request = json.loads(self.rfile.read(length) or b'{}')
+                if not self.path.rstrip('/').endswith('/chat/completions'):
+                    self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+                    return
+
+                with server._lock:
+                    server.request_count += 1
+                    delay = server.latency + server._random.uniform(0, server.jitter)
+                    fail = server._random.random() < server.error_rate
+                    status = server._random.choice([429, 500]) if fail else 200
+                    if fail:
+                        server.error_count += 1
+                    corrupt = server._random.random()
+                time.sleep(delay)
+
+                if fail:
+                    self._send_json(status, {"error": {"message": "Simulated failure", "type": "fake_error"}},
+                                    headers={'Retry-After': '0'} if status == 429 else None)
+                    return
+
+                prompt_chars = sum(len(m.get('content') or '') for m in request.get('messages', []))
+                arguments = fake_arguments(request, server.qualify_rate)
+                if corrupt < server.invalid_rate and not is_repair_request(request):
+                    arguments = corrupt_arguments(arguments, corrupt / server.invalid_rate)
+                self._send_json(200, chat_completion_payload(arguments, request.get('model'), prompt_chars))
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def _namespace(value):
+    """Nested dicts/lists as attribute objects, like the openai SDK's response models."""
+    if isinstance(value, dict):
+        return SimpleNamespace(**{k: _namespace(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return [_namespace(v) for v in value]
+    return value
+
+
+class FakeOpenAIClient:
+    """
+    In-process stand-in for openai.OpenAI covering chat.completions.create:
+    same canned analyses, latency, 429/500 failures and broken answers as FakeOpenAIServer,
+    without the HTTP round trip, so benchmarks measure this code rather than
+    the local network stack.
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, qualify_rate=0.3, invalid_rate=0.0, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.qualify_rate = qualify_rate
+        self.invalid_rate = invalid_rate
+        self.request_count = 0
+        self.error_count = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def _error(self, status):
+        import openai
+
+        # The SDK errors only read these attributes of the HTTP response
+        response = SimpleNamespace(status_code=status, request=None,
+                                   headers={'retry-after': '0'} if status == 429 else {})
+        error_class = openai.RateLimitError if status == 429 else openai.InternalServerError
+        return error_class("Simulated failure", response=response, body=None)
+
+    def create(self, **request):
+        with self._lock:
+            self.request_count += 1
+            delay = self.latency + self._random.uniform(0, self.jitter)
+            fail = self._random.random() < self.error_rate
+            status = self._random.choice([429, 500]) if fail else 200
+            if fail:
+                self.error_count += 1
+            corrupt = self._random.random()
+        if delay:
+            time.sleep(delay)
+        if fail:
+            raise self._error(status)
+
+        prompt_chars = sum(len(m.get('content') or '') for m in request.get('messages', []))
+        arguments = fake_arguments(request, self.qualify_rate)
+        if corrupt < self.invalid_rate and not is_repair_request(request):
+            arguments = corrupt_arguments(arguments, corrupt / self.invalid_rate)
+        return _namespace(chat_completion_payload(arguments, request.get('model'), prompt_chars))
+
+
+class FakeComment:
+    def __init__(self, id, body, created_utc, score):
+        self.id = id
+        self.body = body
+        self.created_utc = created_utc
+        self.score = score
+
+
+class FakeCommentForest:
+    def __init__(self, comments):
+        self._comments = comments
+
+    def replace_more(self, limit=None):
+        return []
+
+    def list(self):
+        return list(self._comments)
+
+
+class FakeSubmission:
+    def __init__(self, reddit, id, title, selftext, created_utc, score, n_comments):
+        self._reddit = reddit
+        self.id = id
+        self.title = title
+        self.selftext = selftext
+        self.created_utc = created_utc
+        self.score = score
+        self._n_comments = n_comments
+        self._comments = None
+
+    def copy(self):
+        """A fresh, unfetched handle on the same submission, as praw hands out."""
+        return FakeSubmission(self._reddit, self.id, self.title, self.selftext,
+                              self.created_utc, self.score, self._n_comments)
+
+    @property
+    def comments(self):
+        # Like praw, the comment tree costs one request the first time it is touched
+        if self._comments is None:
+            self._reddit._request()
+            rng = random.Random(self.id)
+            self._comments = FakeCommentForest([
+                FakeComment(
+                    id=f"{self.id}c{i}",
+                    body=f"Comment {i} on {self.title}: we went to a show on Saturday with friends.",
+                    created_utc=self.created_utc + rng.randint(60, 86400),
+                    score=rng.randint(-2, 50)
+                )
+                for i in range(self._n_comments)
+            ])
+        return self._comments
+
+
+class FakeSubreddit:
+    def __init__(self, reddit, name):
+        self._reddit = reddit
+        self.display_name = name
+
+    def search(self, query, sort='relevance', time_filter='all', limit=100):
+        """
+        Canned search results: submissions are drawn from a shared per-subreddit
+        pool, so the same submission matches several search terms.
+        """
+        pool = self._reddit._pool(self.display_name)
+        rng = random.Random(f"{self.display_name}|{query}")
+        matches = rng.sample(pool, min(len(pool), self._reddit.submissions_per_term))
+        if sort == 'new':
+            matches.sort(key=lambda s: s.created_utc, reverse=True)
+        for i, submission in enumerate(matches[:limit]):
+            if i % 100 == 0:
+                # Listings are fetched a page of 100 at a time
+                self._reddit._request()
+            yield submission.copy()
+
+
+class FakeReddit:
+    """
+    In-process stand-in for praw.Reddit returning canned submissions and
+    comment trees, with optional per-request latency and a request counter.
+    Submissions are generated deterministically from `seed`; each subreddit
+    has a pool of `pool_size` submissions spread over the last `days` days.
+    """
+
+    def __init__(self, pool_size=200, submissions_per_term=50, comments_per_submission=5,
+                 days=365, latency=0.0, seed=0, now=None):
+        self.pool_size = pool_size
+        self.submissions_per_term = submissions_per_term
+        self.comments_per_submission = comments_per_submission
+        self.days = days
+        self.latency = latency
+        self.seed = seed
+        self.now = now if now is not None else time.time()
+        self.request_count = 0
+        self._pools = {}
+        self._by_id = {}
+        self._lock = threading.Lock()
+
+    def _request(self):
+        with self._lock:
+            self.request_count += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _pool(self, subreddit_name):
+        with self._lock:
+            if subreddit_name not in self._pools:
+                rng = random.Random(f"{self.seed}|{subreddit_name}")
+                self._pools[subreddit_name] = [
+                    FakeSubmission(
+                        self,
+                        id=f"{subreddit_name[:2].lower()}{i:05d}",
+                        title=f"Things to do this weekend #{i}",
+                        selftext=f"Looking for ideas for Saturday night, post {i} in r/{subreddit_name}.",
+                        created_utc=self.now - rng.uniform(0, self.days * 86400),
+                        score=rng.randint(0, 500),
+                        n_comments=self.comments_per_submission
+                    )
+                    for i in range(self.pool_size)
+                ]
+                self._by_id.update((s.id, s) for s in self._pools[subreddit_name])
+            return self._pools[subreddit_name]
+
+    def subreddit(self, name):
+        return FakeSubreddit(self, name)
+
+    def submission(self, id):
+        return self._by_id[id].copy()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a fake OpenAI-compatible server")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.5, help="Seconds added to every request")
+    parser.add_argument('--jitter', type=float, default=0.0, help="Extra random latency, up to this many seconds")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Share of requests failed with 429/500")
+    parser.add_argument('--invalid-rate', type=float, default=0.0,
+                        help="Share of answers broken (bad JSON, enum or missing field)")
+    args = parser.parse_args()
+
+    server = FakeOpenAIServer(port=args.port, latency=args.latency, jitter=args.jitter,
+                              error_rate=args.error_rate, invalid_rate=args.invalid_rate)
+    print(f"Fake OpenAI server listening on {server.base_url}")
+    print(f"Point analyze.py at it with OPENAI_BASE_URL={server.base_url} OPENAI_API_KEY=fake")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
@@ -0,0 +1,142 @@
+# journal.py — append-only results journal and processed-row ledger for resumable runs
+import json
+import os
+
+from .storage import open_writer
+
+
+def _to_json(value):
+    """json.dumps fallback for numpy scalars and timestamps coming out of pandas."""
+    if hasattr(value, 'item'):
+        return value.item()
+    return str(value)
+
+
+def _fsync(f):
+    f.flush()
+    os.fsync(f.fileno())
+
+
+class AnalysisJournal:
+    """
+    Durable progress for analyze_data.
+
+    Episodes are appended to `<output>.jsonl` and the ids of finished rows to
+    `<output>.ledger`, one batch at a time and fsynced, journal first. A row
+    counts as done only once it is in the ledger: on resume, journal lines from
+    a batch that never reached the ledger are dropped, so a crash mid-batch
+    neither loses committed work nor duplicates episodes.
+
+    With compact=False a resumed journal is only read: the files are left
+    as they are and iter_episodes skips the uncommitted lines instead, so
+    another process's journal can be read while it may still be written.
+    """
+
+    def __init__(self, output_path, resume=False, compact=True):
+        base, _ = os.path.splitext(output_path)
+        self.output_path = output_path
+        self.journal_path = base + '.jsonl'
+        self.ledger_path = base + '.ledger'
+        self.completed = set()
+        self._filter = resume and not compact
+        if resume:
+            self.completed = self._load_ledger()
+            if compact:
+                self._compact()
+        else:
+            for path in (self.journal_path, self.ledger_path):
+                open(path, 'w').close()
+
+    def _load_ledger(self):
+        if not os.path.exists(self.ledger_path):
+            return set()
+        with open(self.ledger_path, encoding='utf-8') as f:
+            return {line.rstrip('\n') for line in f if line.strip()}
+
+    def _compact(self):
+        """
+        Rewrites the journal without episodes whose row never reached the ledger.
+        """
+        if not os.path.exists(self.journal_path):
+            open(self.journal_path, 'w').close()
+            return
+        tmp_path = self.journal_path + '.tmp'
+        dropped = 0
+        with open(self.journal_path, encoding='utf-8') as src, open(tmp_path, 'w', encoding='utf-8') as dst:
+            for line in src:
+                try:
+                    episode = json.loads(line)
+                except json.JSONDecodeError:
+                    # Torn write from a crash
+                    dropped += 1
+                    continue
+                if str(episode.get('source_id')) in self.completed:
+                    dst.write(line)
+                else:
+                    dropped += 1
+            _fsync(dst)
+        os.replace(tmp_path, self.journal_path)
+        if dropped:
+            print(f"Discarded {dropped} uncommitted journal entries from an interrupted batch")
+
+    def is_done(self, row_id):
+        return str(row_id) in self.completed
+
+    def commit(self, episodes, row_ids):
+        """
+        Durably records one batch: its episodes, then the ids of its rows.
+        """
+        with open(self.journal_path, 'a', encoding='utf-8') as f:
+            for ep in episodes:
+                f.write(json.dumps(ep, default=_to_json) + '\n')
+            _fsync(f)
+        with open(self.ledger_path, 'a', encoding='utf-8') as f:
+            for row_id in row_ids:
+                f.write(f"{row_id}\n")
+            _fsync(f)
+        self.completed.update(str(row_id) for row_id in row_ids)
+
+    def iter_episodes(self, chunksize=10000):
+        """
+        Yields lists of at most `chunksize` committed episodes.
+        """
+        chunk = []
+        if self._filter and not os.path.exists(self.journal_path):
+            return
+        with open(self.journal_path, encoding='utf-8') as f:
+            for line in f:
+                if self._filter:
+                    try:
+                        episode = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    if str(episode.get('source_id')) not in self.completed:
+                        continue
+                    chunk.append(episode)
+                else:
+                    chunk.append(json.loads(line))
+                if len(chunk) >= chunksize:
+                    yield chunk
+                    chunk = []
+        if chunk:
+            yield chunk
+
+    def export(self, chunksize=10000):
+        """
+        Streams the journal into the output table (CSV or Parquet, by the
+        output path's extension), chunk by chunk. Returns the number of
+        episodes written.
+        """
+        # First pass collects the column union in first-seen order
+        columns = {}
+        for chunk in self.iter_episodes(chunksize):
+            for ep in chunk:
+                columns.update(dict.fromkeys(ep))
+        if not columns:
+            return 0
+
+        writer = open_writer(self.output_path, list(columns), chunk_rows=chunksize)
+        for chunk in self.iter_episodes(chunksize):
+            writer.write_many(chunk)
+        writer.close()
+        return writer.rows_written
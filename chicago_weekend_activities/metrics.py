@@ -0,0 +1,302 @@
+# metrics.py — per-run counters, latency histograms, JSON/Prometheus export and a progress bar
+import json
+import os
+import random
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, float('inf'))
+
+# Observations kept per histogram for percentiles (reservoir sample beyond that)
+RESERVOIR_SIZE = 10000
+
+PROMETHEUS_PREFIX = 'cwa_'
+
+
+class Histogram:
+    """
+    Bucketed distribution of observations (Prometheus-style cumulative
+    buckets), plus a bounded reservoir sample for percentiles.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+        self._sample = []
+        self._random = random.Random(0)
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        if len(self._sample) < RESERVOIR_SIZE:
+            self._sample.append(value)
+        else:
+            slot = self._random.randrange(self.count)
+            if slot < RESERVOIR_SIZE:
+                self._sample[slot] = value
+
+    def percentile(self, q):
+        if not self._sample:
+            return None
+        ordered = sorted(self._sample)
+        return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))]
+
+    def summary(self):
+        cumulative, buckets = 0, {}
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            buckets['+Inf' if bound == float('inf') else str(bound)] = cumulative
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "mean": self.sum / self.count if self.count else None,
+            "min": self.min,
+            "max": self.max,
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+            "buckets": buckets
+        }
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _key(name, labels):
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+class RunMetrics:
+    """
+    Thread-safe metrics of one run: counters, gauges and histograms, each
+    identified by a name and optional labels (e.g. error type, subreddit).
+    `write(output_path)` exports them as `<base>.metrics.json` and
+    `<base>.prom` (Prometheus text format, for a node-exporter textfile
+    collector or a pushgateway).
+    """
+
+    def __init__(self, run):
+        self.run = run
+        self.started_at = datetime.now().isoformat(timespec='seconds')
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+
+    def elapsed(self):
+        return time.perf_counter() - self._start
+
+    def inc(self, name, value=1, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        with self._lock:
+            self.gauges[_key(name, labels)] = value
+
+    def observe(self, name, value, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            if key not in self.histograms:
+                self.histograms[key] = Histogram()
+            self.histograms[key].observe(value)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """
+        Observes the duration of the block in histogram `name`.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Adds the wall-clock time of the block to stage_seconds_total{stage=name}.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.inc('stage_seconds_total', time.perf_counter() - start, stage=name)
+
+    def value(self, name, **labels):
+        """
+        Current value of one counter series (0 if never incremented).
+        """
+        with self._lock:
+            return self.counters.get(_key(name, labels), 0)
+
+    def total(self, name):
+        """
+        Sum of a counter over all its label sets.
+        """
+        with self._lock:
+            return sum(value for (n, _), value in self.counters.items() if n == name)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "run": self.run,
+                "started_at": self.started_at,
+                "elapsed_seconds": round(self.elapsed(), 3),
+                "counters": [{"name": n, "labels": dict(l), "value": v}
+                             for (n, l), v in sorted(self.counters.items())],
+                "gauges": [{"name": n, "labels": dict(l), "value": v}
+                           for (n, l), v in sorted(self.gauges.items())],
+                "histograms": [{"name": n, "labels": dict(l), **h.summary()}
+                               for (n, l), h in sorted(self.histograms.items())]
+            }
+
+    def to_prometheus(self):
+        def series(name, labels, extra=()):
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return PROMETHEUS_PREFIX + name
+            body = ','.join(f'{k}="{_escape(v)}"' for k, v in pairs)
+            return f"{PROMETHEUS_PREFIX}{name}{{{body}}}"
+
+        lines = []
+        with self._lock:
+            for kind, metrics in (('counter', self.counters), ('gauge', self.gauges)):
+                typed = set()
+                for (name, labels), value in sorted(metrics.items()):
+                    if name not in typed:
+                        lines.append(f"# TYPE {PROMETHEUS_PREFIX}{name} {kind}")
+                        typed.add(name)
+                    lines.append(f"{series(name, labels)} {value}")
+            typed = set()
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                if name not in typed:
+                    lines.append(f"# TYPE {PROMETHEUS_PREFIX}{name} histogram")
+                    typed.add(name)
+                for bound, count in histogram.summary()['buckets'].items():
+                    lines.append(f"{series(name + '_bucket', labels, [('le', bound)])} {count}")
+                lines.append(f"{series(name + '_sum', labels)} {histogram.sum}")
+                lines.append(f"{series(name + '_count', labels)} {histogram.count}")
+        lines.append(f"# TYPE {PROMETHEUS_PREFIX}run_elapsed_seconds gauge")
+        lines.append(f'{PROMETHEUS_PREFIX}run_elapsed_seconds{{run="{self.run}"}} {self.elapsed():.3f}')
+        return '\n'.join(lines) + '\n'
+
+    def write(self, output_path):
+        """
+        Writes `<output base>.metrics.json` and `<output base>.prom`.
+        Returns the JSON path.
+        """
+        base = os.path.splitext(output_path)[0]
+        for path, text in ((base + '.metrics.json', json.dumps(self.snapshot(), indent=2)),
+                           (base + '.prom', self.to_prometheus())):
+            with open(path + '.tmp', 'w') as f:
+                f.write(text)
+            os.replace(path + '.tmp', path)
+        return base + '.metrics.json'
+
+    def report(self, histogram_name):
+        """
+        One line per label set of a latency histogram: count, p50/p90/p99, max.
+        """
+        lines = []
+        with self._lock:
+            items = [(dict(l), h.summary()) for (n, l), h in sorted(self.histograms.items())
+                     if n == histogram_name]
+        for labels, s in items:
+            label = ','.join(f"{k}={v}" for k, v in labels.items()) or 'all'
+            lines.append(f"{histogram_name}[{label}]: {s['count']:,} calls, p50 {s['p50']:.2f}s, "
+                         f"p90 {s['p90']:.2f}s, p99 {s['p99']:.2f}s, max {s['max']:.2f}s")
+        return '\n'.join(lines)
+
+
+def _format_duration(seconds):
+    seconds = int(seconds)
+    return f"{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+
+class Progress:
+    """
+    Single-line live progress bar on stderr: done/total, rate, ETA and any
+    extra counters passed to update(). Other output should go through
+    write() so it doesn't tear the bar. Disabled, it prints nothing.
+    """
+
+    def __init__(self, total=None, label='', enabled=True, stream=None, min_interval=0.2, width=30):
+        self.total = total
+        self.label = label
+        self.enabled = enabled
+        self.stream = stream or sys.stderr
+        self.min_interval = min_interval
+        self.width = width
+        self.done = 0
+        self.postfix = {}
+        self._start = time.perf_counter()
+        self._drawn_at = 0.0
+        self._lock = threading.Lock()
+
+    def _line(self):
+        elapsed = time.perf_counter() - self._start
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        parts = [self.label] if self.label else []
+        if self.total:
+            filled = int(self.width * min(self.done / self.total, 1.0))
+            eta = (self.total - self.done) / rate if rate > 0 else 0
+            parts.append(f"[{'#' * filled}{'-' * (self.width - filled)}] {self.done:,}/{self.total:,} "
+                         f"{self.done / self.total:.0%} {rate:.1f}/s ETA {_format_duration(eta)}")
+        else:
+            parts.append(f"{self.done:,} {rate:.1f}/s")
+        parts.extend(f"{k}={v:,}" if isinstance(v, int) else f"{k}={v}" for k, v in self.postfix.items())
+        return ' '.join(parts)
+
+    def _draw(self):
+        self.stream.write('\r\033[K' + self._line())
+        self.stream.flush()
+        self._drawn_at = time.perf_counter()
+
+    def update(self, n=1, **postfix):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.done += n
+            self.postfix.update(postfix)
+            if time.perf_counter() - self._drawn_at >= self.min_interval:
+                self._draw()
+
+    def write(self, message=''):
+        """
+        Prints a message above the bar (plain print when disabled).
+        """
+        if not self.enabled:
+            print(message)
+            return
+        with self._lock:
+            self.stream.write('\r\033[K')
+            self.stream.flush()
+            print(message, flush=True)
+            # Redrawn by the next update()
+            self._drawn_at = 0.0
+
+    def close(self):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._draw()
+            self.stream.write('\n')
+            self.stream.flush()
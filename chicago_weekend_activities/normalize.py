@@ -0,0 +1,370 @@
+# normalize.py — maps free-text decision factors and switch triggers onto the ten situational drivers
+import argparse
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import zlib
+
+import numpy as np
+
+from .storage import apply_types, read_table, open_writer, table_columns
+
+# The ten situational drivers (see README), each described by prototype
+# phrases; a factor belongs to the driver of its most similar phrase
+DRIVERS = {
+    "Social Bonding": [
+        "social bonding", "spending time with friends", "family time", "date night", "romantic partner",
+        "celebrating with friends", "group activity", "meeting new people", "socializing", "anniversary",
+        "bonding with kids", "shared experience", "community", "connection",
+    ],
+    "Novelty/FOMO": [
+        "novelty", "trying something new", "curiosity", "first time experience", "fomo",
+        "fear of missing out", "exploration", "unique experience", "discovering new places", "adventure",
+        "limited time event", "hype", "new restaurant", "interest",
+    ],
+    "Convenience": [
+        "convenience", "proximity", "close to home", "nearby location", "easy access", "public transportation",
+        "short distance", "accessibility", "fits schedule", "parking", "walkable", "location", "travel time",
+    ],
+    "Cost/Value Sensitivity": [
+        "cost", "budget", "cheap", "affordable", "free admission", "price", "value for money", "discount",
+        "deal", "expensive", "budget-conscious", "saving money", "ticket prices", "happy hour",
+    ],
+    "Affective State": [
+        "mood", "boredom", "stress relief", "relaxation", "feeling down", "need a break", "burned out",
+        "excitement", "self care", "emotional wellbeing", "loneliness", "enjoyment", "fun", "nostalgia",
+    ],
+    "Weather-Driven": [
+        "weather", "nice weather", "rain", "cold weather", "snow", "sunny day", "summer", "temperature",
+        "heat", "winter", "outdoor season", "warm day", "indoor because of weather",
+    ],
+    "Out-of-Character Behavior": [
+        "out of character", "stepping out of comfort zone", "breaking routine", "doing something unusual",
+        "personal growth", "challenge myself", "different from usual habits", "pushing boundaries",
+        "self improvement", "learning a new skill",
+    ],
+    "Peer Influence": [
+        "peer influence", "friend's recommendation", "recommendation", "reddit suggestions", "reviews",
+        "word of mouth", "invited by friends", "peer pressure", "social proof", "popularity",
+        "advice from locals", "suggestions", "reputation",
+    ],
+    "Spontaneity": [
+        "spontaneity", "last minute decision", "impulse", "spur of the moment", "unplanned", "on a whim",
+        "flexibility", "open schedule", "free time", "availability",
+    ],
+    "External Stimulus": [
+        "external stimulus", "saw an advertisement", "event announcement", "social media post",
+        "ticket availability", "special event", "festival", "holiday", "concert", "news", "visiting guests",
+        "work event", "sports game", "live music", "season opening",
+    ],
+}
+
+# Below this cosine similarity to every prototype a string stays unmapped
+DEFAULT_THRESHOLD = 0.3
+
+# Unique strings embedded and scored per batch
+BATCH_STRINGS = 5000
+
+DEFAULT_CACHE_FILE = 'normalize_cache.sqlite'
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset("a an and the of to for in on at with by from or my our their his her your "
+                       "is are was be being it its this that as about into over".split())
+
+
+def normalize_text(text):
+    """Trimmed, lowercased, single-spaced form that equal strings share."""
+    return ' '.join(str(text).lower().split())
+
+
+def text_key(text):
+    return hashlib.sha1(normalize_text(text).encode('utf-8')).hexdigest()
+
+
+class HashedNgramEmbedder:
+    """
+    Local, dependency-free text embedding: words, 5-letter word prefixes
+    (so "budgeting" meets "budget") and character trigrams, hashed into
+    `dims` buckets with crc32 and l2-normalized. Weights are fixed per
+    feature kind rather than learned IDF, so a string's vector never
+    depends on the rest of the corpus and mappings can be cached by string.
+    """
+
+    WEIGHTS = {'w': 1.0, 'p': 0.7, 'c': 0.25}
+
+    def __init__(self, dims=2 ** 16):
+        self.dims = dims
+        self.version = f"hashed-ngram-v1-{dims}"
+        self._tokens = {}
+
+    def _token_features(self, token):
+        """(buckets, weights) of one word, memoized: words repeat far more than strings."""
+        cached = self._tokens.get(token)
+        if cached is None:
+            grams = [('w', token)]
+            if len(token) > 5:
+                grams.append(('p', token[:5]))
+            padded = f" {token} "
+            grams.extend(('c', padded[i:i + 3]) for i in range(len(padded) - 2))
+            cached = (np.array([zlib.crc32(f"{kind}:{gram}".encode('utf-8')) % self.dims for kind, gram in grams],
+                               dtype=np.int64),
+                      np.array([self.WEIGHTS[kind] for kind, _ in grams], dtype=np.float32))
+            self._tokens[token] = cached
+        return cached
+
+    def features(self, texts):
+        """
+        Sparse l2-normalized vectors of `texts` as parallel (row, bucket,
+        weight) arrays, sorted by row, one entry per distinct bucket of a row.
+        """
+        rows, buckets, weights = [], [], []
+        for row, text in enumerate(texts):
+            for token in _TOKEN.findall(text.lower()):
+                if token not in _STOPWORDS:
+                    token_buckets, token_weights = self._token_features(token)
+                    rows.append(row)
+                    buckets.append(token_buckets)
+                    weights.append(token_weights)
+        if not rows:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        rows = np.repeat(np.array(rows, dtype=np.int64), [len(b) for b in buckets])
+        # Sum repeated buckets of a row, then scale each row to unit length
+        keys, inverse = np.unique(rows * self.dims + np.concatenate(buckets), return_inverse=True)
+        summed = np.bincount(inverse, weights=np.concatenate(weights)).astype(np.float32)
+        rows, buckets = keys // self.dims, keys % self.dims
+        norms = np.sqrt(np.bincount(rows, weights=summed ** 2, minlength=len(texts))).astype(np.float32)
+        return rows, buckets, summed / norms[rows]
+
+    def embed(self, texts):
+        """Dense (len(texts), dims) matrix; only used for the few prototypes."""
+        matrix = np.zeros((len(texts), self.dims), dtype=np.float32)
+        rows, buckets, weights = self.features(texts)
+        matrix[rows, buckets] = weights
+        return matrix
+
+    def similarities(self, texts, prototypes):
+        """
+        Cosine similarity of every text to every prototype row. Only buckets
+        some prototype uses can contribute, so texts are scattered into a
+        dense block over just those buckets and multiplied in one product.
+        """
+        result = np.zeros((len(texts), prototypes.shape[0]), dtype=np.float32)
+        used = np.flatnonzero(prototypes.any(axis=0))
+        slots = np.full(self.dims, -1, dtype=np.int64)
+        slots[used] = np.arange(len(used))
+        compact = np.ascontiguousarray(prototypes[:, used].T)
+        for start in range(0, len(texts), BATCH_STRINGS):
+            batch = texts[start:start + BATCH_STRINGS]
+            rows, buckets, weights = self.features(batch)
+            keep = slots[buckets] >= 0
+            dense = np.zeros((len(batch), len(used)), dtype=np.float32)
+            dense[rows[keep], slots[buckets[keep]]] = weights[keep]
+            result[start:start + len(batch)] = dense @ compact
+        return result
+
+
+class SentenceTransformerEmbedder:
+    """
+    Embeddings from a local sentence-transformers model (e.g.
+    all-MiniLM-L6-v2), for better recall on paraphrases; needs the
+    sentence-transformers package and the model files.
+    """
+
+    def __init__(self, model_name):
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError:
+            raise ImportError("Model embeddings need sentence-transformers: pip install sentence-transformers")
+        self.model = SentenceTransformer(model_name)
+        self.version = f"st-{model_name}"
+
+    def embed(self, texts):
+        return np.asarray(self.model.encode(list(texts), batch_size=256, normalize_embeddings=True),
+                          dtype=np.float32)
+
+    def similarities(self, texts, prototypes):
+        return self.embed(texts) @ prototypes.T
+
+
+class DriverMapper:
+    """
+    Maps strings to the driver of their nearest prototype phrase, or None
+    when nothing reaches `threshold`.
+
+    Only distinct normalized strings are embedded, and results are kept in
+    a SQLite cache keyed by the string's hash and a mapping version (embedder,
+    prototypes, threshold), so a string is scored once across all runs;
+    changing DRIVERS or the threshold starts a fresh mapping. With ten
+    drivers of a dozen phrases each, exact nearest-neighbour search is one
+    small matrix product per batch, cheaper than building an approximate
+    index.
+    """
+
+    def __init__(self, embedder=None, drivers=DRIVERS, threshold=DEFAULT_THRESHOLD, cache_path=None):
+        self.embedder = embedder or HashedNgramEmbedder()
+        self.threshold = threshold
+        self.labels = []
+        phrases = []
+        for driver, examples in drivers.items():
+            for phrase in examples:
+                self.labels.append(driver)
+                phrases.append(phrase)
+        self.labels = np.array(self.labels, dtype=object)
+        self.prototypes = self.embedder.embed(phrases)
+        payload = json.dumps({"embedder": self.embedder.version, "drivers": drivers, "threshold": threshold},
+                             sort_keys=True)
+        self.version = hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+        self.computed = 0
+        self.cached = 0
+
+        if cache_path is None:
+            script_dir = os.path.dirname(os.path.abspath(__file__))
+            cache_path = os.path.join(script_dir, 'data', DEFAULT_CACHE_FILE)
+        self._conn = sqlite3.connect(cache_path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS mappings (
+                key TEXT NOT NULL,
+                version TEXT NOT NULL,
+                driver TEXT,
+                similarity REAL NOT NULL,
+                PRIMARY KEY (key, version)
+            )
+        """)
+
+    def _lookup(self, keys):
+        found = {}
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            rows = self._conn.execute(
+                f"SELECT key, driver, similarity FROM mappings WHERE version = ? AND key IN "
+                f"({','.join('?' * len(chunk))})", [self.version, *chunk])
+            found.update((key, (driver, similarity)) for key, driver, similarity in rows)
+        return found
+
+    def score(self, texts):
+        """(driver or None, similarity) for each text, computed without the cache."""
+        similarities = self.embedder.similarities(texts, self.prototypes)
+        best = similarities.argmax(axis=1)
+        best_similarity = similarities[np.arange(len(texts)), best]
+        return [(self.labels[b] if s >= self.threshold else None, float(s))
+                for b, s in zip(best, best_similarity)]
+
+    def map(self, texts):
+        """
+        {normalized text: (driver or None, similarity)} for the distinct
+        normalized forms of `texts`.
+        """
+        unique = sorted({normalize_text(text) for text in texts if isinstance(text, str) and text.strip()})
+        result = {}
+        for start in range(0, len(unique), BATCH_STRINGS):
+            batch = unique[start:start + BATCH_STRINGS]
+            keys = [text_key(text) for text in batch]
+            found = self._lookup(keys)
+            missing = [i for i, key in enumerate(keys) if key not in found]
+            if missing:
+                scored = self.score([batch[i] for i in missing])
+                rows = [(keys[i], self.version, driver, similarity) for i, (driver, similarity) in zip(missing, scored)]
+                with self._conn:
+                    self._conn.executemany("INSERT OR REPLACE INTO mappings VALUES (?, ?, ?, ?)", rows)
+                found.update((keys[i], mapping) for i, mapping in zip(missing, scored))
+            self.computed += len(missing)
+            self.cached += len(batch) - len(missing)
+            result.update((text, found[key]) for text, key in zip(batch, keys))
+        return result
+
+    def close(self):
+        self._conn.close()
+
+
+def normalize_analysis(input_file='weekend_activity_analysis.csv', output_file='weekend_activity_drivers.csv',
+                       mapper=None, chunksize=50000):
+    """
+    Adds normalized driver columns to an analysis table (CSV or Parquet):
+    `drivers`, the distinct drivers of an episode's decision_factors, and
+    `switch_driver`, the driver of its switch_trigger (missing if unmapped).
+
+    Two streaming passes: the first collects the distinct strings and maps
+    them (see DriverMapper), the second copies the table chunk by chunk to
+    `output_file` with the new columns; the other columns are copied as
+    read, not coerced to the schema's types. Passing the input's name
+    rewrites it in place. Returns the {normalized string: (driver,
+    similarity)} mapping.
+    """
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    input_path = os.path.join(script_dir, 'data', input_file)
+    output_path = os.path.join(script_dir, 'data', output_file)
+    mapper = mapper or DriverMapper()
+
+    factors, triggers = set(), set()
+    rows = 0
+    for chunk in read_table(input_path, columns=['decision_factors', 'switch_trigger'], typed=True,
+                            chunksize=chunksize):
+        rows += len(chunk)
+        for items in chunk['decision_factors']:
+            factors.update(items)
+        triggers.update(chunk['switch_trigger'].dropna())
+    mapping = mapper.map(factors | triggers)
+    print(f"🧭 {len(factors):,} distinct decision factors and {len(triggers):,} switch triggers "
+          f"in {rows:,} episodes: {mapper.computed:,} newly mapped, {mapper.cached:,} from cache")
+
+    # Keyed by the strings as they appear, so the second pass needn't normalize again
+    driver = {text: mapping.get(normalize_text(text), (None, 0))[0] for text in factors | triggers}
+
+    def drivers_of(items):
+        return sorted({driver[item] for item in items if driver.get(item)})
+
+    def driver_of(text):
+        return driver.get(text) if isinstance(text, str) else None
+
+    columns = [c for c in table_columns(input_path) if c not in ('drivers', 'switch_driver')]
+    writer = open_writer(output_path, columns + ['drivers', 'switch_driver'], chunk_rows=chunksize)
+    for chunk in read_table(input_path, chunksize=chunksize):
+        chunk = chunk[columns].copy()
+        factor_lists = apply_types(chunk[['decision_factors']].copy())['decision_factors']
+        chunk['drivers'] = factor_lists.map(drivers_of)
+        chunk['switch_driver'] = chunk['switch_trigger'].map(driver_of)
+        writer.write_frame(chunk)
+    path = writer.close()
+    mapper.close()
+
+    mapped = sum(1 for driver, _ in mapping.values() if driver)
+    print(f"Mapped {mapped:,} of {len(mapping):,} distinct strings to a driver; wrote {path}")
+    return mapping
+
+
+def print_examples(mapping, per_driver=5):
+    """
+    The closest matches of each driver, and the nearest misses left unmapped,
+    for checking the prototypes and threshold.
+    """
+    by_driver = {}
+    for text, (driver, similarity) in mapping.items():
+        by_driver.setdefault(driver, []).append((similarity, text))
+    for driver in list(DRIVERS) + [None]:
+        examples = sorted(by_driver.get(driver, []), reverse=True)[:per_driver]
+        print(f"\n{driver or 'Unmapped'} ({len(by_driver.get(driver, [])):,} strings):")
+        for similarity, text in examples:
+            print(f"  {similarity:.2f}  {text}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Map decision factors and switch triggers onto the ten drivers")
+    parser.add_argument('input_file', nargs='?', default='weekend_activity_analysis.csv',
+                        help="Analysis table in the data directory")
+    parser.add_argument('--output-file', default='weekend_activity_drivers.csv',
+                        help="Table in the data directory to write; the input's own name rewrites it in place")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="Minimum similarity to a driver's prototypes")
+    parser.add_argument('--model', default=None,
+                        help="sentence-transformers model to embed with instead of hashed n-grams")
+    parser.add_argument('--examples', type=int, default=0, help="Print this many example strings per driver")
+    args = parser.parse_args()
+
+    embedder = SentenceTransformerEmbedder(args.model) if args.model else None
+    mapping = normalize_analysis(args.input_file, args.output_file,
+                                 DriverMapper(embedder, threshold=args.threshold))
+    if args.examples:
+        print_examples(mapping, args.examples)
@@ -0,0 +1,100 @@
+# packing.py — analyze several short rows in one LLM request
+import re
+
+from .prompts import packed_system_message, packed_drivers_schema
+from .tokens import count_tokens
+
+# Total user-message tokens of one packed request, well below MAX_INPUT_TOKENS
+PACK_BUDGET_TOKENS = 1500
+
+# Only rows of at most this many tokens are packed; longer ones keep their own request
+SHORT_ROW_TOKENS = 375
+
+# Upper bound on entries per request, to keep extraction quality per entry
+MAX_ROWS_PER_PACK = 8
+
+ENTRY_HEADER = "### Entry {index}"
+ENTRY_HEADER_PATTERN = re.compile(r'^### Entry (\d+)$', re.MULTILINE)
+
+
+def pack_rows(rows, build_content, budget_tokens=PACK_BUDGET_TOKENS,
+              short_row_tokens=SHORT_ROW_TOKENS, max_rows=MAX_ROWS_PER_PACK):
+    """
+    Groups consecutive (index, row) pairs into packs for one request each.
+
+    Short rows are accumulated until the next one would push the pack past
+    `budget_tokens` or `max_rows`; long rows and rows without text are yielded
+    on their own. Yields lists of (index, row, content) in input order, with
+    the content that was measured, so the request is built from the same text.
+    """
+    pack = []
+    pack_tokens = 0
+    header_tokens = count_tokens(ENTRY_HEADER.format(index=MAX_ROWS_PER_PACK)) + 2
+    for index, row in rows:
+        content = build_content(row)
+        item = (index, row, content)
+        size = count_tokens(content) + header_tokens if content is not None else 0
+        if content is None or size > short_row_tokens:
+            if pack:
+                yield pack
+                pack, pack_tokens = [], 0
+            yield [item]
+            continue
+
+        if pack and (pack_tokens + size > budget_tokens or len(pack) >= max_rows):
+            yield pack
+            pack, pack_tokens = [], 0
+        pack.append(item)
+        pack_tokens += size
+    if pack:
+        yield pack
+
+
+def build_packed_content(contents):
+    """
+    Joins row contents into one user message, each under an "### Entry N" header.
+    """
+    return "\n\n".join(f"{ENTRY_HEADER.format(index=i)}\n{content}" for i, content in enumerate(contents))
+
+
+def split_packed_content(packed_content):
+    """
+    Inverse of build_packed_content: returns the list of entry contents.
+    """
+    parts = ENTRY_HEADER_PATTERN.split(packed_content)
+    # parts = [preamble, index0, content0, index1, content1, ...]
+    return [content.strip('\n') for content in parts[2::2]]
+
+
+def build_packed_request(contents, model):
+    """
+    Keyword arguments for one chat.completions request analyzing several rows.
+    """
+    return {
+        "model": model,
+        "messages": [
+            {"role": "system", "content": packed_system_message},
+            {"role": "user", "content": build_packed_content(contents)}
+        ],
+        "response_format": {"type": "json_object"},
+        "functions": [{
+            "name": "analyze_weekend_activities",
+            "description": "Analyze weekend activity decisions and their influencing factors",
+            "parameters": packed_drivers_schema
+        }],
+        "function_call": {"name": "analyze_weekend_activities"}
+    }
+
+
+def split_packed_response(parsed, n_rows):
+    """
+    Fans a packed response back out into one {"episodes": [...]} per row,
+    using each episode's row_index. Episodes with a missing or out-of-range
+    row_index cannot be attributed and are dropped.
+    """
+    per_row = [{"episodes": []} for _ in range(n_rows)]
+    for ep in parsed.get("episodes", []):
+        row_index = ep.pop("row_index", None)
+        if isinstance(row_index, int) and 0 <= row_index < n_rows:
+            per_row[row_index]["episodes"].append(ep)
+    return per_row
@@ -0,0 +1,320 @@
+# pipeline.py — scrape → dedup → analyze → normalize as one incremental, fingerprinted pipeline
+import argparse
+import glob
+import hashlib
+import json
+import os
+import time
+from datetime import datetime
+
+from .metrics import RunMetrics
+from .storage import count_table_rows
+
+STATE_FILE = 'pipeline_state.json'
+
+RAW_FILE = 'reddit_data.csv'
+UNIQUE_FILE = 'reddit_data_unique.csv'
+ANALYSIS_FILE = 'weekend_activity_analysis.csv'
+NORMALIZED_FILE = 'weekend_activity_drivers.csv'
+
+
+def package_path(name):
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), name)
+
+
+def data_path(name, data_dir=None):
+    return os.path.join(data_dir or package_path('data'), name)
+
+
+def fingerprint(path):
+    """
+    sha256 of a file's content (or of every file in a Parquet dataset
+    directory), or None if it doesn't exist.
+    """
+    if os.path.isdir(path):
+        files = sorted(glob.glob(os.path.join(path, '*')))
+    elif os.path.exists(path):
+        files = [path]
+    else:
+        return None
+    digest = hashlib.sha256()
+    for file_path in files:
+        digest.update(os.path.basename(file_path).encode('utf-8'))
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def _count_lines(path):
+    if not os.path.exists(path):
+        return 0
+    with open(path, 'rb') as f:
+        return sum(1 for _ in f)
+
+
+def load_state(path=None):
+    path = path or data_path(STATE_FILE)
+    if not os.path.exists(path):
+        return {"stages": {}}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_state(state, path=None):
+    path = path or data_path(STATE_FILE)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+
+class StageIncomplete(RuntimeError):
+    """
+    Raised by a stage that ran but left work undone, e.g. rows that failed.
+    `result` is the stage's usual report dict.
+    """
+
+    def __init__(self, message, result=None):
+        super().__init__(message)
+        self.result = result or {}
+
+
+class Stage:
+    """
+    One pipeline step. `inputs` and `outputs` map names to files whose
+    fingerprints decide whether the step is up to date; `run(previous,
+    changed)` gets the stage's state from its last run and the names of
+    the inputs that changed since, and returns a dict with at least
+    rows_in, rows_out and mode, or raises StageIncomplete. A `remote` stage
+    reads from outside the tree (Reddit) and so is never considered up to
+    date.
+    """
+
+    def __init__(self, name, run, inputs=None, outputs=None, deps=(), remote=False):
+        self.name = name
+        self.run = run
+        self.inputs = inputs or {}
+        self.outputs = outputs or {}
+        self.deps = tuple(deps)
+        self.remote = remote
+
+    def input_fingerprints(self):
+        return {name: fingerprint(path) for name, path in self.inputs.items()}
+
+    def output_fingerprints(self):
+        return {name: fingerprint(path) for name, path in self.outputs.items()}
+
+
+def topological_order(stages):
+    """
+    Stages ordered so every stage comes after its dependencies.
+    """
+    by_name = {stage.name: stage for stage in stages}
+    ordered, visiting, done = [], set(), set()
+
+    def visit(stage):
+        if stage.name in done:
+            return
+        if stage.name in visiting:
+            raise ValueError(f"Pipeline has a cycle through '{stage.name}'")
+        visiting.add(stage.name)
+        for dep in stage.deps:
+            visit(by_name[dep])
+        visiting.discard(stage.name)
+        done.add(stage.name)
+        ordered.append(stage)
+
+    for stage in stages:
+        visit(stage)
+    return ordered
+
+
+def plan_stage(stage, previous, force=False):
+    """
+    (should_run, reason, changed input names) for a stage given its last state.
+    """
+    current = stage.input_fingerprints()
+    recorded = (previous or {}).get('inputs', {})
+    changed = [name for name, fp in current.items() if recorded.get(name) != fp]
+    if force:
+        return True, "forced", changed
+    if stage.remote:
+        return True, "remote source", changed
+    if previous is None:
+        return True, "never run", changed
+    if changed:
+        return True, f"changed: {', '.join(changed)}", changed
+    if previous.get('incomplete'):
+        return True, "incomplete", changed
+    outputs = stage.output_fingerprints()
+    if any(fp is None for fp in outputs.values()):
+        return True, "output missing", changed
+    if outputs != previous.get('outputs'):
+        return True, "output modified", changed
+    return False, "up to date", changed
+
+
+def run_pipeline(stages, force=(), dry_run=False, state_path=None):
+    """
+    Runs the stages in dependency order, skipping those whose input and
+    output fingerprints match the last successful run. State is saved after
+    every stage, so a failure keeps the stages that finished. A stage
+    raising StageIncomplete has its inputs recorded but not its outputs,
+    so the next run reruns it from that state (analyze resumes its ledger),
+    and the pipeline stops there. Prints and returns a per-stage report of
+    action, seconds and row counts.
+    """
+    state = load_state(state_path)
+    report = []
+    for stage in topological_order(stages):
+        previous = state['stages'].get(stage.name)
+        should_run, reason, changed = plan_stage(stage, previous, stage.name in force or 'all' in force)
+        entry = {"stage": stage.name, "action": "run" if should_run else "skip", "reason": reason}
+        report.append(entry)
+        if not should_run or dry_run:
+            print(f"{'Would run' if should_run and dry_run else 'Skipping'} {stage.name}: {reason}")
+            continue
+
+        print(f"\n=== {stage.name} ({reason}) ===")
+        start = time.perf_counter()
+        incomplete = None
+        try:
+            result = stage.run(previous, changed)
+        except StageIncomplete as e:
+            incomplete = e
+            result = e.result
+        entry.update(result)
+        entry['seconds'] = round(time.perf_counter() - start, 2)
+
+        state['stages'][stage.name] = {
+            "inputs": stage.input_fingerprints(),
+            "outputs": None if incomplete else stage.output_fingerprints(),
+            "completed_at": datetime.now().isoformat(timespec='seconds'),
+            **({"incomplete": str(incomplete)} if incomplete else {}),
+            **{k: v for k, v in entry.items() if k not in ('stage', 'action', 'reason')}
+        }
+        save_state(state, state_path)
+        if incomplete:
+            print_report(report)
+            raise incomplete
+
+    if not dry_run:
+        state['last_run'] = {"finished_at": datetime.now().isoformat(timespec='seconds'), "stages": report}
+        save_state(state, state_path)
+        print_report(report)
+    return report
+
+
+def print_report(report):
+    print(f"\n{'stage':<10}{'action':<8}{'mode':<13}{'rows in':>10}{'new':>8}{'rows out':>10}{'seconds':>9}  reason")
+    for e in report:
+        print(f"{e['stage']:<10}{e['action']:<8}{e.get('mode', '-'):<13}{e.get('rows_in', '-'):>10}"
+              f"{e.get('rows_new', '-'):>8}{e.get('rows_out', '-'):>10}{e.get('seconds', '-'):>9}  {e['reason']}")
+
+
+def default_stages(data_dir=None, analyze_options=None, scrape_options=None):
+    """
+    scrape → dedup → analyze → normalize over the standard files in data/
+    (or data_dir).
+
+    - scrape appends only submissions newer than the stored watermarks; a
+      change to specs.py (terms, subreddits, look-back) triggers a full
+      re-scrape instead.
+    - dedup reruns whenever the raw file changed.
+    - analyze resumes from its ledger, so only rows not analyzed before
+      reach the API; a change to prompts.py starts it over. Rows that
+      failed leave it incomplete, so the next run retries them.
+    - normalize rewrites the analysis with driver columns to its own file;
+      strings mapped before come from its cache, so only new ones are embedded.
+    """
+    analyze_options = analyze_options or {}
+    scrape_options = scrape_options or {}
+    raw_path = data_path(RAW_FILE, data_dir)
+    unique_path = data_path(UNIQUE_FILE, data_dir)
+    analysis_path = data_path(ANALYSIS_FILE, data_dir)
+    normalized_path = data_path(NORMALIZED_FILE, data_dir)
+
+    def scrape(previous, changed):
+        from .scrape import scrape_reddit, load_watermarks, save_watermarks, WATERMARK_FILE
+
+        full = previous is None or 'specs' in changed or not os.path.exists(raw_path)
+        rows_before = 0 if full else count_table_rows(raw_path)
+        watermark_path = data_path(WATERMARK_FILE, data_dir)
+        watermarks = {} if full else load_watermarks(watermark_path)
+        written = scrape_reddit(watermarks=watermarks, output_file=raw_path, append=not full,
+                                **scrape_options)
+        save_watermarks(watermarks, watermark_path)
+        return {"mode": "full" if full else "incremental", "rows_in": rows_before,
+                "rows_out": rows_before + written, "rows_new": written}
+
+    def dedup(previous, changed):
+        from .deduplicate import deduplicate_reddit_data
+
+        unique = deduplicate_reddit_data(raw_path, unique_path)
+        if unique is None:
+            raise RuntimeError("Deduplication failed")
+        return {"mode": "full", "rows_in": count_table_rows(raw_path), "rows_out": unique,
+                "rows_new": unique - (previous or {}).get('rows_out', 0)}
+
+    def analyze(previous, changed):
+        from .analyze import analyze_data
+
+        ledger = os.path.splitext(analysis_path)[0] + '.ledger'
+        resume = previous is not None and 'prompts' not in changed and os.path.exists(ledger)
+        done_before = _count_lines(ledger) if resume else 0
+        metrics = RunMetrics('analyze')
+        results = analyze_data(data_file=unique_path, output_file=analysis_path, resume=resume,
+                               metrics=metrics, **analyze_options)
+        result = {"mode": "delta" if resume else "full", "rows_in": count_table_rows(unique_path),
+                  "rows_out": 0 if results is None else len(results),
+                  "rows_new": _count_lines(ledger) - done_before}
+        row_errors = metrics.total('row_errors_total')
+        if row_errors:
+            raise StageIncomplete(f"{row_errors:,} rows failed; run the pipeline again to retry them", result)
+        return result
+
+    def normalize(previous, changed):
+        from .normalize import DriverMapper, normalize_analysis, DEFAULT_CACHE_FILE
+
+        mapper = DriverMapper(cache_path=data_path(DEFAULT_CACHE_FILE, data_dir))
+        normalize_analysis(analysis_path, normalized_path, mapper)
+        rows = count_table_rows(normalized_path)
+        return {"mode": "full", "rows_in": count_table_rows(analysis_path), "rows_out": rows,
+                "rows_new": rows - (previous or {}).get('rows_out', 0)}
+
+    return [
+        Stage('scrape', scrape, inputs={'specs': package_path('specs.py')},
+              outputs={'raw': raw_path}, remote=True),
+        Stage('dedup', dedup, inputs={'raw': raw_path},
+              outputs={'unique': unique_path}, deps=['scrape']),
+        Stage('analyze', analyze, inputs={'unique': unique_path, 'prompts': package_path('prompts.py')},
+              outputs={'analysis': analysis_path}, deps=['dedup']),
+        Stage('normalize', normalize, inputs={'analysis': analysis_path, 'drivers': package_path('normalize.py')},
+              outputs={'normalized': normalized_path}, deps=['analyze']),
+    ]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Run scrape → dedup → analyze → normalize, skipping up-to-date stages")
+    parser.add_argument('--no-scrape', action='store_true',
+                        help="Don't contact Reddit; start from the existing reddit_data.csv")
+    parser.add_argument('--force', nargs='+', default=[], metavar='STAGE',
+                        help="Rerun these stages (or 'all') even if up to date")
+    parser.add_argument('--dry-run', action='store_true', help="Only print what would run")
+    parser.add_argument('--concurrency', type=int, default=1)
+    parser.add_argument('--pack', action='store_true')
+    parser.add_argument('--workers', type=int, default=None, help="Scraper workers")
+    parser.add_argument('--data-dir', default=None, help="Directory of the pipeline's tables (default: data/)")
+    args = parser.parse_args()
+
+    stages = default_stages(
+        data_dir=args.data_dir,
+        analyze_options={'concurrency': args.concurrency, 'pack': args.pack},
+        scrape_options={'max_workers': args.workers} if args.workers else None)
+    if args.no_scrape:
+        stages = [stage for stage in stages if stage.name != 'scrape']
+        for stage in stages:
+            stage.deps = tuple(dep for dep in stage.deps if dep != 'scrape')
+    run_pipeline(stages, force=set(args.force), dry_run=args.dry_run,
+                 state_path=data_path(STATE_FILE, args.data_dir))
@@ -0,0 +1,223 @@
+# prefilter.py — cheap local scoring to skip rows that cannot contain a decision episode
+import argparse
+import os
+import re
+from itertools import chain
+
+import pandas as pd
+
+from .prompts import system_message
+from .specs import SEARCH_TERMS
+
+# Bodies Reddit substitutes for deleted or moderated content
+DELETED_MARKERS = {'[deleted]', '[removed]', '[ removed by reddit ]', 'deleted', 'removed'}
+
+# Phrases that signal someone deciding on, planning or reporting an outing
+DECISION_PATTERNS = [
+    r"\b(decided|deciding|decide)\b",
+    r"\b(ended up|wound up|went to|going to go|gonna go|we went|i went)\b",
+    r"\b(planning|plan to|plans? (for|this))\b",
+    r"\b(should (i|we)|thinking (of|about)|torn between|instead of|rather than)\b",
+    r"\b(this|next|last) (weekend|friday|saturday|sunday|night)\b",
+    r"\b(friday|saturday|sunday) (night|morning|afternoon)\b",
+    r"\b(tickets?|reservations?|show|concert|festival|game|market|tour|exhibit)\b",
+    r"\b(recommend|suggestions?|ideas?|anyone (been|know|tried))\b",
+    r"\b(first time|never been|finally (went|tried)|tried)\b",
+    r"\b(friends?|girlfriend|boyfriend|wife|husband|date|family|visiting|in town)\b",
+    r"\b(love|loved|enjoy(ed)?|fun|worth( it)?|check(ing)? out|explor\w*|visit\w*|hang(ing)? out|hung out)\b",
+    r"\b(museums?|restaurants?|dinner|brunch|bars?|parks?|beach|music|plays?|theat(er|re)|comedy|activit(y|ies)|events?|part(y|ies))\b",
+    r"\b(we|i)('m| am| are|'re|'ll| will)? (going|heading|staying|looking|walk(ed)?|bike|drive)\b",
+]
+
+# Minimum score to be sent to the API; see prefilter_report for the trade-off
+DEFAULT_THRESHOLD = 1.0
+
+# Words too common in the prompt to say anything about a row
+STOPWORDS = {
+    'about', 'after', 'also', 'another', 'because', 'before', 'behind', 'being', 'clear',
+    'does', 'each', 'else', 'explain', 'from', 'have', 'into', 'just', 'know', 'like',
+    'made', 'make', 'making', 'more', 'must', 'only', 'other', 'others', 'over', 'return',
+    'should', 'some', 'something', 'such', 'than', 'that', 'their', 'them', 'then', 'there',
+    'these', 'they', 'this', 'those', 'what', 'when', 'where', 'which', 'while', 'whom', 'with',
+    'would', 'your', 'json', 'object', 'schema', 'following', 'words', 'list', 'person',
+    'reddit', 'posts', 'chicago', 'things', 'include', 'includes', 'only', 'especially',
+    'level', 'grounded', 'extract', 'episode', 'episodes', 'surface', 'credible', 'vague',
+    'sarcastic', 'speculation', 'explicit', 'strongly', 'implied', 'fully', 'formed', 'expert',
+    'identifying', 'occasionally', 'real', 'world', 'moments', 'research', 'insight',
+    'demographic', 'category', 'segmentation', 'behavior', 'behavioral', 'situational',
+}
+
+
+def prompt_vocabulary(min_length=4):
+    """
+    Content words of the analysis prompt plus the words of every search term.
+    """
+    words = set(re.findall(r"[a-z]+", system_message.lower()))
+    words = {w for w in words if len(w) >= min_length and w not in STOPWORDS}
+    for term in SEARCH_TERMS:
+        words.update(w for w in re.findall(r"[a-z]+", term.lower()) if len(w) >= 3)
+    return words
+
+
+class Prefilter:
+    """
+    Scores rows locally before they are sent to the API.
+
+    Each rule is a callable (text, row) -> float; a rule returning None drops
+    the row outright (e.g. deleted comments), otherwise the scores are summed.
+    Rows scoring below `threshold` are rejected. With mode='drop' rejected rows
+    are never analyzed; with mode='defer' they are analyzed after all the rows
+    that passed.
+    """
+
+    def __init__(self, rules=None, threshold=DEFAULT_THRESHOLD, mode='drop'):
+        if mode not in ('drop', 'defer'):
+            raise ValueError(f"Unknown prefilter mode: {mode}")
+        self.rules = rules if rules is not None else default_rules()
+        self.threshold = threshold
+        self.mode = mode
+        self.kept = 0
+        self.rejected = 0
+
+    def score(self, row):
+        """
+        Total score of a row, or None if some rule drops it outright.
+        """
+        text = row['text']
+        if pd.isna(text):
+            return None
+        total = 0.0
+        for rule in self.rules:
+            value = rule(text, row)
+            if value is None:
+                return None
+            total += value
+        return total
+
+    def passes(self, row):
+        score = self.score(row)
+        return score is not None and score >= self.threshold
+
+    def _first_pass(self, rows):
+        for index, row in rows:
+            if self.passes(row):
+                self.kept += 1
+                yield index, row
+            else:
+                self.rejected += 1
+
+    def _rejected_rows(self, rows):
+        for index, row in rows:
+            if not self.passes(row):
+                yield index, row
+
+    def apply(self, make_rows):
+        """
+        Filters the (index, row) pairs produced by make_rows(). In defer mode
+        make_rows is called a second time to replay the rejected rows last.
+        """
+        kept = self._first_pass(make_rows())
+        if self.mode == 'drop':
+            return kept
+        return chain(kept, self._rejected_rows(make_rows()))
+
+
+def min_length_rule(min_chars=20):
+    """Drops rows whose text is too short to describe a decision."""
+    def rule(text, row):
+        return None if len(text.strip()) < min_chars else 0.0
+    return rule
+
+
+def deleted_rule():
+    """Drops deleted and moderator-removed content."""
+    def rule(text, row):
+        return None if text.strip().lower() in DELETED_MARKERS else 0.0
+    return rule
+
+
+def keyword_rule(vocabulary=None, weight=0.5, cap=3.0):
+    """
+    Half a point per distinct prompt/search-term word in the text, capped.
+    """
+    vocabulary = vocabulary or prompt_vocabulary()
+    def rule(text, row):
+        words = set(re.findall(r"[a-z]+", text.lower()))
+        return min(cap, weight * len(words & vocabulary))
+    return rule
+
+
+def pattern_rule(patterns=DECISION_PATTERNS, weight=1.0):
+    """
+    One point per decision-language pattern matched in the text.
+    """
+    compiled = [re.compile(p, re.IGNORECASE) for p in patterns]
+    def rule(text, row):
+        return weight * sum(1 for p in compiled if p.search(text))
+    return rule
+
+
+def classifier_rule(predict, weight=4.0):
+    """
+    Adds weight * probability from a local classifier, where predict(text)
+    returns the probability that the text holds a decision episode
+    (e.g. a scikit-learn pipeline's predict_proba(...)[0][1]).
+    """
+    def rule(text, row):
+        return weight * predict(text)
+    return rule
+
+
+def default_rules():
+    return [deleted_rule(), min_length_rule(), keyword_rule(), pattern_rule()]
+
+
+def labeled_rows(labels_path):
+    """
+    Rebuilds one input-like row per qualified source in an analysis CSV.
+    These are the positives the prefilter must not drop.
+    """
+    labels = pd.read_csv(labels_path, usecols=['source_id', 'source_type', 'original_content'])
+    labels = labels.drop_duplicates('source_id')
+    return pd.DataFrame({
+        'post_id': labels['source_id'],
+        'text': labels['original_content'],
+        'is_comment': labels['source_type'] == 'comment'
+    })
+
+
+def prefilter_report(data_file='reddit_data.csv', labels_file='weekend_activity_analysis.csv',
+                     thresholds=(0.0, 1.0, 2.0, 3.0, 4.0)):
+    """
+    For each threshold, prints the share of API calls the default rules would
+    save on `data_file` and the recall they keep on the qualified rows in
+    `labels_file`.
+    """
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    data = pd.read_csv(os.path.join(script_dir, 'data', data_file), usecols=['post_id', 'text', 'is_comment'])
+    data = data[data['text'].notna() & (data['text'].astype(str).str.strip() != '')]
+    positives = labeled_rows(os.path.join(script_dir, 'data', labels_file))
+
+    scorer = Prefilter()
+    data_scores = data.apply(scorer.score, axis=1)
+    positive_scores = positives.apply(scorer.score, axis=1)
+
+    print(f"Prefilter report: {len(data):,} rows with text in {data_file}, "
+          f"{len(positives):,} qualified sources in {labels_file}")
+    print(f"{'threshold':>10}{'calls saved':>14}{'recall':>10}")
+    report = []
+    for threshold in thresholds:
+        saved = (data_scores.isna() | (data_scores < threshold)).mean()
+        recall = (positive_scores.notna() & (positive_scores >= threshold)).mean()
+        report.append({"threshold": threshold, "calls_saved": saved, "recall": recall})
+        print(f"{threshold:>10.1f}{saved:>14.1%}{recall:>10.1%}")
+    return pd.DataFrame(report)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Estimate API calls saved and recall lost by the prefilter")
+    parser.add_argument('--data-file', default='reddit_data.csv')
+    parser.add_argument('--labels-file', default='weekend_activity_analysis.csv')
+    args = parser.parse_args()
+
+    prefilter_report(args.data_file, args.labels_file)
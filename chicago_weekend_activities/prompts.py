@@ -1,3 +1,4 @@
+import copy
 
 # System message for the AI
 system_message = """You are an expert in identifying the real-world moments when people in Chicago decide to try something new on the weekend — especially when the decision involves attending a live event, experience, or group activity. This includes comedy shows, sports games, concerts, street festivals, art markets, and themed outings. Occasionally, include food outings only if the motivation or emotional reasoning shows clear novelty, effort, or situational significance.
@@ -114,3 +115,23 @@ drivers_schema = {
     "required": ["episodes"]
 }
 
+
+# Variant of the prompt for packed requests carrying several entries at once
+packed_system_message = system_message + """
+The user message contains several separate Reddit entries, each introduced by a line "### Entry N". Analyze every entry on its own — never combine details from different entries into one episode — and set `row_index` on each episode to the N of the entry it came from. Entries without a clear decision contribute no episodes.
+"""
+
+# Schema for packed requests: every episode is tagged with the entry it came from
+packed_drivers_schema = copy.deepcopy(drivers_schema)
+packed_drivers_schema["properties"]["episodes"]["items"]["properties"]["row_index"] = {
+    "type": "integer",
+    "description": "The N of the \"### Entry N\" block this episode was extracted from"
+}
+packed_drivers_schema["properties"]["episodes"]["items"]["required"].append("row_index")
+
+
+# Follow-up prompt for a response (or one episode of it) that failed validation
+repair_system_message = """You fix JSON that failed validation against a schema. You get the validation errors, the JSON, and sometimes the Reddit text it was extracted from.
+
+Return the corrected JSON through the function call. Keep every field that is already valid exactly as it is and change only what the errors name. Enum fields must use one of the allowed values. Fill missing fields from the source text when it is given; otherwise infer them from the other fields.
+"""
@@ -0,0 +1,218 @@
+import argparse
+import contextlib
+import json
+import math
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import tempfile
+import time
+from datetime import datetime
+
+from ..analyze import analyze_data
+from ..deduplicate import deduplicate_reddit_data
+from ..fakes import FakeOpenAIClient, FakeReddit
+from ..metrics import RunMetrics
+from ..scrape import scrape_reddit
+from ..specs import SEARCH_TERMS, SUBREDDITS, POSTS_PER_SUBREDDIT
+from .benchmark_dedup import generate_scrape_file
+
+WORKLOADS = ('scrape', 'dedup', 'analyze')
+SIZES = (1000, 10000, 100000)
+
+# Appended to on every run and kept in git, so results of different
+# revisions can be compared
+RESULTS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_results.jsonl')
+
+
+def git_revision():
+    """
+    Short hash of HEAD, suffixed with -dirty when tracked files are modified;
+    None outside a git checkout.
+    """
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    try:
+        rev = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=cwd,
+                             capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=cwd,
+                               capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return f"{rev}-dirty" if dirty else rev
+
+
+def fake_reddit_for(rows, latency=0.0):
+    """
+    A FakeReddit whose full scrape yields about `rows` rows: submission pools
+    sized for ~10 rows per submission, with comments per submission adjusted
+    for the overlap between search terms.
+    """
+    pool_size = max(1, math.ceil(rows / (10 * len(SUBREDDITS))))
+    per_term = min(POSTS_PER_SUBREDDIT, pool_size)
+    unique = pool_size * (1 - (1 - per_term / pool_size) ** len(SEARCH_TERMS)) * len(SUBREDDITS)
+    comments = max(0, round(rows / unique) - 1)
+    return FakeReddit(pool_size=pool_size, submissions_per_term=per_term,
+                      comments_per_submission=comments, latency=latency)
+
+
+def _latency(metrics, name):
+    for histogram in metrics.snapshot()['histograms']:
+        if histogram['name'] == name:
+            return {"p50": histogram['p50'], "p90": histogram['p90'], "p99": histogram['p99']}
+    return {"p50": None, "p90": None, "p99": None}
+
+
+def bench_scrape(rows, tmp, options):
+    reddit = fake_reddit_for(rows, options['reddit_latency'])
+    metrics = RunMetrics('scrape')
+    start = time.perf_counter()
+    written = scrape_reddit(lambda: reddit, max_workers=options['scrape_workers'], requests_per_minute=None,
+                            output_file=os.path.join(tmp, 'scraped.csv'), metrics=metrics)
+    return {"seconds": time.perf_counter() - start, "rows": written,
+            "latency": _latency(metrics, 'reddit_comment_tree_seconds')}
+
+
+def bench_dedup(rows, tmp, options, input_path):
+    start = time.perf_counter()
+    unique = deduplicate_reddit_data(input_path, os.path.join(tmp, 'unique.csv'))
+    return {"seconds": time.perf_counter() - start, "rows": rows, "unique_rows": unique,
+            "latency": {"p50": None, "p90": None, "p99": None}}
+
+
+def bench_analyze(rows, tmp, options, input_path):
+    client = FakeOpenAIClient(latency=options['llm_latency'], error_rate=options['error_rate'])
+    metrics = RunMetrics('analyze')
+    start = time.perf_counter()
+    results = analyze_data(max_rows=rows, data_file=input_path, client=client, use_cache=False,
+                           concurrency=options['concurrency'], output_file=os.path.join(tmp, 'analysis.csv'),
+                           metrics=metrics)
+    return {"seconds": time.perf_counter() - start, "rows": rows,
+            "episodes": 0 if results is None else len(results),
+            "requests": client.request_count, "retries": metrics.total('llm_retries_total'),
+            "latency": _latency(metrics, 'llm_request_seconds')}
+
+
+def _run(workload, rows, tmp, options, input_path, queue):
+    # ru_maxrss is in kilobytes on Linux
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    try:
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            if workload == 'scrape':
+                result = bench_scrape(rows, tmp, options)
+            elif workload == 'dedup':
+                result = bench_dedup(rows, tmp, options, input_path)
+            else:
+                result = bench_analyze(rows, tmp, options, input_path)
+    except Exception as e:
+        queue.put({"error": f"{type(e).__name__}: {e}"})
+        return
+    result["baseline_rss_mb"] = baseline
+    result["peak_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    queue.put(result)
+
+
+def run_workload(workload, rows, options):
+    """
+    Runs one workload at one size in a fresh process (so its peak RSS is its
+    own), with the input generated beforehand and not timed.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        input_path = None
+        if workload in ('dedup', 'analyze'):
+            input_path = os.path.join(tmp, 'reddit_data.csv')
+            generate_scrape_file(input_path, rows, chunk_rows=min(rows, 200000))
+        queue = multiprocessing.Queue()
+        process = multiprocessing.Process(target=_run, args=(workload, rows, tmp, options, input_path, queue))
+        process.start()
+        result = queue.get()
+        process.join()
+    if "error" in result:
+        raise RuntimeError(f"{workload} at {rows:,} rows failed: {result['error']}")
+    result["rows_per_second"] = result["rows"] / result["seconds"]
+    return result
+
+
+def load_results(path=RESULTS_FILE):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def previous_result(history, record):
+    """
+    Latest earlier result of the same workload, size and options.
+    """
+    for old in reversed(history):
+        if (old['workload'], old['target_rows'], old['options']) == \
+                (record['workload'], record['target_rows'], record['options']):
+            return old
+    return None
+
+
+def _change(new, old):
+    if old is None or not old:
+        return ''
+    return f"{(new - old) / old:+.0%}"
+
+
+def print_results(records, history):
+    print(f"\n{'workload':<9}{'rows':>9}{'seconds':>9}{'rows/s':>10}{'p50 ms':>8}{'p90 ms':>8}"
+          f"{'p99 ms':>8}{'peak MB':>9}  vs previous (rows/s, peak MB)")
+    for r in records:
+        old = previous_result(history, r)
+        latency = [f"{r['latency'][p] * 1000:>8.1f}" if r['latency'][p] is not None else f"{'-':>8}"
+                   for p in ('p50', 'p90', 'p99')]
+        versus = (f"{old['git_rev']}: {_change(r['rows_per_second'], old['rows_per_second'])}, "
+                  f"{_change(r['peak_rss_mb'], old['peak_rss_mb'])}") if old else ''
+        print(f"{r['workload']:<9}{r['rows']:>9,}{r['seconds']:>9.2f}{r['rows_per_second']:>10,.0f}"
+              f"{''.join(latency)}{r['peak_rss_mb']:>9.0f}  {versus}")
+
+
+def benchmark(workloads=WORKLOADS, sizes=SIZES, llm_latency=0.0, reddit_latency=0.0,
+              concurrency=8, scrape_workers=4, error_rate=0.0, results_file=RESULTS_FILE, save=True):
+    """
+    Runs each workload (scrape_reddit against FakeReddit, deduplicate_reddit_data
+    and analyze_data against FakeOpenAIClient, on synthetic data) at each
+    size, prints throughput, request latency percentiles and peak memory
+    next to the previous result for the same settings, and appends the
+    results with the git revision to `results_file`.
+    """
+    options = {"llm_latency": llm_latency, "reddit_latency": reddit_latency, "concurrency": concurrency,
+               "scrape_workers": scrape_workers, "error_rate": error_rate}
+    history = load_results(results_file)
+    base = {"timestamp": datetime.now().isoformat(timespec='seconds'), "git_rev": git_revision(),
+            "python": platform.python_version(), "options": options}
+
+    records = []
+    for workload in workloads:
+        for rows in sizes:
+            print(f"Running {workload} at {rows:,} rows...")
+            result = run_workload(workload, rows, options)
+            records.append({**base, "workload": workload, "target_rows": rows, **result})
+
+    print_results(records, history)
+    if save:
+        with open(results_file, 'a') as f:
+            for record in records:
+                f.write(json.dumps(record) + '\n')
+        print(f"\nResults appended to {results_file}")
+    return records
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline benchmarks of scrape, dedup and analyze on fake backends")
+    parser.add_argument('--workloads', nargs='+', choices=WORKLOADS, default=list(WORKLOADS))
+    parser.add_argument('--sizes', nargs='+', type=int, default=list(SIZES))
+    parser.add_argument('--llm-latency', type=float, default=0.0, help="Seconds per fake OpenAI request")
+    parser.add_argument('--reddit-latency', type=float, default=0.0, help="Seconds per fake Reddit request")
+    parser.add_argument('--concurrency', type=int, default=8, help="analyze_data requests in flight")
+    parser.add_argument('--scrape-workers', type=int, default=4)
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Share of fake OpenAI requests failed with 429/500")
+    parser.add_argument('--no-save', action='store_true', help="Don't append the results to the results file")
+    args = parser.parse_args()
+
+    benchmark(args.workloads, args.sizes, args.llm_latency, args.reddit_latency, args.concurrency,
+              args.scrape_workers, args.error_rate, save=not args.no_save)
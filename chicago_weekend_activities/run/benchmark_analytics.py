@@ -0,0 +1,95 @@
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from ..analytics import Episodes
+from ..storage import read_table, apply_types
+from ..specs import SUBREDDITS
+
+
+def synthetic_episodes(episodes=100000, source='weekend_activity_analysis.csv', tail_share=0.3, seed=0):
+    """
+    Resamples the bundled analysis results to `episodes` rows with created_utc
+    spread over three years, random subreddits and scores, and a long tail
+    of free-text factors (tail_share of list items get a rare variant), as
+    a larger run would produce.
+    """
+    script_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    base = apply_types(read_table(os.path.join(script_dir, 'data', source)))
+    rng = np.random.default_rng(seed)
+    df = base.iloc[rng.integers(0, len(base), episodes)].reset_index(drop=True)
+    start = pd.Timestamp('2022-06-01').value // 10**9
+    df['created_utc'] = pd.to_datetime(rng.integers(start, start + 3 * 365 * 86400, episodes), unit='s')
+    df['subreddit'] = rng.choice(SUBREDDITS, episodes)
+    df['score'] = rng.zipf(1.8, episodes).clip(max=5000) - 1
+
+    def vary(items):
+        return [f"{item} {rng.integers(0, 20000)}" if rng.random() < tail_share else item for item in items]
+
+    for column in ('decision_factors', 'constraints'):
+        df[column] = [vary(items) for items in df[column]]
+    return df
+
+
+def naive_driver_counts(df):
+    """What ad-hoc analysis does today: re-parse, explode, group, unstack."""
+    exploded = apply_types(df[['decision_factors', 'subreddit']].astype(str).assign(
+        subreddit=df['subreddit'])).explode('decision_factors')
+    exploded['decision_factors'] = exploded['decision_factors'].str.strip().str.lower()
+    return exploded.groupby(['decision_factors', 'subreddit']).size().unstack(fill_value=0)
+
+
+def benchmark_analytics(episodes=100000, repeat=5):
+    """
+    Times loading synthetic episodes into analytics.Episodes and each query
+    on them (best of `repeat`), next to the naive explode/groupby approach.
+    """
+    df = synthetic_episodes(episodes)
+
+    def timed(fn):
+        best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            best = min(best, time.perf_counter() - start)
+        return best
+
+    start = time.perf_counter()
+    data = Episodes(df)
+    load = time.perf_counter() - start
+    mentions = len(data.exploded['decision_factors'])
+    unique = len(data.exploded['decision_factors']['value'].cat.categories)
+
+    queries = {
+        "driver counts by subreddit": lambda: data.driver_counts(top=20),
+        "weekly trend (top 10)": lambda: data.trend(freq='week', top=10),
+        "seasonal trend, share": lambda: data.trend(freq='season', top=10, share=True),
+        "score-weighted ranking": lambda: data.ranking(top=20),
+        "switch_type by subreddit": lambda: data.counts('switch_type', by='subreddit'),
+        "co-occurrence (top 25)": lambda: data.cooccurrence(top=25),
+        "factors x emotional_tone": lambda: data.cooccurrence(top=25, other='emotional_tone'),
+        "top pairs": lambda: data.top_pairs(n=10),
+    }
+    results = {name: timed(fn) for name, fn in queries.items()}
+    naive = timed(lambda: naive_driver_counts(df)) if repeat else None
+
+    print(f"\n{episodes:,} episodes, {mentions:,} decision factor mentions ({unique:,} distinct)")
+    print(f"Load into Episodes: {load:.2f}s (once)")
+    print(f"{'query':<30}{'ms':>9}")
+    for name, seconds in results.items():
+        print(f"{name:<30}{seconds * 1000:>9.1f}")
+    print(f"{'all queries':<30}{sum(results.values()) * 1000:>9.1f}")
+    print(f"\nNaive re-parse + explode + groupby for driver counts by subreddit: {naive * 1000:.0f}ms")
+    return {"load_seconds": load, "query_seconds": results, "naive_seconds": naive}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the analytics queries on synthetic episodes")
+    parser.add_argument('--episodes', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=5, help="Runs per query; the best is reported")
+    args = parser.parse_args()
+
+    benchmark_analytics(args.episodes, args.repeat)
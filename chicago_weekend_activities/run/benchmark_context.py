@@ -0,0 +1,89 @@
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+
+from ..analyze import analyze_data
+from ..clients import openai_client
+from .benchmark_packing import UsageCountingClient
+
+
+def run_mode(client, thread_context, data_file, threads_file, sample, concurrency):
+    """
+    Runs one uncached analysis pass over the first `sample` rows and returns
+    its yield measurements.
+    """
+    counting = UsageCountingClient(client)
+    with tempfile.TemporaryDirectory() as tmp:
+        with contextlib.redirect_stdout(io.StringIO()):
+            results = analyze_data(max_rows=sample, data_file=data_file, client=counting,
+                                   use_cache=False, concurrency=concurrency,
+                                   thread_context=thread_context, threads_file=threads_file,
+                                   output_file=os.path.join(tmp, 'analysis.csv'))
+
+    requests = max(counting.requests, 1)
+    qualified = 0 if results is None else results['source_id'].nunique()
+    episodes = 0 if results is None else len(results)
+    return {
+        "requests": counting.requests,
+        "qualified_rows": qualified,
+        "episodes": episodes,
+        "qualified_per_call": qualified / requests,
+        "episodes_per_call": episodes / requests,
+        "prompt_tokens_per_call": counting.prompt_tokens / requests,
+        # Prompt tokens dominate the bill, so this tracks yield per dollar
+        "qualified_per_million_prompt_tokens": qualified / max(counting.prompt_tokens, 1) * 1e6
+    }
+
+
+def benchmark_context(data_file='reddit_data.csv', threads_file=None, sample=200,
+                      concurrency=4, fake_latency=None):
+    """
+    Analyzes the first `sample` rows of `data_file` with comments sent under
+    only their parent URL, then under their parent post, and prints yield per
+    call for both. With fake_latency set the run goes against a local fake
+    server instead of the live API; its answers don't depend on context, so
+    that only checks the plumbing and the prompt-size cost.
+    """
+    if fake_latency is not None:
+        from ..fakes import FakeOpenAIServer
+
+        server = FakeOpenAIServer(latency=fake_latency).start()
+        client = openai_client(api_key='fake', base_url=server.base_url)
+    else:
+        server = None
+        client = openai_client()
+
+    try:
+        results = {
+            "url only": run_mode(client, False, data_file, threads_file, sample, concurrency),
+            "thread": run_mode(client, True, data_file, threads_file, sample, concurrency)
+        }
+    finally:
+        if server is not None:
+            server.stop()
+
+    print(f"\nThread context on the first {sample} rows of {data_file}"
+          f"{f' (fake server, {fake_latency}s latency)' if fake_latency is not None else ''}:")
+    print(f"{'mode':<10}{'calls':>7}{'qualified':>11}{'episodes':>10}{'qual/call':>11}"
+          f"{'ep/call':>9}{'prompt tok/call':>17}{'qual/1M tok':>13}")
+    for mode, r in results.items():
+        print(f"{mode:<10}{r['requests']:>7}{r['qualified_rows']:>11}{r['episodes']:>10}"
+              f"{r['qualified_per_call']:>11.3f}{r['episodes_per_call']:>9.3f}"
+              f"{r['prompt_tokens_per_call']:>17.0f}{r['qualified_per_million_prompt_tokens']:>13.1f}")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare analysis yield with and without thread context")
+    parser.add_argument('--data-file', default='reddit_data.csv')
+    parser.add_argument('--threads-file', default=None,
+                        help="Table to look parent posts up in (defaults to --data-file)")
+    parser.add_argument('--sample', type=int, default=200, help="Rows to analyze per mode")
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--fake-latency', type=float, default=None,
+                        help="Run against a local fake server with this latency instead of the API")
+    args = parser.parse_args()
+
+    benchmark_context(args.data_file, args.threads_file, args.sample, args.concurrency, args.fake_latency)
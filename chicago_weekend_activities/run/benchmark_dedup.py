@@ -0,0 +1,123 @@
+import argparse
+import contextlib
+import io
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from ..deduplicate import deduplicate_reddit_data
+from ..scrape import RECORD_COLUMNS
+from ..specs import SEARCH_TERMS, SUBREDDITS
+
+WORDS = ("brunch museum hike park beach concert bar friends weekend saturday sunday rain "
+         "cold cheap free tickets train drive kids dog date night market festival food").split()
+
+
+def generate_scrape_file(path, rows, chunk_rows=200000, seed=0):
+    """
+    Writes a synthetic scraper output of about `rows` rows in chunks.
+    Like the pre-registry scraper, every submission and its comments are
+    emitted once per search term it matched (1-3 terms), and 2% of comments
+    are copy-pasted with a small edit. Returns the number of rows written.
+    """
+    rng = np.random.default_rng(seed)
+    written = 0
+    submission = 0
+    first = True
+    while written < rows:
+        n_subs = max(1, chunk_rows // 12)
+        records = []
+        for _ in range(n_subs):
+            terms = list(rng.choice(SEARCH_TERMS, size=rng.integers(1, 4), replace=False))
+            subreddit = SUBREDDITS[submission % len(SUBREDDITS)]
+            created = pd.Timestamp('2024-01-01') + pd.Timedelta(seconds=int(rng.integers(0, 365 * 86400)))
+            sub_id = f"s{submission:x}"
+            n_comments = int(rng.integers(0, 8))
+            texts = [' '.join(rng.choice(WORDS, size=int(rng.integers(5, 40)))) for _ in range(n_comments + 1)]
+            for c in range(1, n_comments + 1):
+                if rng.random() < 0.02:
+                    texts[c] = texts[0] + ' ' + WORDS[c]
+            for term in terms:
+                url = f"https://www.reddit.com/r/{subreddit}/comments/{sub_id}"
+                records.append((sub_id, subreddit, f"Post {sub_id}", texts[0], created, 10, False,
+                                url, None, term, term))
+                for c in range(1, n_comments + 1):
+                    records.append((f"c{submission:x}_{c}", subreddit, None, texts[c], created, 1, True,
+                                    f"{url}/comment/c{submission:x}_{c}", url, term, term))
+            submission += 1
+        pd.DataFrame(records, columns=RECORD_COLUMNS).to_csv(
+            path, mode='w' if first else 'a', header=first, index=False)
+        first = False
+        written += len(records)
+    return written
+
+
+def _run(mode, input_path, output_path, chunksize, queue):
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        if mode == 'in-memory':
+            df = pd.read_csv(input_path)
+            df = df.drop_duplicates(subset=['is_comment', 'post_id'])
+            df.to_csv(output_path, index=False)
+        else:
+            deduplicate_reddit_data(input_path, output_path, chunksize=chunksize,
+                                    near_duplicates=mode == 'chunked+near', sort=False)
+    elapsed = time.perf_counter() - start
+    # ru_maxrss is in kilobytes on Linux
+    queue.put((elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024))
+
+
+def run_mode(mode, input_path, output_path, chunksize):
+    """
+    Runs one mode in a fresh process, so each peak RSS is its own.
+    """
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_run, args=(mode, input_path, output_path, chunksize, queue))
+    process.start()
+    elapsed, peak_mb = queue.get()
+    process.join()
+    return {"seconds": elapsed, "peak_rss_mb": peak_mb}
+
+
+def benchmark_dedup(rows=2000000, chunksize=100000, modes=('in-memory', 'chunked', 'chunked+near')):
+    """
+    Deduplicates a synthetic scrape of `rows` rows in each mode and prints
+    time, throughput and peak memory.
+    """
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        input_path = os.path.join(tmp, 'reddit_data.csv')
+        start = time.perf_counter()
+        total = generate_scrape_file(input_path, rows)
+        print(f"Generated {total:,} rows ({os.path.getsize(input_path) / 1e6:.0f}MB) "
+              f"in {time.perf_counter() - start:.1f}s")
+
+        for mode in modes:
+            output_path = os.path.join(tmp, f"unique-{mode}.csv")
+            results[mode] = run_mode(mode, input_path, output_path, chunksize)
+            results[mode]["rows_per_second"] = total / results[mode]["seconds"]
+            results[mode]["unique_rows"] = sum(len(c) for c in pd.read_csv(output_path, usecols=['post_id'],
+                                                                            chunksize=500000))
+
+    print(f"\nDedup benchmark, {total:,} input rows, chunks of {chunksize:,}:")
+    print(f"{'mode':<14}{'seconds':>9}{'rows/s':>12}{'peak MB':>9}{'unique':>11}")
+    for mode, r in results.items():
+        print(f"{mode:<14}{r['seconds']:>9.1f}{r['rows_per_second']:>12,.0f}"
+              f"{r['peak_rss_mb']:>9.0f}{r['unique_rows']:>11,}")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark deduplication on a synthetic scrape")
+    parser.add_argument('--rows', type=int, default=2000000)
+    parser.add_argument('--chunksize', type=int, default=100000)
+    parser.add_argument('--no-near', action='store_true', help="Skip the near-duplicate mode")
+    args = parser.parse_args()
+
+    modes = ('in-memory', 'chunked') if args.no_near else ('in-memory', 'chunked', 'chunked+near')
+    benchmark_dedup(args.rows, args.chunksize, modes)
@@ -0,0 +1,47 @@
+import argparse
+import os
+import tempfile
+import time
+
+from ..normalize import DriverMapper, normalize_analysis
+from ..storage import open_writer
+from .benchmark_analytics import synthetic_episodes
+
+
+def benchmark_normalize(episodes=1000000, tail_share=0.3, chunksize=100000):
+    """
+    Normalizes `episodes` synthetic episodes (see synthetic_episodes; the
+    long tail gives many distinct factor strings) twice with a fresh mapping
+    cache: cold, where every distinct string is embedded, then warm, where
+    all come from the cache.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        input_path = os.path.join(tmp, 'episodes.parquet')
+        df = synthetic_episodes(episodes, tail_share=tail_share)
+        writer = open_writer(input_path, list(df.columns), chunk_rows=chunksize)
+        writer.write_frame(df)
+        writer.close()
+        del df
+
+        results = {}
+        for run in ('cold', 'warm'):
+            mapper = DriverMapper(cache_path=os.path.join(tmp, 'cache.sqlite'))
+            start = time.perf_counter()
+            mapping = normalize_analysis(input_path, os.path.join(tmp, 'normalized.parquet'), mapper,
+                                         chunksize=chunksize)
+            results[run] = time.perf_counter() - start
+
+    print(f"\n{episodes:,} episodes, {len(mapping):,} distinct strings")
+    for run, seconds in results.items():
+        print(f"{run:<5} {seconds:>7.1f}s  {episodes / seconds:>10,.0f} episodes/s")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark driver normalization on synthetic episodes")
+    parser.add_argument('--episodes', type=int, default=1000000)
+    parser.add_argument('--tail-share', type=float, default=0.3,
+                        help="Share of factors given a rare variant, i.e. distinct strings")
+    args = parser.parse_args()
+
+    benchmark_normalize(args.episodes, args.tail_share)
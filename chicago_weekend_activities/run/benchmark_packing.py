@@ -0,0 +1,109 @@
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+import threading
+import time
+
+from ..analyze import analyze_data, count_rows
+from ..clients import openai_client
+
+
+class UsageCountingClient:
+    """
+    Wraps an OpenAI client and tallies requests and token usage of every
+    chat.completions.create call made through it.
+    """
+
+    def __init__(self, client):
+        self._client = client
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.chat = self
+        self.completions = self
+
+    def create(self, **kwargs):
+        response = self._client.chat.completions.create(**kwargs)
+        with self._lock:
+            self.requests += 1
+            if response.usage is not None:
+                self.prompt_tokens += response.usage.prompt_tokens
+                self.completion_tokens += response.usage.completion_tokens
+        return response
+
+
+def run_mode(client, pack, data_file, concurrency):
+    """
+    Runs one uncached analysis pass and returns its measurements.
+    """
+    counting = UsageCountingClient(client)
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            results = analyze_data(data_file=data_file, client=counting, use_cache=False,
+                                   pack=pack, concurrency=concurrency,
+                                   output_file=os.path.join(tmp, 'analysis.csv'))
+        elapsed = time.perf_counter() - start
+
+    template_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    rows = count_rows(os.path.join(template_dir, 'data', data_file))
+    return {
+        "requests": counting.requests,
+        "prompt_tokens_per_row": counting.prompt_tokens / rows,
+        "completion_tokens_per_row": counting.completion_tokens / rows,
+        "rows_per_minute": rows / elapsed * 60,
+        "episodes": 0 if results is None else len(results),
+        "seconds": elapsed
+    }
+
+
+def benchmark_packing(data_file='test_data.csv', concurrency=1, fake_latency=None):
+    """
+    Compares packed and unpacked analysis of `data_file`: prompt tokens per
+    row and rows per minute. With fake_latency set the run goes against a
+    local fake server with that per-request latency instead of the live API.
+    """
+    if fake_latency is not None:
+        from ..fakes import FakeOpenAIServer
+
+        server = FakeOpenAIServer(latency=fake_latency).start()
+        client = openai_client(api_key='fake', base_url=server.base_url)
+    else:
+        server = None
+        client = openai_client()
+
+    try:
+        results = {
+            "unpacked": run_mode(client, False, data_file, concurrency),
+            "packed": run_mode(client, True, data_file, concurrency)
+        }
+    finally:
+        if server is not None:
+            server.stop()
+
+    print(f"\nPacking benchmark on {data_file} (concurrency {concurrency}"
+          f"{f', fake latency {fake_latency}s' if fake_latency is not None else ''}):")
+    print(f"{'mode':<10}{'requests':>10}{'prompt tok/row':>16}{'rows/min':>12}{'episodes':>10}")
+    for mode, r in results.items():
+        print(f"{mode:<10}{r['requests']:>10}{r['prompt_tokens_per_row']:>16.0f}"
+              f"{r['rows_per_minute']:>12.1f}{r['episodes']:>10}")
+    unpacked, packed = results['unpacked'], results['packed']
+    if packed['prompt_tokens_per_row']:
+        print(f"\nPacking uses {unpacked['prompt_tokens_per_row'] / packed['prompt_tokens_per_row']:.1f}x "
+              f"fewer prompt tokens per row and runs {packed['rows_per_minute'] / unpacked['rows_per_minute']:.1f}x "
+              f"more rows per minute.")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark packed vs unpacked analysis")
+    parser.add_argument('--data-file', default='test_data.csv')
+    parser.add_argument('--concurrency', type=int, default=1)
+    parser.add_argument('--fake-latency', type=float, default=None,
+                        help="Run against a local fake server with this latency instead of the API")
+    args = parser.parse_args()
+
+    benchmark_packing(args.data_file, args.concurrency, args.fake_latency)
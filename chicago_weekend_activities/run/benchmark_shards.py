@@ -0,0 +1,114 @@
+import argparse
+import contextlib
+import multiprocessing
+import os
+import tempfile
+import time
+
+import pandas as pd
+
+from ..analyze import analyze_data
+from ..fakes import FakeOpenAIClient
+from ..shards import init_queue, merge_shards, print_status, run_worker
+from ..storage import read_table
+from .benchmark_dedup import generate_scrape_file
+
+
+def _fake_worker(name, worker, latency, concurrency, lease_seconds):
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        run_worker(name, worker=worker, client=FakeOpenAIClient(latency=latency), concurrency=concurrency,
+                   use_cache=False, lease_seconds=lease_seconds, poll_interval=0.5)
+
+
+def run_shards(name, input_path, workers, latency, concurrency, range_size, lease_seconds, kill_after=None):
+    """
+    Analyzes input_path with `workers` fake-client worker processes and
+    merges the result. With kill_after, one extra worker is killed that
+    many seconds in, mid-range, so its lease has to expire and be reclaimed.
+    Returns (seconds, merged output path).
+    """
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        init_queue(name, input_path, range_size).close()
+    start = time.perf_counter()
+    processes = [multiprocessing.Process(target=_fake_worker, args=(name, f"w{i}", latency, concurrency, lease_seconds))
+                 for i in range(workers)]
+    if kill_after is not None:
+        victim = multiprocessing.Process(target=_fake_worker, args=(name, "victim", latency, concurrency, lease_seconds))
+        victim.start()
+        time.sleep(kill_after)
+        victim.kill()
+        victim.join()
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    seconds = time.perf_counter() - start
+
+    output_path = os.path.join(name, 'merged.csv')
+    print_status(name)
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        merge_shards(name, output_path)
+    return seconds, output_path
+
+
+def episode_counts(path):
+    """Episodes per source_id in an analysis table."""
+    if not os.path.exists(path):
+        return pd.Series(dtype=int)
+    return read_table(path, columns=['source_id'])['source_id'].astype(str).value_counts().sort_index()
+
+
+def benchmark_shards(rows=10000, workers=(1, 4), latency=0.05, concurrency=4, range_size=1000,
+                     lease_seconds=3.0, kill_after=1.0):
+    """
+    Analyzes `rows` synthetic rows (duplicated per search term, like raw
+    scraper output) with the fake client: once in a single process as the
+    reference (skipping repeated post_ids, as workers do), then sharded
+    with each worker count. The last sharded run also has a worker killed
+    mid-range. Every merged output must have exactly the reference's
+    episodes per post, i.e. no row lost and none analyzed twice.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        input_path = os.path.join(tmp, 'reddit_data.csv')
+        generate_scrape_file(input_path, rows, chunk_rows=min(rows, 200000))
+        total = len(read_table(input_path, columns=['post_id']))
+
+        reference_path = os.path.join(tmp, 'reference.csv')
+        start = time.perf_counter()
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            analyze_data(data_file=input_path, client=FakeOpenAIClient(latency=latency), use_cache=False,
+                         concurrency=concurrency, output_file=reference_path, skip_repeats=True)
+        results = [("1 process", time.perf_counter() - start, None)]
+        expected = episode_counts(reference_path)
+
+        for i, n in enumerate(workers):
+            kill = kill_after if i == len(workers) - 1 else None
+            name = os.path.join(tmp, f"shards-{n}")
+            seconds, merged_path = run_shards(name, input_path, n, latency, concurrency, range_size,
+                                              lease_seconds, kill_after=kill)
+            matches = episode_counts(merged_path).equals(expected)
+            label = f"{n} workers" + (" + kill" if kill is not None else "")
+            results.append((label, seconds, matches))
+
+    print(f"\n{total:,} rows, {range_size:,} per range, {latency * 1000:.0f}ms fake latency, "
+          f"{concurrency} requests in flight per process")
+    print(f"{'run':<18}{'seconds':>9}{'rows/s':>10}  merged == reference")
+    for label, seconds, matches in results:
+        check = '' if matches is None else ('yes' if matches else 'NO')
+        print(f"{label:<18}{seconds:>9.1f}{total / seconds:>10,.0f}  {check}")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark sharded analysis with fake-client workers")
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4])
+    parser.add_argument('--latency', type=float, default=0.05, help="Seconds per fake OpenAI request")
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--range-size', type=int, default=1000)
+    parser.add_argument('--kill-after', type=float, default=1.0,
+                        help="Seconds before a worker is killed in the last run")
+    args = parser.parse_args()
+
+    benchmark_shards(args.rows, args.workers, args.latency, args.concurrency, args.range_size,
+                     kill_after=args.kill_after)
@@ -1,13 +1,14 @@
-import pandas as pd
 from ..analyze import analyze_data
+from ..storage import read_table, write_table
 import os
 import sys
 
-def test_analysis(n_rows=5):
+def test_analysis(n_rows=5, fake=False):
     """
-    Run analysis on first n rows of data as a test
+    Run analysis on a random sample of n rows of data as a test
     Args:
         n_rows (int): Number of rows to test. Defaults to 5.
+        fake (bool): Use the in-process fake OpenAI client instead of the API.
     """
     # Load the data
     # Get path to data directory relative to this script
@@ -21,17 +22,25 @@ def test_analysis(n_rows=5):
     test_path = os.path.join(template_dir, 'data', 'test_data.csv')
     
     # Now use data_path to read your CSV
-    df = pd.read_csv(data_path)
+    df = read_table(data_path)
         
-    # Take first n rows
+    # Take a random sample of n rows
     test_df = df.sample(n=n_rows)
     
     # Save test data
-    test_df.to_csv(test_path, index=False)
+    write_table(test_df, test_path)
     
     # Run analysis
     print(f"\nRunning test analysis on {n_rows} rows...")
-    results = analyze_data(max_rows=n_rows, data_file='test_data.csv')
+    client = None
+    if fake:
+        from ..fakes import FakeOpenAIClient
+        client = FakeOpenAIClient()
+    # Parents of sampled comments are looked up in the full dataset; results go
+    # to their own file so the full analysis isn't overwritten
+    results = analyze_data(max_rows=n_rows, data_file='test_data.csv', client=client,
+                           use_cache=not fake, threads_file='reddit_data.csv',
+                           output_file='test_data_analysis.csv')
     
     if results is not None:
         print("\nQualified entries found:")
@@ -45,11 +54,10 @@ def test_analysis(n_rows=5):
                 print(f"Reasoning: {row['reasoning']}")
             print("-" * 50)
     
-    # Restore full dataset
-    df.to_csv(data_path, index=False)
     return results
 
 if __name__ == "__main__":
-    # Get number of rows from command line arg, default to 5
-    n = int(sys.argv[1]) if len(sys.argv) > 1 else 5
-    test_analysis(n)
+    # Get number of rows from command line arg, default to 5; --fake runs offline
+    args = [arg for arg in sys.argv[1:] if arg != '--fake']
+    n = int(args[0]) if args else 5
+    test_analysis(n, fake='--fake' in sys.argv[1:])
@@ -1,102 +1,335 @@
 # scrape.py — treats each comment as its own row
-import praw
-import pandas as pd
 import os
+import json
+import argparse
+import threading
 from datetime import datetime, timedelta
-from .specs import SUBREDDITS, SEARCH_TERMS, POSTS_PER_SUBREDDIT, DAYS_TO_SCRAPE
+from .specs import (SUBREDDITS, SEARCH_TERMS, POSTS_PER_SUBREDDIT, DAYS_TO_SCRAPE,
+                    SCRAPE_WORKERS, REDDIT_REQUESTS_PER_MINUTE)
+from .engine import RateLimiter, run_ordered
+from .storage import open_writer, write_table, is_parquet, append_columns
+from .metrics import RunMetrics, Progress
+from .clients import new_reddit_client
 from pathlib import Path
-from dotenv import load_dotenv
 
-# Load environment variables
-load_dotenv()
+WATERMARK_FILE = 'scrape_state.json'
 
-# Initialize Reddit API client
-reddit = praw.Reddit(
-    client_id=os.getenv('REDDIT_CLIENT_ID'),
-    client_secret=os.getenv('REDDIT_CLIENT_SECRET'),
-    user_agent=os.getenv('REDDIT_USER_AGENT')
-)
+# Joins the search terms a submission matched into the search_terms column
+SEARCH_TERM_SEPARATOR = '|'
 
-def scrape_reddit():
+# Columns of every scraped row, in file order
+RECORD_COLUMNS = ['post_id', 'subreddit', 'title', 'text', 'created_utc', 'score',
+                  'is_comment', 'url', 'parent_url', 'search_term', 'search_terms']
+
+# Rows buffered in memory before each write when streaming to disk
+WRITE_CHUNK_ROWS = 1000
+
+
+def data_path(filename):
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    return os.path.join(script_dir, 'data', filename)
+
+
+def watermark_key(subreddit_name, term):
+    return f"{subreddit_name}|{term}"
+
+
+def load_watermarks(filename=WATERMARK_FILE):
+    """
+    Newest submission timestamp seen per subreddit/term by earlier runs.
+    """
+    path = data_path(filename)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_watermarks(watermarks, filename=WATERMARK_FILE):
+    path = data_path(filename)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(watermarks, f, indent=2, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+
+def post_record(submission, subreddit_name, terms):
+    return {
+        'post_id': submission.id,
+        'subreddit': subreddit_name,
+        'title': submission.title,
+        'text': submission.selftext,
+        'created_utc': datetime.fromtimestamp(submission.created_utc),
+        'score': submission.score,
+        'is_comment': False,
+        'url': f"https://www.reddit.com/r/{subreddit_name}/comments/{submission.id}",
+        'parent_url': None,
+        'search_term': terms[0],
+        'search_terms': SEARCH_TERM_SEPARATOR.join(terms)
+    }
+
+
+def comment_record(comment, submission_id, subreddit_name, terms):
+    return {
+        'post_id': comment.id,
+        'subreddit': subreddit_name,
+        'title': None,  # Comments don't have titles
+        'text': comment.body,
+        'created_utc': datetime.fromtimestamp(comment.created_utc),
+        'score': comment.score,
+        'is_comment': True,
+        'url': f"https://www.reddit.com/r/{subreddit_name}/comments/{submission_id}/comment/{comment.id}",
+        'parent_url': f"https://www.reddit.com/r/{subreddit_name}/comments/{submission_id}",
+        'search_term': terms[0],
+        'search_terms': SEARCH_TERM_SEPARATOR.join(terms)
+    }
+
+
+class SubmissionRegistry:
+    """
+    In-run registry of matched submissions, keyed by subreddit and id.
+    Remembers every search term a submission matched, in first-seen order,
+    so its comment tree is fetched and emitted only once.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self.matches = 0
+
+    def add(self, subreddit_name, term, submission):
+        self.matches += 1
+        key = (subreddit_name, submission.id)
+        if key in self._entries:
+            self._entries[key][2].append(term)
+        else:
+            self._entries[key] = (subreddit_name, submission, [term])
+
+    def __iter__(self):
+        return iter(self._entries.values())
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def duplicate_matches(self):
+        return self.matches - len(self._entries)
+
+
+def scrape_reddit(reddit_factory=None, max_workers=SCRAPE_WORKERS,
+                  requests_per_minute=REDDIT_REQUESTS_PER_MINUTE, watermarks=None,
+                  output_file=None, append=False, metrics=None, progress=False):
     """
     Scrapes posts and comments from r/chicago and r/AskChicago that match the search terms.
     Returns a DataFrame with post and comment data.
+
+    With `output_file` set, rows are instead streamed to that table (CSV, or a
+    Parquet dataset for .parquet names) in the data
+    directory in chunks of WRITE_CHUNK_ROWS as comment trees arrive, and the
+    number of rows written is returned. Memory stays bounded, and if the run
+    dies the rows written so far remain in `<output_file>.partial`.
+    With append=True they are added to the end of an existing file.
+
+    Subreddit/term searches and comment-tree fetches run on a pool of
+    `max_workers` threads, each with its own client from reddit_factory(),
+    sharing one requests-per-minute budget.
+
+    A submission matching several search terms is fetched and emitted once:
+    `search_term` holds the first term it matched and `search_terms` all of
+    them, joined by SEARCH_TERM_SEPARATOR.
+
+    Pass a watermarks dict (see load_watermarks) for an incremental run: only
+    submissions newer than the stored high-water mark of their subreddit/term
+    are fetched, and the dict is updated in place with the new marks. A
+    mark never passes a submission whose comment tree failed to fetch, so
+    the next run fetches it again.
+
+    Requests per subreddit/term, request latencies, rate-limit waits and
+    errors go to `metrics` (a metrics.RunMetrics, created if not given),
+    written next to `output_file` as `<base>.metrics.json` and `<base>.prom`.
+    With progress=True a live progress bar tracks the comment-tree fetches.
     """
-    records = []
+    if output_file is not None and append:
+        # Before any request: an existing file with other columns can't be appended to
+        append_columns(data_path(output_file), RECORD_COLUMNS)
+    reddit_factory = reddit_factory or new_reddit_client
     cutoff_date = datetime.utcnow() - timedelta(days=DAYS_TO_SCRAPE)
+    limiter = RateLimiter(requests_per_minute=requests_per_minute)
+    local = threading.local()
+    metrics = metrics or RunMetrics('scrape')
+    requests = {'search': 0, 'comments': 0}
+    requests_lock = threading.Lock()
+
+    def count_request(kind, subreddit_name, term):
+        with metrics.timer('rate_limit_wait_seconds'):
+            limiter.acquire()
+        metrics.inc('reddit_requests_total', kind=kind, subreddit=subreddit_name, term=term)
+        with requests_lock:
+            requests[kind] += 1
+
+    def client():
+        if not hasattr(local, 'reddit'):
+            local.reddit = reddit_factory()
+        return local.reddit
+
+    def search(pair):
+        """Submissions in the date window (and past the watermark) for one subreddit/term."""
+        subreddit_name, term = pair
+        subreddit = client().subreddit(subreddit_name)
+        watermark = watermarks.get(watermark_key(subreddit_name, term)) if watermarks is not None else None
+
+        if watermark is not None:
+            # Newest first, so the scan can stop at the first already-seen submission
+            listing = subreddit.search(term, sort='new', time_filter='all', limit=POSTS_PER_SUBREDDIT)
+        else:
+            listing = subreddit.search(term, time_filter='all', limit=POSTS_PER_SUBREDDIT)
 
-    for subreddit_name in SUBREDDITS:
-        print(f"Searching r/{subreddit_name}...")
-        subreddit = reddit.subreddit(subreddit_name)
-
-        for term in SEARCH_TERMS:
-            print(f"  Searching for: {term}")
-            term_posts = 0
-            term_comments = 0
-            try:
-                # Search posts in the subreddit
-                for submission in subreddit.search(term, time_filter='all', limit=POSTS_PER_SUBREDDIT):
-                    if datetime.fromtimestamp(submission.created_utc) < cutoff_date:
-                        continue
-
-                    term_posts += 1
-                    # Add the post itself
-                    records.append({
-                        'post_id': submission.id,
-                        'subreddit': subreddit_name,
-                        'title': submission.title,
-                        'text': submission.selftext,
-                        'created_utc': datetime.fromtimestamp(submission.created_utc),
-                        'score': submission.score,
-                        'is_comment': False,
-                        'url': f"https://www.reddit.com/r/{subreddit_name}/comments/{submission.id}",
-                        'parent_url': None,
-                        'search_term': term
-                    })
-
-                    # Add comments from the post
-                    submission.comments.replace_more(limit=0)  # Remove MoreComments objects
-                    for comment in submission.comments.list():
-                        if datetime.fromtimestamp(comment.created_utc) < cutoff_date:
-                            continue
-
-                        term_comments += 1
-                        records.append({
-                            'post_id': comment.id,
-                            'subreddit': subreddit_name,
-                            'title': None,  # Comments don't have titles
-                            'text': comment.body,
-                            'created_utc': datetime.fromtimestamp(comment.created_utc),
-                            'score': comment.score,
-                            'is_comment': True,
-                            'url': f"https://www.reddit.com/r/{subreddit_name}/comments/{submission.id}/comment/{comment.id}",
-                            'parent_url': f"https://www.reddit.com/r/{subreddit_name}/comments/{submission.id}",
-                            'search_term': term
-                        })
-
-                print(f"    Found {term_posts} posts and {term_comments} comments for '{term}'")
-
-            except Exception as e:
-                print(f"Error searching for '{term}' in r/{subreddit_name}: {str(e)}")
+        submissions = []
+        with metrics.timer('reddit_search_seconds'):
+            for i, submission in enumerate(listing):
+                if i % 100 == 0:
+                    # Listings come back a page of 100 at a time
+                    count_request('search', subreddit_name, term)
+                if watermark is not None and submission.created_utc <= watermark:
+                    break
+                if datetime.fromtimestamp(submission.created_utc) < cutoff_date:
+                    continue
+                submissions.append(submission)
+        return submissions
+
+    def fetch_comments(entry):
+        """Comment records for one submission, fetched with this worker's client."""
+        subreddit_name, submission, terms = entry
+        count_request('comments', subreddit_name, terms[0])
+        with metrics.timer('reddit_comment_tree_seconds'):
+            tree = client().submission(id=submission.id).comments
+            tree.replace_more(limit=0)  # Remove MoreComments objects
+        return [
+            comment_record(comment, submission.id, subreddit_name, terms)
+            for comment in tree.list()
+            if datetime.fromtimestamp(comment.created_utc) >= cutoff_date
+        ]
+
+    # Search every subreddit/term first, so each submission's full set of
+    # matching terms is known before its rows are written
+    registry = SubmissionRegistry()
+    counts = {}
+    pairs = [(subreddit_name, term) for subreddit_name in SUBREDDITS for term in SEARCH_TERMS]
+    with metrics.stage('search'):
+        searches = list(run_ordered(search, pairs, max_workers))
+    for (subreddit_name, term), submissions in searches:
+        if isinstance(submissions, Exception):
+            metrics.inc('reddit_errors_total', kind='search', error=type(submissions).__name__)
+            print(f"Error searching for '{term}' in r/{subreddit_name}: {str(submissions)}")
+            continue
+        counts[(subreddit_name, term)] = [len(submissions), 0]
+        for submission in submissions:
+            registry.add(subreddit_name, term, submission)
+
+    if output_file is not None:
+        writer = open_writer(data_path(output_file), RECORD_COLUMNS,
+                             chunk_rows=WRITE_CHUNK_ROWS, append=append)
+        emit = writer.write_many
+    else:
+        writer = None
+        records = []
+        emit = records.extend
+
+    # Oldest submission per subreddit/term whose comment tree failed
+    failed = {}
+    bar = Progress(len(registry), label='Comment trees', enabled=progress)
+    try:
+        with metrics.stage('comments'):
+            for (subreddit_name, submission, terms), comments in run_ordered(fetch_comments, registry, max_workers):
+                bar.update()
+                # Add the post itself
+                emit([post_record(submission, subreddit_name, terms)])
+                metrics.inc('rows_total', kind='post')
+                if isinstance(comments, Exception):
+                    metrics.inc('reddit_errors_total', kind='comments', error=type(comments).__name__)
+                    bar.write(f"Error fetching comments for {submission.id} in r/{subreddit_name}: {str(comments)}")
+                    for term in terms:
+                        key = (subreddit_name, term)
+                        failed[key] = min(submission.created_utc, failed.get(key, submission.created_utc))
+                    continue
+                # Add comments from the post
+                emit(comments)
+                metrics.inc('rows_total', len(comments), kind='comment')
+                for term in terms:
+                    counts[(subreddit_name, term)][1] += len(comments)
+        bar.close()
+    except BaseException:
+        if writer is not None:
+            partial = writer.close(complete=False)
+            print(f"Scrape interrupted; {writer.rows_written} rows kept in {partial}")
+        raise
+
+    if watermarks is not None:
+        # A mark covers everything up to it, so it stops short of a failed submission
+        for (subreddit_name, term), submissions in searches:
+            if isinstance(submissions, Exception):
                 continue
+            oldest_failed = failed.get((subreddit_name, term))
+            done = [s.created_utc for s in submissions if oldest_failed is None or s.created_utc < oldest_failed]
+            if done:
+                key = watermark_key(subreddit_name, term)
+                watermarks[key] = max(max(done), watermarks.get(key, max(done)))
+
+    for (subreddit_name, term), (term_posts, term_comments) in counts.items():
+        print(f"r/{subreddit_name} '{term}': found {term_posts} posts and {term_comments} comments")
 
-    df = pd.DataFrame(records)
+    print(f"\nRequests: {requests['search']} search pages, {requests['comments']} comment trees "
+          f"for {len(registry)} unique submissions ({registry.matches} matches)")
+    print(f"Saved {registry.duplicate_matches} comment-tree requests on submissions matching several terms")
+
+    metrics.set('rows_per_second', metrics.total('rows_total') / max(metrics.elapsed(), 1e-9))
+    latency = '\n'.join(filter(None, (metrics.report('reddit_search_seconds'),
+                                      metrics.report('reddit_comment_tree_seconds'))))
+    if latency:
+        print(latency)
+
+    if writer is not None:
+        path = writer.close()
+        print(f"Saved {writer.rows_written} records to {path}")
+        print(f"Metrics written to {metrics.write(path)}")
+        return writer.rows_written
+
+    import pandas as pd
+
+    df = pd.DataFrame(records, columns=RECORD_COLUMNS)
     return df
 
-def save_to_csv(df, filename='reddit_data.csv'):
+def save_to_csv(df, filename='reddit_data.csv', append=False):
     """
     Saves the DataFrame to a CSV file in the data directory.
     Creates the directory if it doesn't exist.
+    With append=True the rows are added to an existing file instead.
+    A .parquet filename writes typed Parquet instead (append not supported).
     """
     script_dir = os.path.dirname(os.path.abspath(__file__))
     data_dir = os.path.join(script_dir, 'data')
     os.makedirs(data_dir, exist_ok=True)
-    
+
     filepath = os.path.join(data_dir, filename)
-    df.to_csv(filepath, index=False)
+    if append and os.path.exists(filepath) and not is_parquet(filepath):
+        df[append_columns(filepath, df.columns)].to_csv(filepath, mode='a', header=False, index=False)
+    else:
+        write_table(df, filepath)
     print(f"Saved {len(df)} records to {filepath}")
 
 if __name__ == "__main__":
-    df = scrape_reddit()
-    save_to_csv(df)
+    parser = argparse.ArgumentParser(description="Scrape Reddit for weekend activity discussions")
+    parser.add_argument('--workers', type=int, default=SCRAPE_WORKERS,
+                        help="Concurrent searches and comment-tree fetches")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Only fetch submissions newer than the last run and append them")
+    parser.add_argument('--format', choices=['csv', 'parquet'], default='csv',
+                        help="Write data/reddit_data.csv or a data/reddit_data.parquet dataset")
+    parser.add_argument('--progress', action='store_true',
+                        help="Show a live progress bar over the comment-tree fetches")
+    args = parser.parse_args()
 
+    watermarks = load_watermarks() if args.incremental else {}
+    scrape_reddit(max_workers=args.workers, watermarks=watermarks,
+                  output_file=f"reddit_data.{args.format}", append=args.incremental,
+                  progress=args.progress)
+    # Only advance the watermarks once the rows they cover are on disk
+    save_watermarks(watermarks)
@@ -0,0 +1,503 @@
+# shards.py — analysis split into row ranges, leased to worker processes from a shared SQLite queue
+import argparse
+import json
+import multiprocessing
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+from .analyze import analyze_data
+from .engine import RateLimiter
+from .journal import AnalysisJournal
+from .metrics import RunMetrics
+from .storage import count_table_rows, open_writer
+
+# Rows per leased range: big enough that reading up to a range start and
+# per-range output files stay cheap next to its API calls
+DEFAULT_RANGE_SIZE = 5000
+
+# Seconds a lease lasts unless renewed; workers renew it every third of that
+DEFAULT_LEASE_SECONDS = 600
+
+# Leases of a range (failures and expiries) before it is marked failed
+MAX_ATTEMPTS = 3
+
+# Seconds an idle worker waits before asking again while others hold leases
+POLL_INTERVAL = 10
+
+
+def shard_dir(name):
+    """Directory of a sharded run (queue and per-range outputs), under data/shards/."""
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    return os.path.join(script_dir, 'data', 'shards', name)
+
+
+def default_worker_id():
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class WorkQueue:
+    """
+    Durable queue of row ranges in SQLite, shared by worker processes on one
+    host, or on several through a shared filesystem with working file locks.
+
+    A range is pending, leased, done or failed. lease() hands the first
+    pending range (or one whose lease expired) to a worker until
+    `lease_until`; the worker renews it while it works and completes it with
+    the name of its output. Every lease gets a new id, and only the current
+    lease can be renewed, released or completed, so a stalled worker that
+    lost its range to another can't record it too: every range ends up done
+    exactly once, and merge reads only the output recorded for it. Leases
+    are timed by the wall clock, so hosts' clocks must agree (NTP) to well
+    within a lease.
+    """
+
+    def __init__(self, path, timeout=60):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=timeout, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS ranges (
+                start INTEGER PRIMARY KEY,
+                stop INTEGER NOT NULL,
+                state TEXT NOT NULL DEFAULT 'pending',
+                worker TEXT,
+                lease_id TEXT,
+                lease_until REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                output TEXT,
+                error TEXT
+            )
+        """)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+
+    def _transaction(self, fn):
+        """Runs fn(conn) in one write transaction, holding the database lock throughout."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(self._conn)
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            return result
+
+    def meta(self):
+        with self._lock:
+            return {key: json.loads(value) for key, value in self._conn.execute("SELECT key, value FROM meta")}
+
+    def setup(self, total_rows, range_size, **settings):
+        """
+        Splits rows [0, total_rows) into ranges of range_size, once. Opening
+        an existing queue with the same total and settings is a no-op;
+        different ones raise ValueError, since ranges already done would
+        not match.
+        """
+        meta = dict(settings, total_rows=total_rows, range_size=range_size)
+
+        def create(conn):
+            existing = {key: json.loads(value) for key, value in conn.execute("SELECT key, value FROM meta")}
+            if existing:
+                if existing != meta:
+                    changed = sorted(key for key in set(existing) | set(meta) if existing.get(key) != meta.get(key))
+                    raise ValueError(f"Queue {self.path} was created with different settings ({', '.join(changed)}); "
+                                     f"use another --name or --reset")
+                return False
+            conn.executemany("INSERT INTO meta (key, value) VALUES (?, ?)",
+                             [(key, json.dumps(value)) for key, value in meta.items()])
+            conn.executemany("INSERT INTO ranges (start, stop) VALUES (?, ?)",
+                             [(start, min(start + range_size, total_rows))
+                              for start in range(0, total_rows, range_size)])
+            return True
+
+        return self._transaction(create)
+
+    def lease(self, worker, lease_seconds=DEFAULT_LEASE_SECONDS):
+        """
+        Leases the next available range to worker. Returns (start, stop,
+        lease_id), or None when no range is pending or expired. Expired
+        leases that used up MAX_ATTEMPTS are marked failed instead of handed
+        out again.
+        """
+        def take(conn):
+            now = time.time()
+            conn.execute("UPDATE ranges SET state = 'failed', error = 'lease expired', worker = NULL "
+                         "WHERE state = 'leased' AND lease_until < ? AND attempts >= ?", (now, MAX_ATTEMPTS))
+            row = conn.execute("SELECT start, stop FROM ranges WHERE state = 'pending' "
+                               "OR (state = 'leased' AND lease_until < ?) ORDER BY start LIMIT 1", (now,)).fetchone()
+            if row is None:
+                return None
+            lease_id = uuid.uuid4().hex[:12]
+            conn.execute("UPDATE ranges SET state = 'leased', worker = ?, lease_id = ?, lease_until = ?, "
+                         "attempts = attempts + 1 WHERE start = ?", (worker, lease_id, now + lease_seconds, row[0]))
+            return row[0], row[1], lease_id
+
+        return self._transaction(take)
+
+    def _update_held(self, start, lease_id, assignments, values):
+        def update(conn):
+            cursor = conn.execute(f"UPDATE ranges SET {assignments} "
+                                  "WHERE start = ? AND lease_id = ? AND state = 'leased'",
+                                  (*values, start, lease_id))
+            return cursor.rowcount == 1
+
+        return self._transaction(update)
+
+    def renew(self, start, lease_id, lease_seconds=DEFAULT_LEASE_SECONDS):
+        """Extends a lease on a range. False if the lease was lost."""
+        return self._update_held(start, lease_id, "lease_until = ?", (time.time() + lease_seconds,))
+
+    def complete(self, start, lease_id, output):
+        """Marks a range done with its output. False if the lease was lost (the output must be discarded)."""
+        return self._update_held(start, lease_id, "state = 'done', lease_until = NULL, output = ?, error = NULL",
+                                 (output,))
+
+    def release(self, start, lease_id, error):
+        """
+        Gives a range back after a failed attempt: pending again, or failed
+        once it used up MAX_ATTEMPTS. False if the lease was lost.
+        """
+        return self._update_held(start, lease_id, "state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                                 "worker = NULL, lease_until = NULL, error = ?", (MAX_ATTEMPTS, error))
+
+    def retry_failed(self):
+        """Puts failed ranges back in the queue with fresh attempts. Returns how many."""
+        return self._transaction(lambda conn: conn.execute(
+            "UPDATE ranges SET state = 'pending', attempts = 0 WHERE state = 'failed'").rowcount)
+
+    def has_open(self):
+        """True while any range is pending or leased."""
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM ranges WHERE state IN ('pending', 'leased') LIMIT 1").fetchone() is not None
+
+    def ranges(self):
+        """All ranges as dicts, in row order."""
+        with self._lock:
+            cursor = self._conn.execute("SELECT * FROM ranges ORDER BY start")
+            columns = [c[0] for c in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor]
+
+    def close(self):
+        self._conn.close()
+
+
+class LeaseHeartbeat:
+    """
+    Renews a lease every third of its length on a background thread while
+    the range is analyzed. `lost` is set once a renewal fails.
+    """
+
+    def __init__(self, queue, start, lease_id, lease_seconds):
+        self.lost = False
+        self._stop = threading.Event()
+
+        def run():
+            while not self._stop.wait(lease_seconds / 3):
+                try:
+                    if not queue.renew(start, lease_id, lease_seconds):
+                        self.lost = True
+                        return
+                except sqlite3.OperationalError:
+                    # Database busy for longer than its timeout; the lease is still good for a while
+                    pass
+
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+
+def init_queue(name, data_file='reddit_data.csv', range_size=DEFAULT_RANGE_SIZE, pack=False,
+               thread_context=True, threads_file=None, reset=False):
+    """
+    Creates the queue of a sharded run over data_file. The analysis
+    settings are stored with it, so every worker analyzes the same way.
+    Returns the WorkQueue.
+    """
+    directory = shard_dir(name)
+    path = os.path.join(directory, 'queue.sqlite')
+    if reset:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+    os.makedirs(os.path.join(directory, 'ranges'), exist_ok=True)
+
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    total_rows = count_table_rows(os.path.join(script_dir, 'data', data_file))
+    queue = WorkQueue(path)
+    created = queue.setup(total_rows, range_size, data_file=data_file, pack=pack,
+                          thread_context=thread_context, threads_file=threads_file)
+    ranges = len(queue.ranges())
+    if created:
+        print(f"📋 Queue {name}: {total_rows:,} rows of {data_file} in {ranges:,} ranges of {range_size:,}")
+    else:
+        print(f"📋 Queue {name} already exists ({ranges:,} ranges)")
+    return queue
+
+
+def open_queue(name):
+    path = os.path.join(shard_dir(name), 'queue.sqlite')
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"No queue {name!r}; create it with: python -m chicago_weekend_activities.shards init")
+    return WorkQueue(path)
+
+
+def _range_output(name, start, stop, lease_id):
+    """Output file of one lease of a range, relative to data/ (as analyze_data takes it)."""
+    return os.path.join('shards', name, 'ranges', f"{start:010d}-{stop:010d}.{lease_id}.csv")
+
+
+def run_worker(name, worker=None, api_key_env=None, requests_per_minute=None, tokens_per_minute=None,
+               concurrency=1, max_retries=5, use_cache=True, lease_seconds=DEFAULT_LEASE_SECONDS,
+               client=None, max_ranges=None, poll_interval=POLL_INTERVAL):
+    """
+    Leases ranges from the queue and analyzes them with analyze_data until
+    none are left. Each range is written to its own output (journal,
+    ledger, usage and metrics included) and recorded in the queue only if
+    every row succeeded and the lease is still held; otherwise it goes back
+    to the queue, and a lost lease's output is ignored by merge.
+
+    The API key is read from the environment variable api_key_env (default
+    OPENAI_API_KEY), and the request/token budget is this worker's own,
+    shared by all of its ranges. Rows already answered, e.g. by an earlier
+    attempt at a range, come from the shared response cache.
+    Returns the number of ranges completed.
+    """
+    from .clients import openai_client
+
+    worker = worker or default_worker_id()
+    queue = open_queue(name)
+    settings = queue.meta()
+    if client is None:
+        api_key = os.getenv(api_key_env) if api_key_env else None
+        if api_key_env and not api_key:
+            raise ValueError(f"{api_key_env} is not set")
+        client = openai_client(api_key=api_key)
+    limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+
+    completed = 0
+    print(f"👷 Worker {worker} on queue {name}")
+    while max_ranges is None or completed < max_ranges:
+        lease = queue.lease(worker, lease_seconds)
+        if lease is None:
+            if not queue.has_open():
+                break
+            # Others hold the remaining ranges; wait in case a lease expires
+            time.sleep(poll_interval)
+            continue
+
+        start, stop, lease_id = lease
+        output = _range_output(name, start, stop, lease_id)
+        print(f"👷 {worker}: rows {start:,}-{stop:,}")
+        heartbeat = LeaseHeartbeat(queue, start, lease_id, lease_seconds)
+        metrics = RunMetrics('analyze')
+        error = None
+        try:
+            analyze_data(max_rows=stop - start, start_row=start, data_file=settings['data_file'],
+                         concurrency=concurrency, max_retries=max_retries, client=client, use_cache=use_cache,
+                         pack=settings['pack'], output_file=output, thread_context=settings['thread_context'],
+                         threads_file=settings['threads_file'], metrics=metrics, limiter=limiter,
+                         skip_repeats=True)
+            row_errors = metrics.total('row_errors_total')
+            if row_errors:
+                error = f"{row_errors:,} rows failed"
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        finally:
+            heartbeat.stop()
+
+        if error is not None:
+            queue.release(start, lease_id, error)
+            print(f"❌ {worker}: rows {start:,}-{stop:,} released for a retry ({error})")
+        elif heartbeat.lost or not queue.complete(start, lease_id, output):
+            print(f"⚠️  {worker}: lost the lease on rows {start:,}-{stop:,}; another worker owns them now")
+        else:
+            completed += 1
+            print(f"✅ {worker}: rows {start:,}-{stop:,} done")
+
+    queue.close()
+    print(f"👷 Worker {worker} finished: {completed:,} ranges")
+    return completed
+
+
+def _worker_process(name, worker, api_key_env, options):
+    run_worker(name, worker=worker, api_key_env=api_key_env, **options)
+
+
+def run_workers(name, workers=2, api_key_envs=None, **options):
+    """
+    Starts `workers` worker processes on this host and waits for them.
+    Worker i reads its API key from api_key_envs[i % len(api_key_envs)],
+    so each key (and its rate budget) can serve one or more workers.
+    """
+    host = socket.gethostname()
+    processes = []
+    for i in range(workers):
+        api_key_env = api_key_envs[i % len(api_key_envs)] if api_key_envs else None
+        process = multiprocessing.Process(target=_worker_process,
+                                          args=(name, f"{host}-w{i}", api_key_env, options))
+        process.start()
+        processes.append(process)
+    for process in processes:
+        process.join()
+    return [process.exitcode for process in processes]
+
+
+def print_status(name):
+    """
+    Prints the ranges and rows per state, the current leases and the
+    errors of failed ranges. Returns the counts per state.
+    """
+    queue = open_queue(name)
+    ranges = queue.ranges()
+    queue.close()
+    now = time.time()
+    states = {}
+    for r in ranges:
+        state = 'expired' if r['state'] == 'leased' and r['lease_until'] < now else r['state']
+        count, rows = states.get(state, (0, 0))
+        states[state] = (count + 1, rows + r['stop'] - r['start'])
+
+    total_rows = sum(r['stop'] - r['start'] for r in ranges)
+    print(f"\n📋 Queue {name}: {len(ranges):,} ranges, {total_rows:,} rows")
+    for state in ('done', 'leased', 'expired', 'pending', 'failed'):
+        if state in states:
+            count, rows = states[state]
+            print(f"  {state:<8} {count:>7,} ranges {rows:>11,} rows")
+    for r in ranges:
+        if r['state'] == 'leased':
+            print(f"  rows {r['start']:,}-{r['stop']:,}: {r['worker']} (attempt {r['attempts']}, "
+                  f"lease {r['lease_until'] - now:+.0f}s)")
+        elif r['state'] == 'failed':
+            print(f"  rows {r['start']:,}-{r['stop']:,} failed: {r['error']}")
+    return {state: count for state, (count, _) in states.items()}
+
+
+def merge_shards(name, output_file='weekend_activity_analysis.csv', partial=False):
+    """
+    Combines the outputs recorded for done ranges, in row order, into one
+    table in the standard output schema (CSV or Parquet by extension).
+    A post_id analyzed in more than one range (a duplicate input row) keeps
+    only its first range's episodes. Refuses to merge while ranges are
+    still open or failed, unless partial=True.
+    Returns the number of episodes written.
+    """
+    queue = open_queue(name)
+    ranges = queue.ranges()
+    queue.close()
+    unfinished = [r for r in ranges if r['state'] != 'done']
+    if unfinished and not partial:
+        raise ValueError(f"{len(unfinished):,} of {len(ranges):,} ranges are not done; "
+                         f"run more workers, retry failed ranges or merge with --partial")
+
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    # Read only: a stalled worker may still hold one of these files open
+    journals = [AnalysisJournal(os.path.join(script_dir, 'data', r['output']), resume=True, compact=False)
+                for r in ranges if r['state'] == 'done']
+
+    # A post's episodes come from the first range whose ledger has it
+    seen = set()
+    owned = []
+    for journal in journals:
+        owned.append(journal.completed - seen)
+        seen |= journal.completed
+
+    def episodes():
+        for journal, post_ids in zip(journals, owned):
+            for chunk in journal.iter_episodes():
+                yield [ep for ep in chunk if str(ep.get('source_id')) in post_ids]
+
+    columns = {}
+    for chunk in episodes():
+        for ep in chunk:
+            columns.update(dict.fromkeys(ep))
+    output_path = os.path.join(script_dir, 'data', output_file)
+    if not columns:
+        print("No episodes to merge.")
+        return 0
+
+    writer = open_writer(output_path, list(columns), chunk_rows=10000)
+    for chunk in episodes():
+        writer.write_many(chunk)
+    writer.close()
+
+    rows = sum(len(journal.completed) for journal in journals)
+    print(f"🧩 Merged {len(journals):,} ranges ({len(seen):,} posts, {rows - len(seen):,} duplicate rows skipped): "
+          f"{writer.rows_written:,} episodes written to {output_path}")
+    if unfinished:
+        print(f"⚠️  Partial merge: {len(unfinished):,} ranges left out")
+    return writer.rows_written
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sharded analysis: a work queue of row ranges shared by worker processes")
+    parser.add_argument('--name', default=None, help="Queue name under data/shards/ (defaults to the data file's name)")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    init = commands.add_parser('init', help="Split the data file into ranges")
+    init.add_argument('--range-size', type=int, default=DEFAULT_RANGE_SIZE, help="Rows per leased range")
+    init.add_argument('--pack', action='store_true', help="Analyze several short rows per request")
+    init.add_argument('--no-thread-context', action='store_true',
+                      help="Send comments with only their parent URL instead of the parent post")
+    init.add_argument('--threads-file', default=None, help="Table to look parent posts up in")
+    init.add_argument('--reset', action='store_true', help="Replace an existing queue of this name")
+
+    for command, help_text in (('work', "Analyze ranges until the queue is empty"),
+                               ('run', "Start several workers on this host")):
+        sub = commands.add_parser(command, help=help_text)
+        if command == 'work':
+            sub.add_argument('--worker', default=None, help="Worker id (defaults to host-pid)")
+            sub.add_argument('--api-key-env', default=None,
+                             help="Environment variable holding this worker's API key (default OPENAI_API_KEY)")
+        else:
+            sub.add_argument('--workers', type=int, default=2, help="Worker processes to start")
+            sub.add_argument('--api-key-env', nargs='+', default=None,
+                             help="Environment variables holding API keys, assigned to workers in turn")
+        sub.add_argument('--concurrency', type=int, default=1, help="API requests in flight per worker")
+        sub.add_argument('--rpm', type=int, default=None, help="Requests-per-minute limit per worker")
+        sub.add_argument('--tpm', type=int, default=None, help="Tokens-per-minute limit per worker")
+        sub.add_argument('--max-retries', type=int, default=5, help="Retries for rate-limit and server errors")
+        sub.add_argument('--no-cache', action='store_true', help="Bypass the response cache")
+        sub.add_argument('--lease-seconds', type=float, default=DEFAULT_LEASE_SECONDS,
+                         help="Seconds before a silent worker's range is handed to another")
+
+    commands.add_parser('status', help="Show ranges per state, leases and failures")
+    retry = commands.add_parser('retry', help="Put failed ranges back in the queue")
+    merge = commands.add_parser('merge', help="Combine done ranges into the standard output table")
+    merge.add_argument('--output-file', default='weekend_activity_analysis.csv',
+                       help="Output table in the data directory")
+    merge.add_argument('--partial', action='store_true', help="Merge even though some ranges are not done")
+    for sub in commands.choices.values():
+        sub.add_argument('--data-file', default='reddit_data.csv',
+                         help="Input table in the data directory; names the queue unless --name is given")
+    args = parser.parse_args()
+
+    data_file = args.data_file
+    name = args.name or os.path.splitext(os.path.basename(data_file))[0]
+
+    if args.command == 'init':
+        init_queue(name, data_file, args.range_size, pack=args.pack, thread_context=not args.no_thread_context,
+                   threads_file=args.threads_file, reset=args.reset).close()
+    elif args.command in ('work', 'run'):
+        options = dict(requests_per_minute=args.rpm, tokens_per_minute=args.tpm, concurrency=args.concurrency,
+                       max_retries=args.max_retries, use_cache=not args.no_cache, lease_seconds=args.lease_seconds)
+        if args.command == 'work':
+            run_worker(name, worker=args.worker, api_key_env=args.api_key_env, **options)
+        else:
+            run_workers(name, args.workers, api_key_envs=args.api_key_env, **options)
+        print_status(name)
+    elif args.command == 'status':
+        print_status(name)
+    elif args.command == 'retry':
+        queue = open_queue(name)
+        print(f"🔁 {queue.retry_failed():,} failed ranges queued again")
+        queue.close()
+    elif args.command == 'merge':
+        merge_shards(name, args.output_file, partial=args.partial)
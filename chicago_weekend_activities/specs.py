@@ -19,3 +19,9 @@ DAYS_TO_SCRAPE = 3*365  # Look back 3 years
 
 # Number of posts to fetch per subreddit
 POSTS_PER_SUBREDDIT = 1000  # Maximum number of posts to fetch from each subreddit
+
+# Number of concurrent scraper workers (subreddit/term searches and comment-tree fetches)
+SCRAPE_WORKERS = 4
+
+# Reddit API budget for OAuth clients, shared by all scraper workers
+REDDIT_REQUESTS_PER_MINUTE = 100
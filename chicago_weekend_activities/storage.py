@@ -0,0 +1,407 @@
+# storage.py — reading and writing the tables in data/, as CSV or Parquet
+import argparse
+import ast
+import glob
+import os
+import shutil
+import time
+
+from .prompts import drivers_schema
+
+_episode_properties = drivers_schema["properties"]["episodes"]["items"]["properties"]
+
+# Columns holding lists; CSV stores them as stringified Python lists
+LIST_COLUMNS = ['decision_factors', 'constraints', 'options_considered', 'drivers']
+
+# Enum columns, stored as categoricals (dictionary-encoded in Parquet)
+CATEGORY_COLUMNS = {
+    'user_type': _episode_properties['user_type']['enum'],
+    'switch_type': _episode_properties['switch_type']['enum'],
+    'emotional_tone': _episode_properties['emotional_tone']['enum'],
+    'source_type': ['post', 'comment'],
+}
+
+DATETIME_COLUMNS = ['created_utc']
+
+PARQUET_EXTENSION = '.parquet'
+
+
+def is_parquet(path):
+    path = path.rstrip('/')
+    if path.endswith('.partial'):
+        path = path[:-len('.partial')]
+    return path.endswith(PARQUET_EXTENSION)
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("Parquet storage needs pyarrow: pip install pyarrow")
+    return pyarrow
+
+
+def _fsync(f):
+    f.flush()
+    os.fsync(f.fileno())
+
+
+def _parse_list(value):
+    """Turns a stringified list from CSV back into a list."""
+    if isinstance(value, list):
+        return value
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    if not isinstance(value, str) or not value.strip():
+        return []
+    try:
+        parsed = ast.literal_eval(value)
+    except (ValueError, SyntaxError):
+        return [value]
+    return list(parsed) if isinstance(parsed, (list, tuple)) else [str(parsed)]
+
+
+def enum_categorical(values, categories):
+    """
+    Categorical of `values` with the enum's `categories` first, then any
+    other values seen (older prompts, model drift), so none become missing.
+    """
+    import pandas as pd
+
+    seen = pd.Series(values).dropna().unique()
+    extra = sorted((value for value in seen if value not in categories), key=str)
+    return pd.Categorical(values, categories=list(categories) + extra)
+
+
+def apply_types(df):
+    """
+    Gives known columns their proper types: real lists for LIST_COLUMNS,
+    categoricals for enums (see enum_categorical), datetimes for timestamps.
+    """
+    import pandas as pd
+
+    for column in LIST_COLUMNS:
+        if column in df.columns:
+            df[column] = df[column].map(_parse_list)
+    for column, categories in CATEGORY_COLUMNS.items():
+        if column in df.columns:
+            df[column] = enum_categorical(df[column], categories)
+    for column in DATETIME_COLUMNS:
+        if column in df.columns and not pd.api.types.is_datetime64_any_dtype(df[column]):
+            df[column] = pd.to_datetime(df[column], errors='coerce')
+    return df
+
+
+def _parquet_ready(df):
+    """
+    Typed copy of a chunk for Parquet. Remaining object columns become
+    strings, so a chunk where e.g. `title` is all missing still gets the
+    same column type as the chunks next to it.
+    """
+    df = apply_types(df.copy())
+    for column in df.columns:
+        if df[column].dtype == object and column not in LIST_COLUMNS:
+            df[column] = df[column].astype('string')
+    return df
+
+
+def read_table(path, columns=None, typed=False, chunksize=None):
+    """
+    Reads a CSV file or a Parquet file/dataset directory into a DataFrame,
+    loading only `columns` if given. Parquet keeps its stored types; with
+    typed=True CSV input is converted the same way (lists, categoricals,
+    datetimes). With chunksize, returns an iterator of DataFrames instead.
+    """
+    import pandas as pd
+
+    if is_parquet(path):
+        _require_pyarrow()
+        if chunksize is not None:
+            return _iter_parquet(path, columns, chunksize)
+        return pd.read_parquet(path, columns=columns)
+
+    if chunksize is not None:
+        chunks = pd.read_csv(path, usecols=columns, chunksize=chunksize)
+        return (apply_types(chunk) for chunk in chunks) if typed else chunks
+    df = pd.read_csv(path, usecols=columns)
+    return apply_types(df) if typed else df
+
+
+def _parquet_files(path):
+    if os.path.isdir(path):
+        return sorted(glob.glob(os.path.join(path, '*' + PARQUET_EXTENSION)))
+    return [path]
+
+
+def _iter_parquet(path, columns, chunksize):
+    import pyarrow.parquet as pq
+
+    for file_path in _parquet_files(path):
+        parquet_file = pq.ParquetFile(file_path)
+        for batch in parquet_file.iter_batches(batch_size=chunksize, columns=columns):
+            yield batch.to_pandas()
+
+
+def write_table(df, path):
+    """
+    Writes a DataFrame as CSV or, for a .parquet path, as typed Parquet.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    if is_parquet(path):
+        _require_pyarrow()
+        _parquet_ready(df).to_parquet(path, index=False)
+    else:
+        df.to_csv(path, index=False)
+
+
+def table_columns(path):
+    """
+    Column names of a table, from the CSV header or the Parquet schema.
+    """
+    import pandas as pd
+
+    if is_parquet(path):
+        import pyarrow.parquet as pq
+
+        _require_pyarrow()
+        return list(pq.ParquetFile(_parquet_files(path)[0]).schema_arrow.names)
+    return list(pd.read_csv(path, nrows=0).columns)
+
+
+def count_table_rows(path):
+    """
+    Number of rows, read from Parquet metadata or by scanning one CSV column.
+    """
+    import pandas as pd
+
+    if is_parquet(path):
+        import pyarrow.parquet as pq
+
+        _require_pyarrow()
+        return sum(pq.ParquetFile(p).metadata.num_rows for p in _parquet_files(path))
+    first_column = pd.read_csv(path, nrows=0).columns[0]
+    return sum(len(chunk) for chunk in pd.read_csv(path, usecols=[first_column], chunksize=100000))
+
+
+def append_columns(path, columns):
+    """
+    Column order to append rows with `columns` to the existing table at
+    `path`: the table's own. Raises ValueError when the table has
+    different columns, e.g. a file written before a column was added,
+    since appended rows would no longer line up with its header.
+    A missing or empty table takes `columns` as they are.
+    """
+    if (not os.path.exists(path) or (os.path.isfile(path) and os.path.getsize(path) == 0)
+            or (os.path.isdir(path) and not _parquet_files(path))):
+        return list(columns)
+    existing = table_columns(path)
+    if set(existing) != set(columns):
+        missing = [c for c in columns if c not in existing]
+        extra = [c for c in existing if c not in columns]
+        raise ValueError(f"Can't append to {path}: its columns differ (missing {missing or 'none'}, "
+                         f"unexpected {extra or 'none'}); rewrite it with a full run instead")
+    return existing
+
+
+class ChunkedCsvWriter:
+    """
+    Streams records (dicts) to a CSV file in chunks of `chunk_rows`, so the
+    producer never holds more than one chunk in memory.
+
+    A fresh file is written as `<path>.partial` and renamed over `path` by
+    close(); every flushed chunk is fsynced, so after a crash the .partial
+    file holds every complete chunk and reads like any other CSV.
+    With append=True chunks go straight onto the end of an existing `path`,
+    in its column order (see append_columns).
+    """
+
+    def __init__(self, path, columns, chunk_rows=1000, append=False):
+        import pandas as pd
+
+        self.path = path
+        self.columns = list(columns)
+        self.chunk_rows = chunk_rows
+        self.rows_written = 0
+        self._buffer = []
+        self._append = append and os.path.exists(path) and os.path.getsize(path) > 0
+        self._target = path if self._append else path + '.partial'
+        if self._append:
+            self.columns = append_columns(path, self.columns)
+        else:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            pd.DataFrame(columns=self.columns).to_csv(self._target, index=False)
+
+    def write(self, record):
+        self._buffer.append(record)
+        if len(self._buffer) >= self.chunk_rows:
+            self.flush()
+
+    def write_many(self, records):
+        for record in records:
+            self.write(record)
+
+    def write_frame(self, df):
+        """
+        Writes a whole DataFrame as one chunk, after anything still buffered.
+        """
+        self.flush()
+        if len(df):
+            self._write_chunk(df[self.columns])
+            self.rows_written += len(df)
+
+    def _write_chunk(self, chunk):
+        with open(self._target, 'a', encoding='utf-8', newline='') as f:
+            chunk.to_csv(f, header=False, index=False)
+            _fsync(f)
+
+    def flush(self):
+        import pandas as pd
+
+        if not self._buffer:
+            return
+        self._write_chunk(pd.DataFrame(self._buffer, columns=self.columns))
+        self.rows_written += len(self._buffer)
+        self._buffer = []
+
+    def close(self, complete=True):
+        """
+        Flushes the last chunk. With complete=True a fresh file replaces `path`;
+        with complete=False it is left at `<path>.partial`.
+        """
+        self.flush()
+        if complete and self._target != self.path:
+            # os.replace can't swap a file for a directory or back (e.g. a
+            # single Parquet file rewritten as a dataset), so clear the way
+            if os.path.isdir(self.path):
+                shutil.rmtree(self.path)
+            elif os.path.isdir(self._target) and os.path.exists(self.path):
+                os.remove(self.path)
+            os.replace(self._target, self.path)
+        return self._target if not complete else self.path
+
+
+class ChunkedParquetWriter(ChunkedCsvWriter):
+    """
+    ChunkedCsvWriter for Parquet: `path` is a dataset directory and every
+    chunk becomes its own part file. A Parquet file is unreadable until its
+    footer is written, so separate parts keep partial output usable exactly
+    as with CSV; read_table reads the directory as one table.
+    """
+
+    def __init__(self, path, columns, chunk_rows=1000, append=False):
+        _require_pyarrow()
+        self.path = path
+        self.columns = list(columns)
+        self.chunk_rows = chunk_rows
+        self.rows_written = 0
+        self._buffer = []
+        self._append = append and os.path.isdir(path)
+        self._target = path if self._append else path + '.partial'
+        if not self._append:
+            if os.path.isdir(self._target):
+                shutil.rmtree(self._target)
+            os.makedirs(self._target)
+        self._parts = len(_parquet_files(self._target))
+        if self._append:
+            self.columns = append_columns(path, self.columns)
+
+    def _write_chunk(self, chunk):
+        part_path = os.path.join(self._target, f"part-{self._parts:05d}{PARQUET_EXTENSION}")
+        _parquet_ready(chunk).to_parquet(part_path + '.tmp', index=False)
+        os.replace(part_path + '.tmp', part_path)
+        self._parts += 1
+
+
+def open_writer(path, columns, chunk_rows=1000, append=False):
+    """
+    Chunked writer for `path`: Parquet dataset for .parquet paths, else CSV.
+    """
+    writer_class = ChunkedParquetWriter if is_parquet(path) else ChunkedCsvWriter
+    return writer_class(path, columns, chunk_rows=chunk_rows, append=append)
+
+
+def convert_csv_to_parquet(csv_path, parquet_path=None, chunksize=50000):
+    """
+    Converts a CSV table to typed Parquet, one row group per chunk, so files
+    larger than memory convert too. Returns the Parquet path.
+    """
+    import pandas as pd
+
+    pa = _require_pyarrow()
+    import pyarrow.parquet as pq
+
+    parquet_path = parquet_path or os.path.splitext(csv_path)[0] + PARQUET_EXTENSION
+    writer = None
+    schema = None
+    try:
+        for chunk in pd.read_csv(csv_path, chunksize=chunksize):
+            table = pa.Table.from_pandas(_parquet_ready(chunk), preserve_index=False)
+            if writer is None:
+                schema = table.schema
+                writer = pq.ParquetWriter(parquet_path, schema)
+            writer.write_table(table.cast(schema))
+    finally:
+        if writer is not None:
+            writer.close()
+    return parquet_path
+
+
+def compare_formats(csv_path, columns=None):
+    """
+    Converts csv_path to Parquet and prints file sizes plus full and
+    projected read timings for both formats.
+    """
+    import pandas as pd
+
+    parquet_path = convert_csv_to_parquet(csv_path)
+
+    def timed(fn):
+        start = time.perf_counter()
+        fn()
+        return time.perf_counter() - start
+
+    columns = columns or list(pd.read_csv(csv_path, nrows=0).columns[:2])
+    df = read_table(csv_path, typed=True)
+    results = {
+        "csv": {
+            "bytes": os.path.getsize(csv_path),
+            "read_s": timed(lambda: read_table(csv_path)),
+            "read_typed_s": timed(lambda: read_table(csv_path, typed=True)),
+            "read_columns_s": timed(lambda: read_table(csv_path, columns=columns)),
+            "write_s": timed(lambda: df.to_csv(csv_path + '.tmp', index=False)),
+        },
+        "parquet": {
+            "bytes": os.path.getsize(parquet_path),
+            "read_s": timed(lambda: read_table(parquet_path)),
+            "read_typed_s": timed(lambda: read_table(parquet_path)),
+            "read_columns_s": timed(lambda: read_table(parquet_path, columns=columns)),
+            "write_s": timed(lambda: write_table(df, parquet_path + '.tmp')),
+        }
+    }
+    os.remove(csv_path + '.tmp')
+    os.remove(parquet_path + '.tmp')
+
+    print(f"{len(df):,} rows, projected columns: {', '.join(columns)}")
+    print(f"{'format':<9}{'size':>12}{'read':>10}{'read+types':>12}{'projected':>11}{'write':>10}")
+    for name, r in results.items():
+        print(f"{name:<9}{r['bytes'] / 1024:>10.0f}KB{r['read_s']:>9.3f}s{r['read_typed_s']:>11.3f}s"
+              f"{r['read_columns_s']:>10.3f}s{r['write_s']:>9.3f}s")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert data/ CSV tables to Parquet")
+    parser.add_argument('files', nargs='*', default=['weekend_activity_analysis.csv'],
+                        help="CSV files in the data directory")
+    parser.add_argument('--compare', action='store_true',
+                        help="Also print file sizes and read/write timings versus CSV")
+    args = parser.parse_args()
+
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    for name in args.files:
+        csv_path = os.path.join(script_dir, 'data', name)
+        if args.compare:
+            compare_formats(csv_path)
+        else:
+            print(f"Wrote {convert_csv_to_parquet(csv_path)}")
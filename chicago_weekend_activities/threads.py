@@ -0,0 +1,146 @@
+# threads.py — thread store and context assembly for analysis requests
+import re
+
+from .storage import read_table, table_columns
+from .tokens import count_tokens, trim_to_tokens
+
+# Longest excerpt of a parent post's body shown above a comment
+PARENT_BODY_TOKENS = 350
+
+# Parent prefixes kept built for reuse by sibling comments
+PREFIX_CACHE_SIZE = 10000
+
+POST_ID_PATTERN = re.compile(r'/comments/([A-Za-z0-9]+)')
+
+EXCERPT_LABEL = "Post text: "
+COMMENT_LABEL = "\nComment:\n"
+
+
+def parent_id(row):
+    """
+    Post id a comment replies to, parsed from its parent_url, or None.
+    """
+    parent_url = row.get('parent_url')
+    if not isinstance(parent_url, str):
+        return None
+    match = POST_ID_PATTERN.search(parent_url)
+    return match.group(1) if match else None
+
+
+def _clean(value):
+    return value.strip() if isinstance(value, str) else ''
+
+
+class ThreadStore:
+    """
+    Index of post_id -> (title, text) for every post in a scraped table,
+    which is what comments need to be shown with their parent. Comments
+    themselves are not stored: their parent comes from their own row.
+    """
+
+    def __init__(self):
+        self._posts = {}
+
+    @classmethod
+    def from_table(cls, path, chunksize=50000):
+        """
+        Builds the store from a scraped table, reading only the columns it
+        needs, chunk by chunk.
+        """
+        store = cls()
+        columns = [c for c in ['post_id', 'is_comment', 'title', 'text'] if c in table_columns(path)]
+        for chunk in read_table(path, columns=columns, chunksize=chunksize):
+            posts = chunk[~chunk['is_comment'].astype(bool)]
+            titles = posts['title'] if 'title' in posts else [None] * len(posts)
+            for post_id, title, text in zip(posts['post_id'], titles, posts['text']):
+                store.add(post_id, title, text)
+        return store
+
+    def add(self, post_id, title, text):
+        post_id = str(post_id)
+        if post_id not in self._posts:
+            self._posts[post_id] = (_clean(title), _clean(text))
+
+    def get(self, post_id):
+        return self._posts.get(str(post_id)) if post_id is not None else None
+
+    def __len__(self):
+        return len(self._posts)
+
+    def __contains__(self, post_id):
+        return str(post_id) in self._posts
+
+
+class ContextBuilder:
+    """
+    Builds the user message for a row within `max_tokens`.
+
+    Posts are sent with their title. Comments are sent under their parent
+    post's title and an excerpt of its body, so the model sees what the
+    comment answers; the comment itself always gets priority over the
+    excerpt. Text over budget is trimmed at sentence boundaries
+    (tokens.trim_to_tokens). The parent prefix is built once per parent and
+    shared by all of its sibling comments, which also keeps their prompts
+    byte-identical up to the comment. Comments whose parent isn't in the
+    store fall back to the parent URL.
+    """
+
+    def __init__(self, store=None, max_tokens=2500, parent_body_tokens=PARENT_BODY_TOKENS,
+                 prefix_cache_size=PREFIX_CACHE_SIZE):
+        self.store = store if store is not None else ThreadStore()
+        self.max_tokens = max_tokens
+        self.parent_body_tokens = parent_body_tokens
+        self.prefix_cache_size = prefix_cache_size
+        self._prefixes = {}
+
+    def parent_context(self, post_id, subreddit):
+        """
+        (header, body excerpt, excerpt tokens) shown above every comment on
+        post_id, or None if the post is unknown.
+        """
+        key = (post_id, subreddit)
+        if key in self._prefixes:
+            return self._prefixes[key]
+        parent = self.store.get(post_id)
+        if parent is None:
+            return None
+        title, text = parent
+        header = f"[Comment on a post in r/{subreddit}]\nPost title: {title or '(untitled)'}\n"
+        excerpt = trim_to_tokens(text, self.parent_body_tokens, tail_share=0)
+        context = (header, excerpt, count_tokens(excerpt))
+        if len(self._prefixes) >= self.prefix_cache_size:
+            self._prefixes.clear()
+        self._prefixes[key] = context
+        return context
+
+    def _with_header(self, header, text):
+        return header + trim_to_tokens(text, self.max_tokens - count_tokens(header))
+
+    def build(self, row):
+        """
+        User message for a row, or None for rows without usable text.
+        """
+        text = row['text']
+        if not isinstance(text, str) or not text.strip():
+            return None
+
+        if not row['is_comment']:
+            title = _clean(row.get('title'))
+            if not title:
+                return self._with_header(f"[Original post: {row['url']}]\n\n", text)
+            return self._with_header(f"[Post in r/{row['subreddit']}]\nTitle: {title}\n\n", text)
+
+        context = self.parent_context(parent_id(row), row['subreddit'])
+        if context is None:
+            return self._with_header(f"[Comment in response to post: {row['parent_url']}]\n\n", text)
+
+        header, excerpt, excerpt_tokens = context
+        header_tokens = count_tokens(header)
+        # The comment has priority: a long one shrinks the parent excerpt
+        body = COMMENT_LABEL + trim_to_tokens(text, self.max_tokens - header_tokens - count_tokens(COMMENT_LABEL))
+        room = self.max_tokens - header_tokens - count_tokens(body) - count_tokens(EXCERPT_LABEL) - 1
+        if excerpt_tokens > room:
+            excerpt = trim_to_tokens(excerpt, room, tail_share=0)
+        if excerpt:
+            header += f"{EXCERPT_LABEL}{excerpt}\n"
+        return header + body
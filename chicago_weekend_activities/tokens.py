@@ -0,0 +1,267 @@
+# tokens.py — local token counting, token-budget trimming and per-run usage accounting
+import json
+import os
+import re
+import threading
+from functools import lru_cache
+
+# Tokenizer of the gpt-4o family
+ENCODING_NAME = 'o200k_base'
+
+# Chat format overhead: tokens per message, plus the reply primer
+TOKENS_PER_MESSAGE = 3
+REPLY_PRIMER_TOKENS = 3
+
+# USD per 1M tokens: (prompt, cached prompt, completion). Batch API jobs pay half.
+PRICES = {
+    'gpt-4o-2024-08-06': (2.50, 1.25, 10.00),
+    'gpt-4o': (2.50, 1.25, 10.00),
+    'gpt-4o-mini': (0.15, 0.075, 0.60),
+}
+BATCH_DISCOUNT = 0.5
+
+TRUNCATION_MARK = ' […]'
+
+# Pre-tokenizer in the spirit of o200k's split pattern: contractions, words
+# with their leading space, 1-3 digit groups, punctuation runs, whitespace
+_PIECE_PATTERN = re.compile(
+    r"'(?:s|t|re|ve|m|ll|d)\b| ?[^\W\d_]+| ?\d{1,3}| ?[^\s\w]+|\s+", re.IGNORECASE)
+
+# Sentence-sized pieces of text, each keeping its trailing whitespace; line
+# breaks also end a piece, so paragraphs and list items stay whole
+_UNIT_PATTERN = re.compile(r'.*?(?:[.!?]+["\')\]]*(?=\s)|\n|$)\s*', re.DOTALL)
+
+
+@lru_cache(maxsize=1)
+def _encoding():
+    """
+    tiktoken's encoding if the package and its encoding file are available
+    locally, else None (tiktoken downloads encodings on first use, which
+    fails offline).
+    """
+    try:
+        import tiktoken
+        return tiktoken.get_encoding(ENCODING_NAME)
+    except Exception:
+        return None
+
+
+def _heuristic_count(text):
+    """
+    Token count estimate from the pre-tokenizer pieces: common words are
+    one token, long words about one per 4 extra letters, non-ASCII
+    characters (emoji, accents) roughly one each.
+    """
+    count = 0
+    for piece in _PIECE_PATTERN.findall(text):
+        stripped = piece.strip()
+        if not stripped:
+            count += 1
+        elif stripped[0].isalpha():
+            count += 1 + max(0, len(stripped) - 8) // 4
+        else:
+            count += 1 + (len(stripped) - 1) // 2
+        count += sum(ord(c) > 127 for c in stripped)
+    return count
+
+
+def count_tokens(text):
+    """
+    Tokens in text under the model's tokenizer: exact with tiktoken,
+    estimated otherwise.
+    """
+    if not text:
+        return 0
+    encoding = _encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return _heuristic_count(text)
+
+
+def tokenizer_name():
+    return f"tiktoken/{ENCODING_NAME}" if _encoding() is not None else "heuristic"
+
+
+@lru_cache(maxsize=32)
+def _overhead(system_message, schema_json):
+    return (count_tokens(system_message) + count_tokens(schema_json)
+            + 2 * TOKENS_PER_MESSAGE + REPLY_PRIMER_TOKENS)
+
+
+def request_overhead_tokens(system_message, schema):
+    """
+    Prompt tokens a request spends before its user content: the system
+    message, the function schema and the chat format overhead.
+    """
+    return _overhead(system_message, json.dumps(schema, sort_keys=True))
+
+
+def prompt_tokens(system_message, schema, content):
+    """
+    Prompt tokens of one request with `content` as its user message.
+    """
+    return request_overhead_tokens(system_message, schema) + count_tokens(content)
+
+
+def _cut_words(text, max_tokens):
+    """Longest word-boundary prefix of text within max_tokens."""
+    words = re.split(r'(?<=\s)', text)
+    low, high = 0, len(words)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if count_tokens(''.join(words[:mid])) <= max_tokens:
+            low = mid
+        else:
+            high = mid - 1
+    return ''.join(words[:low])
+
+
+def _take_units(units, max_tokens):
+    """Leading units (sentences) whose total stays within max_tokens."""
+    taken = []
+    used = 0
+    for unit in units:
+        tokens = count_tokens(unit)
+        if used + tokens > max_tokens:
+            break
+        taken.append(unit)
+        used += tokens
+    return taken
+
+
+def trim_to_tokens(text, max_tokens, tail_share=0.25):
+    """
+    Shortens text to at most max_tokens at sentence and paragraph boundaries.
+
+    The head of the text is kept, plus up to `tail_share` of the budget from
+    its end, since a story's outcome ("so we ended up going to...") tends to
+    come last; the cut is marked with TRUNCATION_MARK. A first sentence that
+    alone exceeds the budget is cut at a word boundary instead.
+    """
+    if max_tokens <= 0:
+        return ''
+    if count_tokens(text) <= max_tokens:
+        return text
+
+    budget = max_tokens - count_tokens(TRUNCATION_MARK)
+    units = [u for u in _UNIT_PATTERN.findall(text) if u]
+    head = _take_units(units, int(budget * (1 - tail_share)))
+    if not head:
+        return _cut_words(text, budget).rstrip() + TRUNCATION_MARK
+
+    head_text = ''.join(head).rstrip()
+    if tail_share <= 0:
+        return head_text + TRUNCATION_MARK
+    remaining = budget - count_tokens(head_text) - 1
+    tail = _take_units(reversed(units[len(head):]), remaining)
+    tail_text = ''.join(reversed(tail)).strip()
+    if not tail_text:
+        return head_text + TRUNCATION_MARK
+    return f"{head_text}{TRUNCATION_MARK}\n{tail_text}"
+
+
+def estimate_cost(model, prompt_tokens, completion_tokens, cached_prompt_tokens=0, batch=False):
+    """
+    USD cost of the given token counts, or None for models without a price.
+    """
+    if model not in PRICES:
+        return None
+    prompt_price, cached_price, completion_price = PRICES[model]
+    cost = ((prompt_tokens - cached_prompt_tokens) * prompt_price
+            + cached_prompt_tokens * cached_price
+            + completion_tokens * completion_price) / 1e6
+    return cost * BATCH_DISCOUNT if batch else cost
+
+
+def _usage_value(usage, name, default=0):
+    value = usage.get(name, default) if isinstance(usage, dict) else getattr(usage, name, default)
+    return value if value is not None else default
+
+
+class UsageMeter:
+    """
+    Thread-safe per-run token accounting: what the API reported for every
+    call, what the response cache saved, and the estimated cost.
+    """
+
+    def __init__(self, model, batch=False):
+        self.model = model
+        self.batch = batch
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.cached_prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cache_hits = 0
+        self.saved_prompt_tokens = 0
+
+    def record(self, usage):
+        """
+        Adds one API response's usage (object or dict, as in response.usage).
+        """
+        if usage is None:
+            return
+        details = _usage_value(usage, 'prompt_tokens_details', None)
+        cached = _usage_value(details, 'cached_tokens') if details is not None else 0
+        with self._lock:
+            self.requests += 1
+            self.prompt_tokens += _usage_value(usage, 'prompt_tokens')
+            self.completion_tokens += _usage_value(usage, 'completion_tokens')
+            self.cached_prompt_tokens += cached
+
+    def record_cache_hit(self, prompt_tokens_estimate):
+        """
+        Counts a response served from the local cache instead of the API.
+        """
+        with self._lock:
+            self.cache_hits += 1
+            self.saved_prompt_tokens += prompt_tokens_estimate
+
+    def summary(self):
+        cost = estimate_cost(self.model, self.prompt_tokens, self.completion_tokens,
+                             self.cached_prompt_tokens, self.batch)
+        return {
+            "model": self.model,
+            "batch": self.batch,
+            "tokenizer": tokenizer_name(),
+            "requests": self.requests,
+            "prompt_tokens": self.prompt_tokens,
+            "cached_prompt_tokens": self.cached_prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "total_tokens": self.prompt_tokens + self.completion_tokens,
+            "avg_prompt_tokens": self.prompt_tokens / self.requests if self.requests else 0,
+            "avg_completion_tokens": self.completion_tokens / self.requests if self.requests else 0,
+            "estimated_cost_usd": None if cost is None else round(cost, 4),
+            "response_cache_hits": self.cache_hits,
+            "saved_prompt_tokens_estimate": self.saved_prompt_tokens,
+        }
+
+    def write(self, output_path):
+        """
+        Writes the summary next to the results as `<output base>.usage.json`.
+        Returns the path written.
+        """
+        path = os.path.splitext(output_path)[0] + '.usage.json'
+        with open(path + '.tmp', 'w') as f:
+            json.dump(self.summary(), f, indent=2)
+        os.replace(path + '.tmp', path)
+        return path
+
+    def report(self):
+        s = self.summary()
+        cost = f"${s['estimated_cost_usd']:.2f}" if s['estimated_cost_usd'] is not None else "n/a"
+        return (f"Token usage: {s['requests']:,} API calls, {s['prompt_tokens']:,} prompt "
+                f"({s['cached_prompt_tokens']:,} cached) + {s['completion_tokens']:,} completion tokens, "
+                f"~{cost}; {s['response_cache_hits']:,} cache hits saved ~{s['saved_prompt_tokens_estimate']:,} prompt tokens")
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="Count tokens of a file or stdin")
+    parser.add_argument('path', nargs='?', help="Text file (reads stdin if omitted)")
+    args = parser.parse_args()
+
+    text = open(args.path, encoding='utf-8').read() if args.path else sys.stdin.read()
+    print(f"{count_tokens(text):,} tokens ({tokenizer_name()}), {len(text):,} characters")
@@ -0,0 +1,262 @@
+# validate.py — compiled checks of model responses against drivers_schema, local fixes and offline re-parsing
+import argparse
+import json
+import os
+import re
+import threading
+from collections import Counter
+from datetime import datetime
+
+from .prompts import drivers_schema, packed_drivers_schema
+
+_TYPES = {
+    "object": dict,
+    "array": list,
+    "string": str,
+    "integer": int,
+    "number": (int, float),
+    "boolean": bool,
+}
+
+
+def compile_schema(schema):
+    """
+    Turns a JSON schema into a function value -> list of error messages
+    (empty when valid). Covers the keywords our schemas use (type,
+    properties, required, items, enum); the schema is walked once here,
+    not on every call.
+    """
+    expected = schema.get('type')
+    python_type = _TYPES.get(expected)
+    enum = schema.get('enum')
+    allowed = set(enum) if enum is not None else None
+    properties = {name: compile_schema(sub) for name, sub in schema.get('properties', {}).items()}
+    required = list(schema.get('required', []))
+    items = compile_schema(schema['items']) if 'items' in schema else None
+
+    def validate(value, path='$'):
+        if python_type is not None:
+            # bool is an int subclass, but not a JSON number
+            if not isinstance(value, python_type) or (isinstance(value, bool) and expected != 'boolean'):
+                return [f"{path}: expected {expected}, got {type(value).__name__}"]
+        errors = []
+        if allowed is not None and value not in allowed:
+            errors.append(f"{path}: {value!r} is not one of {', '.join(map(str, enum))}")
+        if isinstance(value, dict):
+            errors.extend(f"{path}: missing required field {name!r}" for name in required if name not in value)
+            for name, check in properties.items():
+                if name in value:
+                    errors.extend(check(value[name], f"{path}.{name}"))
+        if items is not None and isinstance(value, list):
+            for i, item in enumerate(value):
+                errors.extend(items(item, f"{path}[{i}]"))
+        return errors
+
+    return validate
+
+
+def _enum_form(value):
+    return re.sub(r'[\s\-]+', '_', value.strip().lower())
+
+
+class ResponseValidator:
+    """
+    Checks parsed function-call arguments episode by episode, so one bad
+    episode doesn't cost the others. Before checking, cheap local fixes
+    are applied: enum values that differ only in case, spaces or hyphens
+    ("Burned out" for burned_out), a lone string where a list of strings
+    is expected, and null lists.
+    """
+
+    def __init__(self, schema=drivers_schema):
+        self.schema = schema
+        self.episode_schema = schema['properties']['episodes']['items']
+        self._check = compile_schema(self.episode_schema)
+        properties = self.episode_schema['properties']
+        self._enums = {name: {_enum_form(v): v for v in prop['enum']}
+                       for name, prop in properties.items() if 'enum' in prop}
+        self._lists = [name for name, prop in properties.items() if prop.get('type') == 'array']
+
+    def coerce(self, episode):
+        """
+        Applies the local fixes to an episode in place; returns how many
+        fields were changed.
+        """
+        fixed = 0
+        for name, values in self._enums.items():
+            value = episode.get(name)
+            if isinstance(value, str) and value not in values.values() and _enum_form(value) in values:
+                episode[name] = values[_enum_form(value)]
+                fixed += 1
+        for name in self._lists:
+            value = episode.get(name, [])
+            if value is None:
+                episode[name] = []
+                fixed += 1
+            elif isinstance(value, str):
+                episode[name] = [value]
+                fixed += 1
+        return fixed
+
+    def episodes_of(self, parsed):
+        """
+        The episode list of a response, or None when the response as a whole
+        is unusable. A bare list of episodes or a single episode object are
+        accepted too.
+        """
+        if isinstance(parsed, dict) and isinstance(parsed.get('episodes'), list):
+            return parsed['episodes']
+        if isinstance(parsed, list):
+            return parsed
+        if isinstance(parsed, dict) and 'decision_context' in parsed:
+            return [parsed]
+        return None
+
+    def check(self, parsed):
+        """
+        Splits a response into (valid episodes, [(invalid episode, errors)],
+        locally fixed field count). Raises InvalidResponse when there is no
+        episode list at all.
+        """
+        episodes = self.episodes_of(parsed)
+        if episodes is None:
+            raise InvalidResponse(json.dumps(parsed), ["$: expected an object with an episodes list"])
+        valid, invalid, fixed = [], [], 0
+        for episode in episodes:
+            if not isinstance(episode, dict):
+                invalid.append((episode, [f"$: expected object, got {type(episode).__name__}"]))
+                continue
+            fixed += self.coerce(episode)
+            errors = self._check(episode)
+            if errors:
+                invalid.append((episode, errors))
+            else:
+                valid.append(episode)
+        return valid, invalid, fixed
+
+    def check_episode(self, episode):
+        """Errors of a single (repaired) episode, after the local fixes."""
+        if not isinstance(episode, dict):
+            return [f"$: expected object, got {type(episode).__name__}"]
+        self.coerce(episode)
+        return self._check(episode)
+
+
+class InvalidResponse(ValueError):
+    """
+    A response that can't be used at all: arguments that aren't JSON, or
+    JSON without an episode list. Carries the raw text for a repair request.
+    """
+
+    def __init__(self, text, errors):
+        super().__init__('; '.join(errors))
+        self.text = text
+        self.errors = errors
+
+
+def parse_arguments(arguments):
+    """
+    json.loads of function-call arguments, raising InvalidResponse (with
+    the raw text) when they don't parse.
+    """
+    try:
+        return json.loads(arguments)
+    except (TypeError, json.JSONDecodeError) as e:
+        raise InvalidResponse(arguments if isinstance(arguments, str) else repr(arguments),
+                              [f"$: not valid JSON ({e})"])
+
+
+class ResponseLog:
+    """
+    Append-only JSONL log of raw function-call arguments as received, with
+    the post_ids they answer, so responses can be re-parsed offline (see
+    reparse_responses) after a validator or schema change without paying
+    for them again. Thread safe.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def write(self, kind, post_ids, arguments):
+        line = json.dumps({"time": datetime.now().isoformat(timespec='seconds'), "kind": kind,
+                           "post_ids": [str(post_id) for post_id in post_ids], "arguments": arguments})
+        with self._lock:
+            self._file.write(line + '\n')
+            self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+def responses_path(output_path):
+    return os.path.splitext(output_path)[0] + '.responses.jsonl'
+
+
+def _error_kind(error):
+    """An error message with positions and values stripped, for tallying."""
+    error = re.sub(r": .*? is not one of", ": value is not one of", error)
+    return re.sub(r"\[\d+\]", "[]", re.sub(r": line \d+ column \d+ \(char \d+\)", "", error))
+
+
+def reparse_responses(path, output_path=None):
+    """
+    Re-validates every response in a ResponseLog file offline and prints
+    how many episodes are valid, fixable locally or invalid, with the most
+    common errors. Single responses belong to their one post_id, packed ones
+    to post_ids[row_index]. With output_path, the valid episodes are
+    written there (with source_id) as JSONL.
+    Returns (valid episodes, invalid count).
+    """
+    validators = {"single": ResponseValidator(drivers_schema), "packed": ResponseValidator(packed_drivers_schema)}
+    responses = unusable = fixed = 0
+    invalid = 0
+    errors = Counter()
+    recovered = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            record = json.loads(line)
+            validator = validators.get(record['kind'], validators['single'])
+            responses += 1
+            try:
+                valid, bad, n_fixed = validator.check(parse_arguments(record['arguments']))
+            except InvalidResponse as e:
+                unusable += 1
+                errors.update(_error_kind(error) for error in e.errors)
+                continue
+            fixed += n_fixed
+            invalid += len(bad)
+            for _, episode_errors in bad:
+                errors.update(_error_kind(error) for error in episode_errors)
+            for episode in valid:
+                if record['kind'] == 'packed':
+                    row_index = episode.pop('row_index', None)
+                    if not isinstance(row_index, int) or not 0 <= row_index < len(record['post_ids']):
+                        continue
+                    episode['source_id'] = record['post_ids'][row_index]
+                else:
+                    episode['source_id'] = record['post_ids'][0] if record['post_ids'] else None
+                recovered.append(episode)
+
+    print(f"🔎 {responses:,} responses: {len(recovered):,} valid episodes ({fixed:,} fields fixed locally), "
+          f"{invalid:,} invalid episodes, {unusable:,} unusable responses")
+    for error, count in errors.most_common(10):
+        print(f"  {count:>6,}  {error}")
+    if output_path:
+        with open(output_path, 'w', encoding='utf-8') as f:
+            for episode in recovered:
+                f.write(json.dumps(episode) + '\n')
+        print(f"Valid episodes written to {output_path}")
+    return recovered, invalid
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Re-validate logged model responses offline")
+    parser.add_argument('path', nargs='?', default='weekend_activity_analysis.responses.jsonl',
+                        help="Response log (by path or name in data/)")
+    parser.add_argument('--output', default=None, help="Write the valid episodes to this JSONL file")
+    args = parser.parse_args()
+
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    reparse_responses(os.path.join(script_dir, 'data', args.path), args.output)
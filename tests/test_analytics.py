@@ -0,0 +1,29 @@
+import pandas as pd
+
+from chicago_weekend_activities.analytics import Episodes
+
+
+def _write_analysis(path):
+    pd.DataFrame({
+        'source_id': ['a', 'b', 'c', 'd', 'e'],
+        'subreddit': ['chicago', 'chicago', 'AskChicago', 'chicago', 'AskChicago'],
+        'switch_type': ['first_time', 'SomethingNew', 'SomethingNew', None, 'routine_break'],
+        'emotional_tone': ['excited', 'wistful', 'excited', 'wistful', None],
+        'decision_factors': ["['cost']", "['weather', 'cost']", '[]', "['friends']", "['cost']"],
+    }).to_csv(path, index=False)
+
+
+def test_enum_counts_match_plain_group_by(tmp_path):
+    path = tmp_path / 'analysis.csv'
+    _write_analysis(path)
+    raw = pd.read_csv(path)
+    loaded = Episodes.load(str(path))
+    untyped = Episodes(raw.assign(decision_factors=[['cost'], ['weather', 'cost'], [], ['friends'], ['cost']]))
+
+    for episodes in (loaded, untyped):
+        for column in ('switch_type', 'emotional_tone'):
+            expected = raw[column].value_counts()
+            assert episodes.counts(column).sort_index().to_dict() == expected.sort_index().to_dict()
+        expected = raw.groupby(['switch_type', 'subreddit']).size().unstack(fill_value=0)
+        table = episodes.counts('switch_type', by='subreddit')
+        assert table.loc[expected.index, expected.columns].to_numpy().tolist() == expected.to_numpy().tolist()
@@ -0,0 +1,29 @@
+import pandas as pd
+
+from chicago_weekend_activities.deduplicate import deduplicate_reddit_data
+
+COLUMNS = ['post_id', 'is_comment', 'subreddit', 'search_term', 'search_terms', 'created_utc', 'text']
+
+
+def test_returns_unique_row_count(tmp_path):
+    input_path, output_path = str(tmp_path / 'raw.csv'), str(tmp_path / 'unique.csv')
+    pd.DataFrame([
+        ['p1', False, 'chicago', 'brunch', 'brunch', '2024-05-04 10:00:00', 'a'],
+        ['p1', False, 'chicago', 'museum', 'museum', '2024-05-04 10:00:00', 'a'],
+        ['c1', True, 'chicago', 'brunch', 'brunch', '2024-05-05 10:00:00', 'b'],
+    ], columns=COLUMNS).to_csv(input_path, index=False)
+
+    assert deduplicate_reddit_data(input_path, output_path) == 2
+    assert len(pd.read_csv(output_path)) == 2
+
+
+def test_empty_input_returns_zero(tmp_path):
+    input_path, output_path = str(tmp_path / 'raw.csv'), str(tmp_path / 'unique.csv')
+    pd.DataFrame(columns=COLUMNS).to_csv(input_path, index=False)
+
+    assert deduplicate_reddit_data(input_path, output_path) == 0
+    assert list(pd.read_csv(output_path).columns) == COLUMNS
+
+
+def test_missing_input_returns_none(tmp_path):
+    assert deduplicate_reddit_data(str(tmp_path / 'missing.csv'), str(tmp_path / 'unique.csv')) is None
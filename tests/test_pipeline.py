@@ -0,0 +1,38 @@
+import os
+import shutil
+
+import pytest
+
+from chicago_weekend_activities.fakes import FakeOpenAIClient
+from chicago_weekend_activities.pipeline import StageIncomplete, default_stages, load_state, run_pipeline
+
+TEST_DATA = os.path.join(os.path.dirname(__file__), '..', 'chicago_weekend_activities', 'data', 'test_data.csv')
+
+
+def _run(data_dir, client):
+    options = {'client': client, 'use_cache': False, 'max_retries': 0, 'thread_context': False}
+    stages = [stage for stage in default_stages(data_dir=data_dir, analyze_options=options)
+              if stage.name in ('dedup', 'analyze')]
+    for stage in stages:
+        stage.deps = tuple(dep for dep in stage.deps if dep != 'scrape')
+    state_path = os.path.join(data_dir, 'pipeline_state.json')
+    return run_pipeline(stages, state_path=state_path), load_state(state_path)
+
+
+def test_analyze_with_failed_rows_is_rerun(tmp_path):
+    data_dir = str(tmp_path)
+    shutil.copy(TEST_DATA, os.path.join(data_dir, 'reddit_data.csv'))
+
+    with pytest.raises(StageIncomplete):
+        _run(data_dir, FakeOpenAIClient(error_rate=0.5))
+    state = load_state(os.path.join(data_dir, 'pipeline_state.json'))
+    assert state['stages']['analyze']['incomplete']
+    assert state['stages']['analyze']['outputs'] is None
+
+    report, state = _run(data_dir, FakeOpenAIClient())
+    analyze = next(entry for entry in report if entry['stage'] == 'analyze')
+    assert (analyze['action'], analyze['reason'], analyze['mode']) == ('run', 'incomplete', 'delta')
+    assert 'incomplete' not in state['stages']['analyze']
+
+    report, _ = _run(data_dir, FakeOpenAIClient())
+    assert [entry['action'] for entry in report] == ['skip', 'skip']
@@ -0,0 +1,40 @@
+import time
+
+from chicago_weekend_activities.fakes import FakeReddit
+from chicago_weekend_activities.scrape import SEARCH_TERM_SEPARATOR, scrape_reddit, watermark_key
+
+
+class FlakyReddit(FakeReddit):
+    """FakeReddit whose comment trees fail for the submission ids in `failing`."""
+
+    def __init__(self, failing=(), **kwargs):
+        super().__init__(**kwargs)
+        self.failing = set(failing)
+
+    def submission(self, id):
+        if id in self.failing:
+            raise ConnectionError(f"comments for {id} unavailable")
+        return super().submission(id)
+
+
+def _scrape(reddit, watermarks):
+    return scrape_reddit(reddit_factory=lambda: reddit, max_workers=2, requests_per_minute=None,
+                         watermarks=watermarks)
+
+
+def test_watermark_stops_short_of_failed_comment_fetch():
+    options = dict(pool_size=40, submissions_per_term=10, now=time.time())
+    reddit = FakeReddit(**options)
+    posts = _scrape(reddit, {}).query('not is_comment').sort_values('created_utc')
+    failed = posts.iloc[len(posts) // 2]
+    failed_created = reddit.submission(failed['post_id']).created_utc
+
+    watermarks = {}
+    _scrape(FlakyReddit(failing=[failed['post_id']], **options), watermarks)
+    for term in failed['search_terms'].split(SEARCH_TERM_SEPARATOR):
+        assert watermarks.get(watermark_key(failed['subreddit'], term), 0) < failed_created
+    assert watermarks
+
+    # The next run fetches the failed submission's comments again
+    retried = _scrape(FakeReddit(**options), watermarks)
+    assert retried['parent_url'].str.endswith(f"/comments/{failed['post_id']}").any()
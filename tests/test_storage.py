@@ -0,0 +1,17 @@
+import pandas as pd
+
+from chicago_weekend_activities.storage import convert_csv_to_parquet, read_table
+
+
+def test_out_of_enum_values_survive_typed_reads(tmp_path):
+    csv_path = tmp_path / 'analysis.csv'
+    pd.DataFrame({
+        'source_id': ['a', 'b', 'c'],
+        'switch_type': ['first_time', 'SomethingNew', None],
+    }).to_csv(csv_path, index=False)
+    parquet_path = convert_csv_to_parquet(str(csv_path), str(tmp_path / 'analysis.parquet'))
+
+    for path in (str(csv_path), parquet_path):
+        df = read_table(path, typed=True)
+        assert list(df['switch_type'].astype(object).fillna('')) == ['first_time', 'SomethingNew', '']
+        assert list(df['switch_type'].cat.categories[-1:]) == ['SomethingNew']